@@ -0,0 +1,59 @@
+import time
+import weakref
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+_MISSING = object()
+# name -> TTLCache, so invalidations from other workers can be routed by name.
+_registry = weakref.WeakValueDictionary()
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries expire after `ttl` seconds.
+    Hits and misses are reported to metrics under the cache's `name`.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=60.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] < time.monotonic():
+                del self._data[key]
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._data.move_to_end(key)
+        metrics.cache_lookup(self.name, entry is not _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def get_cache(name):
+    """Returns the live cache registered under `name`, or None."""
+    return _registry.get(name)
@@ -0,0 +1,180 @@
+"""
+Compact, versioned encoding for large JSON payloads kept in the database
+(chat history, processed_data, extracted table cells).
+
+A payload is a 2-byte header (format version, codec id) followed by the
+body. Codecs:
+
+- json:          plain UTF-8 JSON (payloads under COMPRESS_MIN_BYTES)
+- json-zlib:     JSON + zlib (standard library only)
+- json-zstd:     JSON + Zstandard (needs `zstandard`)
+- msgpack-zstd:  MessagePack + Zstandard (needs `msgpack` and `zstandard`)
+
+STORAGE_CODEC=auto picks the best available one. Decoding dispatches on the
+codec id, so rows written with any codec stay readable as long as its
+libraries are installed.
+
+`packed` exposes such a column as a model attribute that encodes on
+assignment and decodes once, on first access.
+"""
+
+import os
+import json
+import zlib
+import threading
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+FORMAT_VERSION = 1
+JSON, JSON_ZLIB, JSON_ZSTD, MSGPACK_ZSTD = 0, 1, 2, 3
+CODEC_NAMES = {
+    "json": JSON,
+    "json-zlib": JSON_ZLIB,
+    "json-zstd": JSON_ZSTD,
+    "msgpack-zstd": MSGPACK_ZSTD,
+}
+
+STORAGE_CODEC = os.getenv("STORAGE_CODEC", "auto").lower()
+# Smaller payloads are stored uncompressed; compression would not pay off.
+COMPRESS_MIN_BYTES = int(os.getenv("STORAGE_COMPRESS_MIN_BYTES", "512"))
+ZSTD_LEVEL = int(os.getenv("STORAGE_ZSTD_LEVEL", "3"))
+ZLIB_LEVEL = 6
+
+
+def available_codecs():
+    codecs = ["json", "json-zlib"]
+    if zstandard is not None:
+        codecs.append("json-zstd")
+        if msgpack is not None:
+            codecs.append("msgpack-zstd")
+    return codecs
+
+
+def default_codec(name=STORAGE_CODEC):
+    if name == "auto":
+        return available_codecs()[-1]
+    if name not in available_codecs():
+        raise ValueError(
+            f"Storage codec {name!r} is unavailable (have: {', '.join(available_codecs())})"
+        )
+    return name
+
+
+# zstd (de)compressor objects are not thread-safe, so each thread gets its own.
+_local = threading.local()
+
+
+def _zstd_compressor():
+    if not hasattr(_local, "compressor"):
+        _local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return _local.compressor
+
+
+def _zstd_decompressor():
+    if not hasattr(_local, "decompressor"):
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.decompressor
+
+
+def _dump_json(value):
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the stdlib handles them
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _load_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))  # the stdlib does not accept memoryviews
+
+
+def encode(value, codec=None):
+    """Serialises a JSON-compatible value into a self-describing payload."""
+    codec_id = CODEC_NAMES[codec or default_codec()]
+    if codec_id == MSGPACK_ZSTD:
+        body = _zstd_compressor().compress(msgpack.packb(value, use_bin_type=True))
+    else:
+        body = _dump_json(value)
+        if len(body) < COMPRESS_MIN_BYTES:
+            codec_id = JSON
+        elif codec_id == JSON_ZSTD:
+            body = _zstd_compressor().compress(body)
+        elif codec_id == JSON_ZLIB:
+            body = zlib.compress(body, ZLIB_LEVEL)
+    return bytes((FORMAT_VERSION, codec_id)) + body
+
+
+def decode(payload):
+    """Inverse of `encode`."""
+    payload = memoryview(payload)
+    if len(payload) < 2 or payload[0] != FORMAT_VERSION:
+        raise ValueError("Unsupported payload format")
+    codec_id, body = payload[1], payload[2:]
+    if codec_id == JSON:
+        return _load_json(body)
+    if codec_id == JSON_ZLIB:
+        return _load_json(zlib.decompress(body))
+    if zstandard is None:
+        raise ValueError("Payload needs the zstandard package")
+    data = _zstd_decompressor().decompress(body)
+    if codec_id == JSON_ZSTD:
+        return _load_json(data)
+    if codec_id == MSGPACK_ZSTD:
+        if msgpack is None:
+            raise ValueError("Payload needs the msgpack package")
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    raise ValueError(f"Unknown payload codec {codec_id}")
+
+
+class packed:
+    """
+    Model attribute stored encoded in the mapped attribute `column`.
+    Assigning encodes; reading decodes on first access and caches the value
+    on the instance. Rows that still hold plain JSON in `legacy` are read
+    from there until they are migrated.
+    """
+
+    def __init__(self, column, legacy=None):
+        self.column = column
+        self.legacy = legacy
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.cache_key = f"_{name}_decoded"
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        if self.cache_key in obj.__dict__:
+            return obj.__dict__[self.cache_key]
+        raw = getattr(obj, self.column)
+        if raw is not None:
+            value = decode(raw)
+        elif self.legacy is not None:
+            value = getattr(obj, self.legacy)
+        else:
+            value = None
+        obj.__dict__[self.cache_key] = value
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.column, None if value is None else encode(value))
+        if self.legacy is not None:
+            setattr(obj, self.legacy, None)
+        obj.__dict__[self.cache_key] = value
@@ -0,0 +1,130 @@
+"""
+Prompt context assembly for RAG queries.
+
+Retrieved chunks are ordered by relevance, near-duplicates are dropped, and
+whatever does not fit the token budget is trimmed down to the sentences that
+best match the query, so one huge section can no longer blow up the prompt.
+"""
+
+import os
+import re
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Chunks overlapping a better-ranked chunk by at least this much are dropped.
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Don't bother adding a trimmed chunk smaller than this.
+MIN_CHUNK_TOKENS = 40
+
+CHARS_PER_TOKEN = 4
+SEPARATOR = "\n\n"
+ELLIPSIS = " ... "
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or "
+    "that the this to was were what when where which who why will with about "
+    "does do did can could should would document say says".split()
+)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def tokenize(text):
+    return [w.lower() for w in _WORD_RE.findall(text)]
+
+
+def query_terms(text):
+    return {w for w in tokenize(text) if w not in _STOPWORDS}
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def _shingles(text, size=5):
+    words = tokenize(text)
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def _containment(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def trim_to_budget(text, terms, max_tokens):
+    """
+    Extractive trim: keeps the sentences sharing the most terms with the
+    query (earlier sentences win ties), in their original order.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = split_sentences(text)
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(terms & query_terms(sentences[i])), i),
+    )
+    chosen, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    if not chosen:
+        # A single sentence longer than the budget: hard cut.
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    return ELLIPSIS.join(sentences[i] for i in sorted(chosen))
+
+
+def assemble_context(
+    scored_docs,
+    query,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+):
+    """
+    Builds the context string from (Document, relevance) pairs, higher
+    relevance first. Returns (context_text, used_docs, stats).
+    """
+    ordered = sorted(scored_docs, key=lambda pair: pair[1], reverse=True)
+    terms = query_terms(query)
+
+    kept, kept_shingles, duplicates = [], [], 0
+    for doc, score in ordered:
+        shingles = _shingles(doc.page_content)
+        if any(_containment(shingles, s) >= dedup_threshold for s in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append((doc, score))
+        kept_shingles.append(shingles)
+
+    parts, used_docs, trimmed = [], [], 0
+    remaining = token_budget
+    for doc, score in kept:
+        if remaining < MIN_CHUNK_TOKENS:
+            break
+        text = trim_to_budget(doc.page_content, terms, remaining)
+        if text != doc.page_content:
+            trimmed += 1
+        parts.append(text)
+        used_docs.append(doc)
+        remaining -= estimate_tokens(text) + estimate_tokens(SEPARATOR)
+
+    context = SEPARATOR.join(parts)
+    stats = {
+        "candidates": len(ordered),
+        "duplicates_dropped": duplicates,
+        "chunks_used": len(used_docs),
+        "chunks_trimmed": trimmed,
+        "retrieved_tokens": sum(estimate_tokens(d.page_content) for d, _ in ordered),
+        "context_tokens": estimate_tokens(context),
+        "token_budget": token_budget,
+    }
+    return context, used_docs, stats
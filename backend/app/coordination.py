@@ -0,0 +1,215 @@
+"""
+Coordination between API workers sharing one database and storage.
+
+- `lock(name)`: an exclusive, cross-process lock. With Postgres it is a
+  session advisory lock, so it holds across nodes. Otherwise it is an fcntl
+  lock file under LOCK_DIR, which only holds across processes on one host.
+  An upload takes `ingest_lock(doc_sha256)`, so the same document is never
+  ingested twice at once, and `collection_lock(collection)` while it writes
+  the vector collection. Maintenance takes the latter before dropping one.
+  Uploads wait at most INGEST_LOCK_TIMEOUT_SECONDS and are then rejected,
+  rather than parking a worker thread (and, with Postgres, a pooled
+  connection) behind another ingest.
+- Cache invalidation: `publish_invalidation(cache, key)` drops the key
+  locally and records it in the cache_invalidations table. Every worker
+  polls that table every CACHE_SYNC_INTERVAL_SECONDS and drops the same key
+  from its own cache with that name.
+"""
+
+import os
+import time
+import fcntl
+import hashlib
+import datetime
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+from sqlalchemy import func, text
+
+from . import logic, metrics
+from .cache import get_cache
+from .logic import CacheInvalidation
+
+LOCK_DIR = os.getenv("LOCK_DIR", os.path.join("db", "locks"))
+INGEST_LOCK_TIMEOUT_SECONDS = float(os.getenv("INGEST_LOCK_TIMEOUT_SECONDS", "5"))
+CACHE_SYNC_INTERVAL_SECONDS = float(os.getenv("CACHE_SYNC_INTERVAL_SECONDS", "2"))
+# Invalidation rows older than this are deleted by the poller.
+CACHE_SYNC_RETENTION_SECONDS = 3600
+_LOCK_POLL_SECONDS = 0.05
+
+LOCK_WAIT_SECONDS = metrics.Histogram(
+    "pdfretriever_lock_wait_seconds",
+    "Time spent waiting for a cross-worker lock.",
+    ["kind"],
+)
+
+
+class LockTimeout(Exception):
+    """Raised when a lock could not be acquired in time."""
+
+
+def _digest(name):
+    return hashlib.sha256(name.encode("utf-8")).digest()
+
+
+@contextmanager
+def _advisory_lock(engine, name, timeout):
+    key = int.from_bytes(_digest(name)[:8], "big", signed=True)
+    conn = engine.connect()
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": key}
+            ).scalar()
+            conn.commit()
+            if acquired:
+                break
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"Lock {name!r} is busy")
+            time.sleep(_LOCK_POLL_SECONDS)
+        yield
+    finally:
+        try:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                conn.commit()
+        except Exception:
+            # Never hand a connection that may still hold the lock back to the pool.
+            conn.invalidate()
+        conn.close()
+
+
+@contextmanager
+def _file_lock(name, timeout):
+    path = Path(LOCK_DIR) / f"{_digest(name).hex()[:32]}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as f:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Lock {name!r} is busy")
+                time.sleep(_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def lock(name, timeout=INGEST_LOCK_TIMEOUT_SECONDS):
+    """
+    Holds an exclusive lock on `name` across workers. Blocks for up to
+    `timeout` seconds (0: try once), then raises LockTimeout.
+    """
+    engine = logic.get_db_engine()
+    kind = "advisory" if engine.dialect.name == "postgresql" else "file"
+    start = time.perf_counter()
+    cm = _advisory_lock(engine, name, timeout) if kind == "advisory" else _file_lock(name, timeout)
+    with cm:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, kind=kind)
+        yield
+
+
+def ingest_lock(doc_sha256, timeout=INGEST_LOCK_TIMEOUT_SECONDS):
+    """Held while the document with this content hash is being ingested."""
+    return lock(f"ingest:{doc_sha256}", timeout)
+
+
+def collection_lock(collection_name, timeout=INGEST_LOCK_TIMEOUT_SECONDS):
+    """Held while a vector collection is written to or dropped."""
+    return lock(f"collection:{collection_name}", timeout)
+
+
+# --- Cache invalidation ---
+def publish_invalidation(cache_name, key):
+    """Drops `key` from the named cache here and, via the DB, in every worker."""
+    cache = get_cache(cache_name)
+    if cache is not None:
+        cache.invalidate(key)
+    session = logic.get_db_session()
+    try:
+        session.add(CacheInvalidation(cache=cache_name, key=str(key)))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Could not publish cache invalidation: {e}")
+    finally:
+        session.close()
+
+
+_last_seen_id = None
+_sync_stop = threading.Event()
+_sync_thread = None
+
+
+def poll_invalidations():
+    """Applies invalidations published since the last poll. Returns how many."""
+    global _last_seen_id
+    session = logic.get_db_session()
+    try:
+        if _last_seen_id is None:
+            # Caches start empty, so older events are irrelevant.
+            _last_seen_id = session.query(func.max(CacheInvalidation.id)).scalar() or 0
+            return 0
+        rows = (
+            session.query(CacheInvalidation.id, CacheInvalidation.cache, CacheInvalidation.key)
+            .filter(CacheInvalidation.id > _last_seen_id)
+            .order_by(CacheInvalidation.id)
+            .all()
+        )
+        for row_id, cache_name, key in rows:
+            cache = get_cache(cache_name)
+            if cache is not None:
+                cache.invalidate(key)
+            _last_seen_id = row_id
+        return len(rows)
+    finally:
+        session.close()
+
+
+def prune_invalidations(max_age=CACHE_SYNC_RETENTION_SECONDS):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age)
+    session = logic.get_db_session()
+    try:
+        session.query(CacheInvalidation).filter(CacheInvalidation.created_at < cutoff).delete(
+            synchronize_session=False
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def start_cache_sync(interval=CACHE_SYNC_INTERVAL_SECONDS):
+    """Starts the invalidation poller (no-op if interval <= 0)."""
+    global _sync_thread
+    if interval <= 0 or (_sync_thread is not None and _sync_thread.is_alive()):
+        return _sync_thread
+
+    def loop():
+        polls = 0
+        while True:
+            try:
+                poll_invalidations()
+                polls += 1
+                if polls % max(int(600 / interval), 1) == 0:
+                    prune_invalidations()
+            except Exception as e:
+                print(f"Cache invalidation poll failed: {e}")
+            if _sync_stop.wait(interval):
+                break
+
+    _sync_stop.clear()
+    _sync_thread = threading.Thread(target=loop, name="cache-sync", daemon=True)
+    _sync_thread.start()
+    return _sync_thread
+
+
+def stop_cache_sync():
+    _sync_stop.set()
@@ -0,0 +1,167 @@
+"""
+Incremental parser for JSON objects of the form {"key": [item, ...], ...}.
+
+Feed it text as it streams in; it returns (key, item) for every array item
+the moment the item's closing bracket (or the following comma) arrives.
+Each item is decoded once with `json.loads`. Non-array values are collected
+in `values`. If the stream is cut off, every item completed before the cut
+has already been returned and `complete` stays False.
+
+Text before the first "{" (e.g. a ```json fence) is skipped.
+"""
+
+import re
+import json
+
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class ArrayStreamParser:
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._expect_key = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._item_start = None
+        self._item_done = False
+        self.values = {}
+        self.counts = {}
+        self.errors = 0
+        self.complete = False
+
+    @property
+    def truncated(self):
+        return not self.complete
+
+    def _in_array(self):
+        return len(self._stack) == 2 and self._stack[1] == "["
+
+    def _emit_item(self, end, events):
+        text = self._buf[self._item_start : end]
+        if text.strip():
+            try:
+                events.append((self._key, json.loads(text)))
+                self.counts[self._key] = self.counts.get(self._key, 0) + 1
+            except ValueError:
+                self.errors += 1
+
+    def _flush_value(self, end):
+        if self._value_start is not None and self._key is not None:
+            try:
+                self.values[self._key] = json.loads(self._buf[self._value_start : end])
+            except ValueError:
+                self.errors += 1
+        self._value_start = None
+
+    def feed(self, text):
+        """Consumes the next piece of text; returns the (key, item) pairs it completed."""
+        if self.complete or not text:
+            return []
+        self._buf += text
+        events = []
+        while True:
+            if not self._stack:
+                start = self._buf.find("{", self._pos)
+                if start < 0:
+                    self._pos = len(self._buf)
+                    break
+                self._stack.append("{")
+                self._expect_key = True
+                self._pos = start + 1
+                continue
+
+            if self._in_string:
+                m = _STRING_SPECIAL.search(self._buf, self._pos)
+                if m is None:
+                    self._pos = len(self._buf)
+                    break
+                if m.group() == "\\":
+                    if m.end() >= len(self._buf):
+                        self._pos = m.start()  # wait for the escaped character
+                        break
+                    self._pos = m.end() + 1
+                    continue
+                self._in_string = False
+                self._pos = m.end()
+                if self._key_start is not None:
+                    self._key = json.loads(self._buf[self._key_start : m.end()])
+                    self._key_start = None
+                continue
+
+            m = _STRUCTURAL.search(self._buf, self._pos)
+            if m is None:
+                self._pos = len(self._buf)
+                break
+            char, at = m.group(), m.start()
+            self._pos = m.end()
+            depth = len(self._stack)
+
+            if char == '"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = at
+            elif char == ":":
+                if depth == 1:
+                    self._expect_key = False
+                    self._value_start = at + 1
+            elif char == ",":
+                if depth == 1:
+                    self._flush_value(at)
+                    self._expect_key = True
+                elif self._in_array():
+                    if not self._item_done:
+                        self._emit_item(at, events)
+                    self._item_start = at + 1
+                    self._item_done = False
+            elif char in "{[":
+                if depth == 1 and char == "[":
+                    self._value_start = None
+                    self._item_start = at + 1
+                    self._item_done = False
+                self._stack.append(char)
+            else:  # "}" or "]"
+                if self._in_array() and char == "]":
+                    if not self._item_done:
+                        self._emit_item(at, events)
+                    self._item_start = None
+                self._stack.pop()
+                if self._in_array():
+                    # An object/array item just closed: emit it right away.
+                    self._emit_item(at + 1, events)
+                    self._item_done = True
+                elif not self._stack:
+                    self._flush_value(at)
+                    self.complete = True
+                    break
+
+        self._compact()
+        return events
+
+    def _compact(self):
+        """Drops text that no pending key, value or item still needs."""
+        item_start = None if self._item_done else self._item_start
+        starts = [
+            s for s in (self._key_start, self._value_start, item_start) if s is not None
+        ]
+        cut = min(starts + [self._pos])
+        if cut > 0:
+            self._buf = self._buf[cut:]
+            self._pos -= cut
+            if self._key_start is not None:
+                self._key_start -= cut
+            if self._value_start is not None:
+                self._value_start -= cut
+            if self._item_start is not None:
+                self._item_start -= cut
+
+
+def iter_items(chunks):
+    """Yields (key, item) pairs from an iterable of text chunks."""
+    parser = ArrayStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
@@ -1,17 +1,21 @@
 import os
+import time
 import uuid
+import base64
+import hashlib
 import json
 import sqlite3
-import pandas as pd
+import queue
+import threading
+import contextvars
+import functools
+import itertools
 from pathlib import Path
 from io import BytesIO
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
 
-import google.generativeai as genai
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
 import re
 import bcrypt
@@ -24,14 +28,30 @@ from sqlalchemy import (
     ForeignKey,
     DateTime,
     Text,
+    LargeBinary,
+    Index,
+    and_,
+    or_,
+    inspect,
+    null,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred, undefer
 from google.api_core import exceptions as google_exceptions
 import datetime
+from contextlib import ExitStack, contextmanager
+
+from . import metrics
+from .cache import TTLCache
+from .scheduler import get_scheduler, llm_slot, LLMQueueTimeout, INTERACTIVE, BACKGROUND
+from .context import assemble_context, estimate_tokens, CONTEXT_TOKEN_BUDGET
+from .rerank import rerank, RERANK_ENABLED, RERANK_CANDIDATES
+from . import codec, jsonstream, vectorstores
+from .pipeline import Pipeline
 
 # Global configuration
 GEMINI_MODEL_NAME = "gemini-2.0-flash"
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
 
 # --- PostgreSQL Setup ---
 Base = declarative_base()
@@ -50,11 +70,27 @@ class Chat(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String(255))
     file_name = Column(String(255))
-    history = Column(JSON)  # Stores chat history as JSONB
-    processed_data = Column(JSON)  # Stores parsed doc structure
-    pdf_b64 = Column(Text)  # Optional: Store B64 of PDF for restoration
+    # Chat history and parsed doc structure, compact-encoded (see codec.py).
+    # The plain JSON columns only hold rows written before that; they are
+    # moved over by migrate_payloads().
+    history_packed = deferred(Column(LargeBinary))
+    processed_data_packed = deferred(Column(LargeBinary))
+    history_legacy = deferred(Column("history", JSON(none_as_null=True)))
+    processed_data_legacy = deferred(Column("processed_data", JSON(none_as_null=True)))
+    history = codec.packed("history_packed", "history_legacy")
+    processed_data = codec.packed("processed_data_packed", "processed_data_legacy")
+    pdf_b64 = deferred(Column(Text))  # Base64 PDF of chats saved before doc_sha256
+    # The PDF in the content-addressed document store (see render.py).
+    doc_sha256 = Column(String(64))
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        # Serves the per-user, newest-first chat list (keyset pagination).
+        Index("ix_chats_user_timestamp", "user_id", "timestamp"),
+        # Lets maintenance find documents no chat refers to.
+        Index("ix_chats_doc_sha256", "doc_sha256"),
+    )
+
 
 class TableData(Base):
     __tablename__ = "extracted_tables"
@@ -63,10 +99,27 @@ class TableData(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     page = Column(Integer)
     caption = Column(String(512))
-    data_json = Column(JSON)
+    data_packed = deferred(Column(LargeBinary))
+    data_json_legacy = deferred(Column("data_json", JSON(none_as_null=True)))
+    data_json = codec.packed("data_packed", "data_json_legacy")
 
 
-def get_db_engine():
+class CacheInvalidation(Base):
+    """Cache keys dropped by one worker, replayed by the others (see coordination.py)."""
+
+    __tablename__ = "cache_invalidations"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache = Column(String(64), nullable=False)
+    key = Column(String(512), nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+_ENGINE = None
+_SESSION_FACTORY = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def _database_url():
     # Priority 1: DATABASE_URL (Neon, Railway, Supabase, etc.)
     database_url = os.getenv("DATABASE_URL")
     if database_url:
@@ -86,21 +139,139 @@ def get_db_engine():
         db_path.parent.mkdir(parents=True, exist_ok=True)
         db_url = f"sqlite:///{db_path}"
 
-    return create_engine(db_url)
+    return db_url
+
+
+def get_db_engine():
+    """Returns the process-wide engine so its connection pool is actually reused."""
+    global _ENGINE, _SESSION_FACTORY
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = create_engine(_database_url(), pool_pre_ping=True)
+                _SESSION_FACTORY = sessionmaker(bind=_ENGINE)
+    return _ENGINE
+
+
+def _add_missing_columns(engine):
+    """ALTERs in columns added to the models since their table was created."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}")
 
 
 def init_db():
     engine = get_db_engine()
     Base.metadata.create_all(engine)
+    # create_all skips tables that already exist, including their new
+    # columns and indexes.
+    _add_missing_columns(engine)
+    for index in Chat.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
+# Packed attribute -> (packed column, legacy JSON column), per model.
+_PAYLOADS = {
+    Chat: {
+        "history": (Chat.history_packed, Chat.history_legacy),
+        "processed_data": (Chat.processed_data_packed, Chat.processed_data_legacy),
+    },
+    TableData: {"data_json": (TableData.data_packed, TableData.data_json_legacy)},
+}
+PAYLOAD_MIGRATION_BATCH = int(os.getenv("PAYLOAD_MIGRATION_BATCH", "200"))
+
+
+def _undefer_payloads(model, names):
+    return [undefer(column) for name in names for column in _PAYLOADS[model][name]]
+
+
+def migrate_payloads(batch_size=PAYLOAD_MIGRATION_BATCH):
+    """
+    Re-encodes rows still stored as plain JSON into the packed columns, in
+    batches. Safe to run repeatedly or from several workers, and alongside
+    writes: each column is only updated while its legacy value is still set,
+    so a payload saved after the SELECT (which clears the legacy column) is
+    never overwritten with the stale one. Returns the number of rows migrated.
+    """
+    migrated = 0
+    for model, payloads in _PAYLOADS.items():
+        legacy = [legacy for _, legacy in payloads.values()]
+        last_id = ""
+        while True:
+            session = get_db_session()
+            try:
+                rows = (
+                    session.query(model.id, *legacy)
+                    .filter(model.id > last_id, or_(*[c.isnot(None) for c in legacy]))
+                    .order_by(model.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not rows:
+                    break
+                for row in rows:
+                    for (packed_col, legacy_col), value in zip(payloads.values(), row[1:]):
+                        if value is None:
+                            continue
+                        session.query(model).filter(
+                            model.id == row.id, legacy_col.isnot(None)
+                        ).update(
+                            {packed_col: codec.encode(value), legacy_col: null()},
+                            synchronize_session=False,
+                        )
+                session.commit()
+                migrated += len(rows)
+                last_id = rows[-1].id
+            finally:
+                session.close()
+    return migrated
 
 
 def get_db_session():
-    engine = get_db_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    get_db_engine()
+    return _SESSION_FACTORY()
+
+
+@metrics.register_collector
+def _collect_pool_metrics():
+    if _ENGINE is None:
+        return
+    pool = _ENGINE.pool
+    for state, attr in (
+        ("size", "size"),
+        ("checked_out", "checkedout"),
+        ("checked_in", "checkedin"),
+        ("overflow", "overflow"),
+    ):
+        fn = getattr(pool, attr, None)
+        if fn is not None:
+            metrics.DB_POOL.set(fn(), state=state)
 
 
 # --- Authentication Logic ---
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+
+# bcrypt is deliberately slow (~250 ms); run it on a small dedicated pool so
+# login bursts queue up here instead of stalling the event loop.
+BCRYPT_POOL = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+_user_cache = TTLCache("users", maxsize=4096, ttl=USER_CACHE_TTL_SECONDS)
+
+
+class AuthUser(NamedTuple):
+    """Detached snapshot of the fields request handlers need from a User."""
+
+    id: int
+    username: str
+
+
 def register_user(username, password):
     session = get_db_session()
     try:
@@ -113,6 +284,7 @@ def register_user(username, password):
         new_user = User(username=username, password_hash=hashed)
         session.add(new_user)
         session.commit()
+        invalidate_user(username)
         return True, "Registration successful"
     except Exception as e:
         session.rollback()
@@ -143,6 +315,25 @@ def verify_user_by_username(username):
         session.close()
 
 
+def get_user_cached(username):
+    """Resolves a username to an AuthUser, hitting the DB at most once per TTL."""
+    user = _user_cache.get(username)
+    if user is None:
+        db_user = verify_user_by_username(username)
+        if db_user is None:
+            return None
+        user = AuthUser(db_user.id, db_user.username)
+        _user_cache.set(username, user)
+    return user
+
+
+def invalidate_user(username):
+    """Must be called whenever a user row is created, changed or removed."""
+    from . import coordination
+
+    coordination.publish_invalidation(_user_cache.name, username)
+
+
 def clean_filename(filename):
     """
     Strictly follows ChromaDB collection name rules:
@@ -165,9 +356,29 @@ def clean_filename(filename):
     return cleaned[:512]
 
 
-def get_gemini_client(api_key):
+# The Google SDKs, pdfplumber and pandas are slow to import, so they are
+# imported on first use (or by the warm-up thread) rather than at startup.
+def get_generative_model(model_name, api_key, **kwargs):
+    import google.generativeai as genai
+
     genai.configure(api_key=api_key)
-    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return genai.GenerativeModel(model_name, **kwargs)
+
+
+def get_chat_model(model_name, api_key):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key)
+
+
+def get_embedding_model(api_key):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL_NAME, google_api_key=api_key)
+
+
+def get_gemini_client(api_key):
+    return get_generative_model(GEMINI_MODEL_NAME, api_key)
 
 
 def _safe_json_load(text):
@@ -191,37 +402,104 @@ def _safe_json_load(text):
             raise ValueError("Could not parse JSON from Gemini response.")
 
 
-import pdfplumber
+def _pdf_source(uploaded_file):
+    """Prefer a file-backed path over materialising the upload in memory."""
+    path = getattr(uploaded_file, "path", None)
+    if path:
+        return path
+    return BytesIO(uploaded_file.getvalue())
 
 
-def intelligent_pdf_parse(uploaded_file, api_key, model_name=None):
+def _usage_from_gemini(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt": getattr(usage, "prompt_token_count", 0) or 0,
+        "completion": getattr(usage, "candidates_token_count", 0) or 0,
+    }
+
+
+def _usage_from_message(message):
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {
+        "prompt": usage.get("input_tokens", 0),
+        "completion": usage.get("output_tokens", 0),
+    }
+
+
+@contextmanager
+def _llm_call(model_name, operation):
     """
-    Optimized Hybrid Parse:
-    1. Extracts raw text locally (fast).
-    2. Uses Gemini only for complex structure (TOC, Tables, Media).
-    3. Handles OCR automatically if local extraction fails.
+    Records latency and outcome of one LLM/embedding call. Callers may set
+    `call["usage"]` to a {"prompt": n, "completion": n} dict.
     """
-    target_model = model_name or GEMINI_MODEL_NAME
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(
-        target_model, generation_config={"response_mime_type": "application/json"}
+    call = {"usage": None}
+    start = time.perf_counter()
+    try:
+        yield call
+    except google_exceptions.ResourceExhausted:
+        metrics.record_llm_call(
+            model_name, operation, time.perf_counter() - start, "quota_exceeded"
+        )
+        raise
+    except Exception:
+        metrics.record_llm_call(model_name, operation, time.perf_counter() - start, "error")
+        raise
+    metrics.record_llm_call(
+        model_name, operation, time.perf_counter() - start, usage=call["usage"]
     )
-    file_bytes = uploaded_file.getvalue()
 
-    # Fast local analysis with pdfplumber
-    local_pages = []
-    is_scanned = True
+
+# Pages read up front to decide between native text and OCR. A probe with
+# no text is not enough to call a PDF scanned (covers and front matter are
+# often image-only): the remaining pages are then read before deciding.
+SCAN_PROBE_PAGES = int(os.getenv("SCAN_PROBE_PAGES", "3"))
+_PARSE_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PARSE_WORKERS", "4")), thread_name_prefix="parse"
+)
+
+
+def _extract_pages(uploaded_file, start=0, stop=None):
+    """Local text of pages [start, stop) with pdfplumber (from disk when possible)."""
+    import pdfplumber
+
+    pages = []
+    with pdfplumber.open(_pdf_source(uploaded_file)) as pdf:
+        for page in pdf.pages[start:stop]:
+            pages.append({"page": page.page_number, "text": page.extract_text() or ""})
+    return pages
+
+
+def _has_text(pages):
+    return any(len(p["text"].strip()) > 50 for p in pages)
+
+
+def _extract_remaining_pages(uploaded_file, start):
     try:
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                local_pages.append({"page": page.page_number, "text": text})
-                if len(text.strip()) > 50:
-                    is_scanned = False
+        with metrics.span("parse.local_extract"):
+            return _extract_pages(uploaded_file, start)
     except Exception as e:
         print(f"Local parse failed: {e}")
+        return []
+
 
-    # Prompt Gemini for the "Intelligent" parts
+# Stream the structure response and hand each TOC entry, section, table and
+# media item downstream as soon as its JSON object is complete.
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# Top-level keys of the structure response -> item kinds yielded downstream.
+_STREAM_KINDS = {
+    "toc": "toc",
+    "section_definitions": "section",
+    "tables": "table",
+    "media": "media",
+}
+_PARSED_KEYS = {"toc": "toc", "section": "sections", "table": "tables", "media": "media"}
+_STREAM_DONE = object()
+
+
+def _structure_prompt(is_scanned):
     # If selectable, we don't ask for full content to save time.
     # If scanned, we MUST ask for content as part of OCR.
     schema = {
@@ -236,7 +514,7 @@ def intelligent_pdf_parse(uploaded_file, api_key, model_name=None):
     if is_scanned:
         schema["section_definitions"][0]["content"] = "string (full OCR text)"
 
-    prompt = f"""
+    return f"""
     Analyze this PDF. It is {'SCANNED (needs full OCR)' if is_scanned else 'SELECTABLE (native text available)'}.
     Provide a structured JSON output with this precisely: {json.dumps(schema)}
 
@@ -250,144 +528,452 @@ def intelligent_pdf_parse(uploaded_file, api_key, model_name=None):
     Return ONLY raw JSON.
     """
 
-    response = model.generate_content(
-        [prompt, {"mime_type": "application/pdf", "data": file_bytes}]
-    )
 
+def _chunk_text(chunk):
+    # The SDK raises on chunks that carry no text (e.g. a bare finish chunk).
     try:
-        gemini_data = _safe_json_load(response.text)
+        return chunk.text or ""
+    except (ValueError, AttributeError):
+        return ""
 
-        sections = []
-        for defn in gemini_data.get("section_definitions", []):
-            start = defn.get("page_start", 1)
-            end = defn.get("page_end", start)
 
-            if is_scanned:
-                # Use OCR text from Gemini
-                content = defn.get("content", "[OCR Failed]")
+def _stream_structure(model, contents, target_model, api_key, user_id, out, report):
+    """
+    Runs the Gemini structure call, putting (kind, item) on `out` as each
+    object completes and finally (_STREAM_DONE, error or None). It runs in
+    its own thread so a slow consumer never holds the LLM slot. The slot
+    only covers the request and its first chunk: the rest of the stream
+    can take minutes and would otherwise starve other background work.
+    """
+    parser = jsonstream.ArrayStreamParser()
+    texts = []
+
+    def emit(key, item):
+        if key in _STREAM_KINDS:
+            if report["items"] == 0:
+                report["first_item_seconds"] = round(time.perf_counter() - started, 4)
+            report["items"] += 1
+            out.put((_STREAM_KINDS[key], item))
+
+    started = time.perf_counter()
+    try:
+        with metrics.span("parse.llm_structure"), ExitStack() as slot:
+            slot.enter_context(llm_slot(api_key, user_id, BACKGROUND))
+            with _llm_call(target_model, "structure") as call:
+                response = model.generate_content(contents, stream=GEMINI_STREAMING)
+                chunks = iter(response if GEMINI_STREAMING else [response])
+                first = next(chunks, None)
+                slot.close()
+                try:
+                    for chunk in chunks if first is None else itertools.chain([first], chunks):
+                        text = _chunk_text(chunk)
+                        texts.append(text)
+                        for key, item in parser.feed(text):
+                            emit(key, item)
+                except Exception as e:
+                    if report["items"] == 0:
+                        raise
+                    # Keep the objects that arrived before the stream broke.
+                    print(f"Structure stream interrupted: {e}")
+                call["usage"] = _usage_from_gemini(response)
+
+        if not parser.complete:
+            if report["items"] == 0:
+                # Nothing recognisable streamed; fall back to the lenient loader.
+                with metrics.span("parse.json_decode"):
+                    gemini_data = _safe_json_load("".join(texts))
+                for key in _STREAM_KINDS:
+                    for item in gemini_data.get(key, []):
+                        emit(key, item)
             else:
-                # Use local text
-                content_parts = [
-                    p["text"] for p in local_pages if start <= p["page"] <= end
-                ]
-                content = "\n".join(content_parts)
+                report["truncated"] = True
+                print(
+                    f"Structure response was cut off; keeping the {report['items']} "
+                    "objects completed before the cut."
+                )
+        out.put((_STREAM_DONE, None))
+    except BaseException as e:
+        report["raw"] = "".join(texts)
+        out.put((_STREAM_DONE, e))
 
-            sections.append(
-                {
-                    "title": defn["title"],
-                    "content": content,
-                    "page_range": f"{start}-{end}",
-                }
-            )
 
-        return {
-            "toc": gemini_data.get("toc", []),
-            "sections": sections,
-            "tables": gemini_data.get("tables", []),
-            "media": gemini_data.get("media", []),
-        }
-    except google_exceptions.ResourceExhausted:
+def _section_from_definition(defn, local_pages, is_scanned):
+    start = defn.get("page_start", 1)
+    end = defn.get("page_end", start)
+
+    if is_scanned:
+        # Use OCR text from Gemini
+        content = defn.get("content", "[OCR Failed]")
+    else:
+        # Use local text
+        content_parts = [p["text"] for p in local_pages if start <= p["page"] <= end]
+        content = "\n".join(content_parts)
+
+    return {
+        "title": defn.get("title", ""),
+        "content": content,
+        "page_range": f"{start}-{end}",
+        "page_start": start,
+        "page_end": end,
+    }
+
+
+def parse_pdf_stream(uploaded_file, api_key, model_name=None, user_id=None, report=None):
+    """
+    Optimized Hybrid Parse, yielding ("toc" | "section" | "table" | "media", item):
+    1. Extracts raw text locally (fast), in parallel with step 2.
+    2. Streams Gemini's structure (TOC, sections, tables, media); each object
+       is yielded as soon as its JSON is complete.
+    3. Handles OCR automatically if local extraction fails.
+    If the response is cut off, the objects completed before the cut are
+    still yielded and report["truncated"] is set.
+    """
+    report = {} if report is None else report
+    report.update(items=0, truncated=False)
+    target_model = model_name or GEMINI_MODEL_NAME
+    model = get_generative_model(
+        target_model, api_key, generation_config={"response_mime_type": "application/json"}
+    )
+
+    # The prompt depends on whether the PDF has a text layer. When the first
+    # pages have text, the rest is extracted while Gemini works; otherwise
+    # the PDF is only treated as scanned if no page at all has text.
+    local_pages = []
+    is_scanned = True
+    probed_only = False
+    try:
+        with metrics.span("parse.scan_probe"):
+            local_pages = _extract_pages(uploaded_file, 0, SCAN_PROBE_PAGES)
+        probed_only = len(local_pages) == SCAN_PROBE_PAGES
+        if probed_only and not _has_text(local_pages):
+            with metrics.span("parse.local_extract"):
+                local_pages += _extract_pages(uploaded_file, len(local_pages))
+            probed_only = False
+        is_scanned = not _has_text(local_pages)
+    except Exception as e:
+        print(f"Local parse failed: {e}")
+
+    remaining_pages = None
+    if not is_scanned and probed_only:
+        remaining_pages = _PARSE_POOL.submit(
+            contextvars.copy_context().run,
+            _extract_remaining_pages,
+            uploaded_file,
+            len(local_pages),
+        )
+
+    # Inline PDF data must be sent as bytes; this is the only full copy we make.
+    contents = [
+        _structure_prompt(is_scanned),
+        {"mime_type": "application/pdf", "data": uploaded_file.getvalue()},
+    ]
+    events = queue.Queue()
+    threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_stream_structure, model, contents, target_model, api_key, user_id, events, report),
+        name="structure-stream",
+        daemon=True,
+    ).start()
+
+    # Sections need the locally extracted pages; until they are ready,
+    # section definitions wait here while tables and media keep flowing.
+    waiting = []
+    while True:
+        try:
+            kind, item = events.get(timeout=0.05 if waiting else None)
+        except queue.Empty:
+            kind, item = None, None
+        if remaining_pages is not None and (remaining_pages.done() or kind is _STREAM_DONE):
+            with metrics.span("parse.local_extract_wait"):
+                local_pages += remaining_pages.result()
+            remaining_pages = None
+        if remaining_pages is None:
+            for defn in waiting:
+                yield "section", _section_from_definition(defn, local_pages, is_scanned)
+            waiting = []
+        if kind is _STREAM_DONE:
+            if item is not None:
+                raise item
+            return
+        if kind == "section":
+            if remaining_pages is not None:
+                waiting.append(item)
+                continue
+            item = _section_from_definition(item, local_pages, is_scanned)
+        if kind is not None:
+            yield kind, item
+
+
+def _parse_error(error, report):
+    if isinstance(error, google_exceptions.ResourceExhausted):
         return {
             "error": "API Quota Exceeded (429). Please wait a minute before trying again or check your Gemini API plan."
         }
-    except Exception as e:
+    if isinstance(error, LLMQueueTimeout):
         return {
-            "error": f"Speed optimization failed: {str(e)}",
-            "raw": response.text if "response" in locals() else "",
+            "error": "Too many AI requests are queued for this API key. Please try again shortly."
         }
+    return {
+        "error": f"Speed optimization failed: {str(error)}",
+        "raw": report.get("raw", ""),
+    }
 
 
-def store_parsed_data(parsed_data, file_name, api_key, user_id=None, db_root="db"):
-    """
-    Stores text in Vector Store, Tables in SQLite, and metadata for UI.
-    """
-    base_path = Path(db_root)
-    base_path.mkdir(parents=True, exist_ok=True)
+def _parsed_result(parsed, report):
+    if report.get("truncated"):
+        parsed["truncated"] = True
+    return parsed
 
-    clean_name = clean_filename(file_name)
 
-    # 1. Store Text Sections and Media Descriptions in Chroma
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004", google_api_key=api_key
-    )
+def intelligent_pdf_parse(uploaded_file, api_key, model_name=None, user_id=None):
+    """Parses a PDF into {toc, sections, tables, media} (see parse_pdf_stream)."""
+    report = {}
+    parsed = {"toc": [], "sections": [], "tables": [], "media": []}
+    try:
+        for kind, item in parse_pdf_stream(uploaded_file, api_key, model_name, user_id, report):
+            parsed[_PARSED_KEYS[kind]].append(item)
+    except Exception as e:
+        return _parse_error(e, report)
+    return _parsed_result(parsed, report)
 
-    documents = []
-    # Add sections
-    for section in parsed_data.get("sections", []):
-        if section["content"].strip():
-            doc = Document(
-                page_content=section["content"],
-                metadata={
-                    "source": file_name,
-                    "type": "section",
-                    "title": section.get("title", ""),
-                    "page_range": str(section.get("page_range", "")),
-                },
-            )
-            documents.append(doc)
 
-    # Add media descriptions
+# Documents per embedding call / tables per commit in the ingest pipeline.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+TABLE_BATCH_SIZE = int(os.getenv("TABLE_BATCH_SIZE", "50"))
+
+
+def _parsed_items(parsed_data):
+    for section in parsed_data.get("sections", []):
+        yield "section", section
+    for table in parsed_data.get("tables", []):
+        yield "table", table
     for item in parsed_data.get("media", []):
-        doc = Document(
-            page_content=item["description"],
+        yield "media", item
+
+
+def _as_page(value):
+    try:
+        page = int(value)
+    except (TypeError, ValueError):
+        return None
+    return page if page >= 1 else None
+
+
+def page_span(item):
+    """
+    (start, end) pages of a parsed section, table or media item, from
+    page_start/page_end, a "start-end" page_range, or a single page.
+    Missing bounds are None.
+    """
+    start, end = _as_page(item.get("page_start")), _as_page(item.get("page_end"))
+    if start is None and item.get("page_range"):
+        first, _, last = str(item["page_range"]).partition("-")
+        start, end = _as_page(first), _as_page(last or first)
+    if start is None:
+        start = _as_page(item.get("page"))
+    if end is None or (start is not None and end < start):
+        end = start
+    return start, end
+
+
+def _page_metadata(item):
+    # Numeric bounds so filters can compare them; Chroma rejects None values.
+    start, end = page_span(item)
+    if start is None:
+        return {}
+    return {"page_start": start, "page_end": end}
+
+
+def _table_text(table):
+    lines = [table.get("caption") or ""]
+    for row in table.get("cells") or table.get("data") or []:
+        if isinstance(row, dict):
+            row = list(row.values())
+        if isinstance(row, (list, tuple)):
+            lines.append(" | ".join(str(cell) for cell in row))
+        else:
+            lines.append(str(row))
+    return "\n".join(line for line in lines if line.strip())
+
+
+def _to_document(kind, item, file_name):
+    if kind == "section":
+        if not (item.get("content") or "").strip():
+            return None
+        return Document(
+            page_content=item["content"],
             metadata={
                 "source": file_name,
-                "type": "media",
-                "page": item.get("page", ""),
+                "type": "section",
+                "title": item.get("title", ""),
+                "page_range": str(item.get("page_range", "")),
+                **_page_metadata(item),
             },
         )
-        documents.append(doc)
-
-    if documents:
-        vectorstore = Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            collection_name=clean_name,
-            persist_directory=str(base_path / "vectorstore"),
+    if kind == "table":
+        text = _table_text(item)
+        if not text.strip():
+            return None
+        return Document(
+            page_content=text,
+            metadata={
+                "source": file_name,
+                "type": "table",
+                "title": item.get("caption") or "",
+                "page": item.get("page", ""),
+                **_page_metadata(item),
+            },
         )
-    else:
-        vectorstore = None
+    return Document(
+        page_content=item["description"],
+        metadata={
+            "source": file_name,
+            "type": "media",
+            "page": item.get("page", ""),
+            **_page_metadata(item),
+        },
+    )
 
-    # 2. Store Tables in PostgreSQL
-    session = get_db_session()
-    try:
-        for table in parsed_data.get("tables", []):
-            table_id = str(uuid.uuid4())
-            data = table.get("cells") or table.get("data") or []
-            new_table = TableData(
-                id=table_id,
-                file_name=file_name,
-                user_id=user_id,
-                page=table.get("page"),
-                caption=table.get("caption"),
-                data_json=data,
+
+def store_items(items, file_name, api_key, user_id=None, db_root="db"):
+    """
+    Ingests ("section" | "media" | "table", item) pairs through a staged
+    pipeline: text is embedded and indexed in batches while tables are
+    written to the database, and each item is handled as soon as it
+    arrives. Returns (vectorstore or None, timings).
+    """
+    base_path = Path(db_root)
+    base_path.mkdir(parents=True, exist_ok=True)
+    clean_name = clean_filename(file_name)
+    embeddings = get_embedding_function(api_key, user_id, BACKGROUND)
+    state = {"store": None}
+
+    def embed(documents):
+        # The collection is only created once there is something to index.
+        if state["store"] is None:
+            state["store"] = vectorstores.create_store(
+                clean_name, embeddings, db_root=base_path, buffered=True
             )
-            session.add(new_table)
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        print(f"Error storing tables in PG: {e}")
-    finally:
-        session.close()
+        state["store"].add_documents(documents)
 
+    def persist_tables(tables):
+        session = get_db_session()
+        try:
+            session.add_all(
+                TableData(
+                    id=str(uuid.uuid4()),
+                    file_name=file_name,
+                    user_id=user_id,
+                    page=table.get("page"),
+                    caption=table.get("caption"),
+                    data_json=table.get("cells") or table.get("data") or [],
+                )
+                for table in tables
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Error storing tables in PG: {e}")
+        finally:
+            session.close()
+
+    with Pipeline("store") as pipeline:
+        pipeline.add_stage("embed_index", embed, batch_size=EMBED_BATCH_SIZE)
+        pipeline.add_stage("tables", persist_tables, batch_size=TABLE_BATCH_SIZE)
+        for kind, item in items:
+            if kind == "table":
+                pipeline.put("tables", item)
+            # Tables are indexed too, so retrieval can be scoped to them.
+            doc = _to_document(kind, item, file_name)
+            if doc is not None:
+                pipeline.put("embed_index", doc)
+    if state["store"] is not None:
+        # A NumPy index is written once here rather than once per batch.
+        vectorstores.flush_store(state["store"])
+    return state["store"], pipeline.timings()
+
+
+def store_parsed_data(parsed_data, file_name, api_key, user_id=None, db_root="db"):
+    """
+    Stores text in Vector Store, Tables in SQLite, and metadata for UI.
+    """
+    vectorstore, _ = store_items(_parsed_items(parsed_data), file_name, api_key, user_id, db_root)
     return vectorstore, "postgresql"
 
 
-def get_embedding_function(api_key):
-    return GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004", google_api_key=api_key
+def ingest_pdf(uploaded_file, file_name, api_key, model_name=None, user_id=None, db_root="db"):
+    """
+    Parses and stores a PDF in one pass: sections, tables and media enter
+    the store pipeline as they stream out of Gemini rather than after the
+    whole response. Returns (parsed_data, vectorstore); on failure
+    parsed_data holds "error" (anything already stored is left for the
+    orphan sweep).
+    """
+    report = {}
+    parsed = {"toc": [], "sections": [], "tables": [], "media": []}
+
+    def items():
+        for kind, item in parse_pdf_stream(uploaded_file, api_key, model_name, user_id, report):
+            parsed[_PARSED_KEYS[kind]].append(item)
+            if kind != "toc":
+                yield kind, item
+
+    try:
+        vectorstore, _ = store_items(items(), file_name, api_key, user_id, db_root)
+    except Exception as e:
+        return _parse_error(e, report), None
+    return _parsed_result(parsed, report), vectorstore
+
+
+class _InstrumentedEmbeddings:
+    """
+    Wraps an embedding model so each call is admitted by the LLM scheduler
+    and its latency recorded in metrics. It implements LangChain's
+    Embeddings interface without subclassing it, which would import
+    langchain_core's runnables at startup.
+    """
+
+    def __init__(self, inner, model_name, api_key, user_id=None, priority=INTERACTIVE):
+        self.inner = inner
+        self.model_name = model_name
+        self.api_key = api_key
+        self.user_id = user_id
+        self.priority = priority
+
+    def embed_documents(self, texts):
+        with llm_slot(self.api_key, self.user_id, self.priority), _llm_call(
+            self.model_name, "embed_documents"
+        ):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        with llm_slot(self.api_key, self.user_id, self.priority), _llm_call(
+            self.model_name, "embed_query"
+        ):
+            return self.inner.embed_query(text)
+
+    def embed_queries(self, texts):
+        """Embeds many search queries in one batched API call."""
+        with llm_slot(self.api_key, self.user_id, self.priority), _llm_call(
+            self.model_name, "embed_queries"
+        ):
+            return self.inner.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+
+
+def get_embedding_function(api_key, user_id=None, priority=INTERACTIVE):
+    return _InstrumentedEmbeddings(
+        get_embedding_model(api_key),
+        EMBEDDING_MODEL_NAME,
+        api_key,
+        user_id,
+        priority,
     )
 
 
-def load_vectorstore(file_name, api_key, db_root="db"):
-    base_path = Path(db_root)
+def load_vectorstore(file_name, api_key, db_root="db", user_id=None):
     clean_name = clean_filename(file_name)
-    embedding_function = get_embedding_function(api_key)
-    return Chroma(
-        persist_directory=str(base_path / "vectorstore"),
-        embedding_function=embedding_function,
-        collection_name=clean_name,
-    )
+    embedding_function = get_embedding_function(api_key, user_id)
+    return vectorstores.open_store(clean_name, embedding_function, db_root=db_root)
 
 
 # Structured response models for searching
@@ -401,54 +987,425 @@ class SearchResult(BaseModel):
     reasoning: str = Field(description="Logic used to arrive at the answer.")
 
 
-def query_pdf(vectorstore, query, api_key, model_name=None):
-    """General RAG query against the vector store."""
-    target_model = model_name or GEMINI_MODEL_NAME
-    llm = ChatGoogleGenerativeAI(model=target_model, google_api_key=api_key)
+class QueryResult(SearchResult):
+    """SearchResult plus per-request accounting; never sent to the LLM as schema."""
 
-    retriever = vectorstore.as_retriever(
-        search_type="similarity", search_kwargs={"k": 5}
-    )
+    usage: dict = Field(default_factory=dict)
 
-    prompt_template = ChatPromptTemplate.from_template(
-        """
+
+QUERY_TOP_K = int(os.getenv("QUERY_TOP_K", "5"))
+# Conversational mode: how much recent chat history is used for follow-ups.
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "800"))
+
+_condensed_query_cache = TTLCache("condensed_queries", maxsize=2048, ttl=3600)
+
+_PROMPT_TEMPLATES = {
+    "answer": """
     You are a helpful document assistant. Use the following context to answer the question.
     If the context doesn't contain the answer, say you don't know based on the provided text.
     
+    Conversation so far: {history}
+    
     Context: {context}
     
     Question: {question}
     
     Answer clearly and concisely.
+    """,
+    "condense": """
+    Given the conversation below and a follow-up question, rewrite the follow-up
+    as a standalone question that can be understood without the conversation.
+    Keep names, numbers and references (e.g. "table 3") explicit.
+    Return ONLY the standalone question.
+    
+    Conversation: {history}
+    
+    Follow-up question: {question}
+    """,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _prompt(name):
+    # langchain_core.prompts is slow to import, so prompts are built on first use.
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_template(_PROMPT_TEMPLATES[name])
+
+
+def format_history(history, max_messages=HISTORY_MAX_MESSAGES, token_budget=HISTORY_TOKEN_BUDGET):
+    """Most recent messages (oldest first) that fit the token budget."""
+    lines, used = [], 0
+    for msg in reversed((history or [])[-max_messages:] if max_messages else []):
+        content = (msg.get("content") or "").strip()
+        if not content:
+            continue
+        line = f"{'User' if msg.get('role') == 'user' else 'Assistant'}: {content}"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(reversed(lines))
+
+
+def condense_query(query, history_text, llm, model_name, api_key, user_id=None, chat_id=None):
+    """
+    Rewrites a follow-up into a standalone retrieval query. Results are cached
+    per chat, keyed on the history window and the question.
     """
+    if not history_text:
+        return query
+    cache_key = (
+        chat_id,
+        hashlib.sha1(f"{history_text}\x00{query}".encode("utf-8")).hexdigest(),
     )
+    cached = _condensed_query_cache.get(cache_key)
+    if cached:
+        return cached
+
+    with metrics.span("query.condense"), llm_slot(api_key, user_id, INTERACTIVE), _llm_call(
+        model_name, "condense"
+    ) as call:
+        message = llm.invoke(
+            _prompt("condense").invoke({"history": history_text, "question": query})
+        )
+        call["usage"] = _usage_from_message(message)
+
+    condensed = (message.content or "").strip() if isinstance(message.content, str) else ""
+    condensed = condensed or query
+    _condensed_query_cache.set(cache_key, condensed)
+    return condensed
+
+
+def _relevance_fn(vectorstore):
+    try:
+        return vectorstore._select_relevance_score_fn()
+    except NotImplementedError:
+        return lambda distance: distance
+
+
+FILTER_TYPES = ("section", "table", "media")
+
+
+def _all_of(conditions):
+    # Chroma wants $and/$or with at least two operands.
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
 
-    rag_chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt_template
-        | llm.with_structured_output(SearchResult)
+def _overlaps(start, end):
+    """Chunks whose page span overlaps [start, end]; either bound may be None."""
+    conditions = []
+    if end is not None:
+        conditions.append({"page_start": {"$lte": end}})
+    if start is not None:
+        conditions.append({"page_end": {"$gte": start}})
+    return conditions
+
+
+def _match_sections(name, sections):
+    wanted = name.strip().lower()
+    titled = [s for s in sections or [] if (s.get("title") or "").strip()]
+    exact = [s for s in titled if s["title"].strip().lower() == wanted]
+    return exact or [s for s in titled if wanted in s["title"].lower()]
+
+
+def build_filter(types=None, page_start=None, page_end=None, section=None, sections=None):
+    """
+    Vector-store `where` filter scoping retrieval to content `types`
+    (section/table/media), to chunks overlapping pages page_start..page_end,
+    and/or to the section titled `section` (exact, else substring match,
+    case-insensitive) out of the document's parsed `sections`: that
+    section's own chunk plus the tables and media on its pages.
+    Returns None when nothing is filtered. Raises ValueError on bad input.
+    """
+    conditions = []
+    if types:
+        unknown = sorted(set(types) - set(FILTER_TYPES))
+        if unknown:
+            raise ValueError(
+                f"Unknown content type(s) {', '.join(unknown)}; use {', '.join(FILTER_TYPES)}"
+            )
+        wanted = sorted(set(types))
+        conditions.append({"type": wanted[0]} if len(wanted) == 1 else {"type": {"$in": wanted}})
+
+    for bound in (page_start, page_end):
+        if bound is not None and bound < 1:
+            raise ValueError("Page numbers start at 1")
+    if page_start is not None and page_end is not None and page_start > page_end:
+        raise ValueError("page_start must not be after page_end")
+    conditions += _overlaps(page_start, page_end)
+
+    if section:
+        matched = _match_sections(section, sections)
+        if not matched:
+            raise ValueError(f"No section matches {section!r}")
+        scopes = [{"$and": [{"type": "section"}, {"title": {"$in": [s["title"] for s in matched]}}]}]
+        for start, end in {page_span(s) for s in matched}:
+            if start is not None:
+                scopes.append(_all_of([{"type": {"$ne": "section"}}] + _overlaps(start, end)))
+        conditions.append(scopes[0] if len(scopes) == 1 else {"$or": scopes})
+
+    return _all_of(conditions) if conditions else None
+
+
+def _retrieve(vectorstore, query, usage, use_rerank=None, vector=None, where=None):
+    """
+    Vector search for `query` (or a precomputed query `vector`). With
+    re-ranking, RERANK_CANDIDATES chunks are fetched and the best
+    QUERY_TOP_K kept. `where` (see build_filter) is applied inside the
+    vector search. Returns (doc, score) pairs, best first.
+    """
+    use_rerank = RERANK_ENABLED if use_rerank is None else use_rerank
+    fetch_k = max(RERANK_CANDIDATES, QUERY_TOP_K) if use_rerank else QUERY_TOP_K
+    if where:
+        usage["filter"] = where
+    with metrics.span("query.retrieve"):
+        if vector is None:
+            scored_docs = vectorstore.similarity_search_with_relevance_scores(
+                query, k=fetch_k, filter=where
+            )
+        else:
+            to_relevance = _relevance_fn(vectorstore)
+            scored_docs = [
+                (doc, to_relevance(distance))
+                for doc, distance in vectorstore.similarity_search_by_vector_with_relevance_scores(
+                    vector, k=fetch_k, filter=where
+                )
+            ]
+    if use_rerank:
+        with metrics.span("query.rerank"):
+            scored_docs, usage["rerank"] = rerank(query, scored_docs, QUERY_TOP_K)
+    return scored_docs
+
+
+def _answer_from_docs(
+    llm,
+    model_name,
+    query,
+    retrieval_query,
+    scored_docs,
+    api_key,
+    user_id,
+    priority,
+    token_budget,
+    history_text="",
+    usage=None,
+):
+    """Assembles the context from retrieved (doc, score) pairs and asks the LLM."""
+    usage = {} if usage is None else usage
+    with metrics.span("query.context"):
+        context_text, _, usage["context"] = assemble_context(
+            scored_docs, retrieval_query, token_budget
+        )
+        prompt_value = _prompt("answer").invoke(
+            {
+                "history": history_text or "(none)",
+                "context": context_text,
+                "question": query,
+            }
+        )
+
+    with metrics.span("query.llm"), llm_slot(api_key, user_id, priority), _llm_call(
+        model_name, "answer"
+    ) as call:
+        output = llm.with_structured_output(SearchResult, include_raw=True).invoke(
+            prompt_value
+        )
+        call["usage"] = _usage_from_message(output.get("raw"))
+
+    if output.get("parsed") is None:
+        raise output.get("parsing_error") or ValueError(
+            "Model returned no structured answer."
+        )
+    result = output["parsed"]
+    # Prefer the API's own counts; fall back to local estimates.
+    usage["prompt_tokens"] = call["usage"]["prompt"] or estimate_tokens(
+        prompt_value.to_string()
+    )
+    usage["completion_tokens"] = call["usage"]["completion"] or estimate_tokens(
+        result.model_dump_json()
     )
+    return QueryResult(**result.model_dump(), usage=usage)
+
+
+def query_pdf(
+    vectorstore,
+    query,
+    api_key,
+    model_name=None,
+    user_id=None,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    history=None,
+    chat_id=None,
+    conversational=True,
+    use_rerank=None,
+    where=None,
+):
+    """
+    General RAG query against the vector store. Retrieved chunks are
+    deduplicated and trimmed to `token_budget` before prompting; token
+    counts are reported in the result's `usage`.
+
+    In conversational mode a bounded window of `history` is included in the
+    prompt, and follow-ups are condensed into a standalone retrieval query
+    (one extra LLM call, cached per chat). Pass conversational=False to skip
+    both for the lowest latency.
+
+    `where` (see build_filter) restricts retrieval to part of the document.
+    """
+    target_model = model_name or GEMINI_MODEL_NAME
+    llm = get_chat_model(target_model, api_key)
+    usage = {}
 
     try:
-        result = rag_chain.invoke(query)
-        return result
+        history_text = format_history(history) if conversational else ""
+        retrieval_query = query
+        if history_text:
+            try:
+                retrieval_query = condense_query(
+                    query, history_text, llm, target_model, api_key, user_id, chat_id
+                )
+            except (google_exceptions.ResourceExhausted, LLMQueueTimeout):
+                raise
+            except Exception as e:
+                print(f"Query condensation failed, using raw query: {e}")
+        usage["retrieval_query"] = retrieval_query
+        usage["history_tokens"] = estimate_tokens(history_text)
+
+        scored_docs = _retrieve(vectorstore, retrieval_query, usage, use_rerank, where=where)
+
+        return _answer_from_docs(
+            llm,
+            target_model,
+            query,
+            retrieval_query,
+            scored_docs,
+            api_key,
+            user_id,
+            INTERACTIVE,
+            token_budget,
+            history_text,
+            usage,
+        )
     except google_exceptions.ResourceExhausted:
         # Return a SearchResult object with the error message
-        return SearchResult(
+        return QueryResult(
             answer="I'm sorry, but the AI API quota has been exceeded. Please wait a moment and try again.",
             reasoning="The server received a 429 Resource Exhausted error from the Gemini API.",
             context_used="N/A",
+            usage=usage,
+        )
+    except LLMQueueTimeout:
+        return QueryResult(
+            answer="I'm sorry, the AI service is busy for this API key right now. Please try again shortly.",
+            reasoning="The request waited too long for an LLM slot (per-key rate limit).",
+            context_used="N/A",
+            usage=usage,
         )
 
 
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+
+def batch_question_limit():
+    """
+    Most questions one batch may ask: BATCH_MAX_QUESTIONS, lowered to what
+    an API key's rate limit admits within the background queue timeout
+    (less the call that embeds the questions). Larger batches would end in
+    LLMQueueTimeout answers after the stream has already started.
+    """
+    admissible = get_scheduler().admissible(BACKGROUND)
+    if admissible is None:
+        return BATCH_MAX_QUESTIONS
+    return max(1, min(BATCH_MAX_QUESTIONS, admissible - 1))
+
+
+def query_batch(
+    vectorstore,
+    questions,
+    api_key,
+    model_name=None,
+    user_id=None,
+    max_concurrency=BATCH_MAX_CONCURRENCY,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    use_rerank=None,
+    where=None,
+):
+    """
+    Answers many (key, question) pairs against one document, optionally
+    scoped by a `where` filter (see build_filter).
+
+    All questions are embedded in a single batch call, retrieval runs per
+    vector, and LLM calls run concurrently (at most `max_concurrency`, at
+    background priority). Embedding and retrieval happen before this
+    returns, so their errors reach the caller. Returns an iterator yielding
+    one dict per question as soon as it is answered, in completion order.
+    """
+    from concurrent.futures import as_completed
+
+    target_model = model_name or GEMINI_MODEL_NAME
+    llm = get_chat_model(target_model, api_key)
+    texts = [q for _, q in questions]
+
+    with metrics.span("batch.embed"):
+        vectors = vectorstore.embeddings.embed_queries(texts)
+    usages = [{} for _ in questions]
+    retrieved = [
+        _retrieve(vectorstore, text, usage, use_rerank, vector=vector, where=where)
+        for text, usage, vector in zip(texts, usages, vectors)
+    ]
+
+    def answer(index):
+        key, question = questions[index]
+        item = {"index": index, "id": key, "query": question}
+        try:
+            result = _answer_from_docs(
+                llm,
+                target_model,
+                question,
+                question,
+                retrieved[index],
+                api_key,
+                user_id,
+                BACKGROUND,
+                token_budget,
+                usage=usages[index],
+            )
+            item.update(
+                answer=result.answer,
+                reasoning=result.reasoning,
+                context=result.context_used,
+                usage=result.usage,
+            )
+        except google_exceptions.ResourceExhausted:
+            item["error"] = "API Quota Exceeded (429)."
+        except LLMQueueTimeout as e:
+            item["error"] = str(e)
+        except Exception as e:
+            item["error"] = f"Query failed: {e}"
+        return item
+
+    def answers():
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            futures = [pool.submit(answer, i) for i in range(len(questions))]
+            for future in as_completed(futures):
+                yield future.result()
+
+    return answers()
+
+
 def get_tables_for_file(file_name, user_id=None):
     session = get_db_session()
     try:
         # We don't always have user_id if we didn't store it yet
-        query = session.query(TableData).filter_by(file_name=file_name)
+        query = (
+            session.query(TableData)
+            .options(*_undefer_payloads(TableData, ["data_json"]))
+            .filter_by(file_name=file_name)
+        )
         if user_id:
             query = query.filter_by(user_id=user_id)
 
@@ -463,15 +1420,26 @@ def get_tables_for_file(file_name, user_id=None):
                     "data_json": json.dumps(t.data_json),
                 }
             )
+        import pandas as pd
+
         return pd.DataFrame(data)
     finally:
         session.close()
 
 
 def save_chat(
-    chat_history, file_name, user_id, chat_id=None, processed_data=None, pdf_bytes=None
+    chat_history,
+    file_name,
+    user_id,
+    chat_id=None,
+    processed_data=None,
+    doc_sha256=None,
 ):
-    """Saves a chat history and session context to PostgreSQL."""
+    """
+    Saves a chat history and session context to PostgreSQL.
+    The PDF is referenced by `doc_sha256` (see render.store_document);
+    `pdf_b64` is only read, for chats saved before the document store.
+    """
     session = get_db_session()
     try:
         if not chat_id:
@@ -488,19 +1456,15 @@ def save_chat(
                 )
                 break
 
-        pdf_b64 = None
-        if pdf_bytes:
-            import base64
-
-            pdf_b64 = base64.b64encode(pdf_bytes).decode("utf-8")
-
         chat_obj = session.query(Chat).filter_by(id=chat_id).first()
         if chat_obj:
             chat_obj.title = title
             chat_obj.history = chat_history
-            chat_obj.processed_data = processed_data
-            if pdf_b64:
-                chat_obj.pdf_b64 = pdf_b64
+            # Only rewrite the (large) parsed structure when it is given.
+            if processed_data is not None:
+                chat_obj.processed_data = processed_data
+            if doc_sha256:
+                chat_obj.doc_sha256 = doc_sha256
             chat_obj.timestamp = datetime.datetime.utcnow()
         else:
             new_chat = Chat(
@@ -510,7 +1474,7 @@ def save_chat(
                 file_name=file_name,
                 history=chat_history,
                 processed_data=processed_data,
-                pdf_b64=pdf_b64,
+                doc_sha256=doc_sha256,
             )
             session.add(new_chat)
 
@@ -524,44 +1488,110 @@ def save_chat(
         session.close()
 
 
-def get_all_chats(user_id):
-    """Retrieves all saved chat metadata for a user from PostgreSQL."""
+CHATS_PAGE_MAX = int(os.getenv("CHATS_PAGE_MAX", "200"))
+
+
+class InvalidCursor(ValueError):
+    """Raised for a chat list cursor that was not issued by `list_chats`."""
+
+
+def _encode_cursor(timestamp, chat_id):
+    raw = json.dumps([timestamp.isoformat(), chat_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, chat_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(timestamp), str(chat_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def list_chats(user_id, limit=None, cursor=None, search=None):
+    """
+    Lists a user's chats newest first, selecting only the listed columns.
+
+    Keyset pagination on (timestamp, id): pass the returned `next_cursor`
+    back as `cursor` to get the next page. Returns (chats, next_cursor);
+    next_cursor is None on the last page or when `limit` is None.
+    """
     session = get_db_session()
     try:
-        chats = (
-            session.query(Chat)
-            .filter_by(user_id=user_id)
-            .order_by(Chat.timestamp.desc())
-            .all()
+        query = session.query(Chat.id, Chat.title, Chat.file_name, Chat.timestamp).filter(
+            Chat.user_id == user_id
         )
-        return [
+        if search:
+            pattern = "%" + re.sub(r"([\\%_])", r"\\\1", search) + "%"
+            query = query.filter(Chat.title.ilike(pattern, escape="\\"))
+        if cursor:
+            timestamp, chat_id = _decode_cursor(cursor)
+            query = query.filter(
+                or_(
+                    Chat.timestamp < timestamp,
+                    and_(Chat.timestamp == timestamp, Chat.id < chat_id),
+                )
+            )
+        query = query.order_by(Chat.timestamp.desc(), Chat.id.desc())
+        if limit is not None:
+            limit = max(1, min(limit, CHATS_PAGE_MAX))
+            # One extra row tells us whether there is a next page.
+            rows = query.limit(limit + 1).all()
+        else:
+            rows = query.all()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].timestamp, rows[-1].id)
+        chats = [
             {
-                "chat_id": c.id,
-                "title": c.title,
-                "file_name": c.file_name,
-                "timestamp": c.timestamp.isoformat(),
+                "chat_id": row.id,
+                "title": row.title,
+                "file_name": row.file_name,
+                "timestamp": row.timestamp.isoformat(),
             }
-            for c in chats
+            for row in rows
         ]
+        return chats, next_cursor
     finally:
         session.close()
 
 
-def load_chat(chat_id):
-    """Loads a specific chat session from PostgreSQL."""
+def get_all_chats(user_id):
+    """Retrieves all saved chat metadata for a user from PostgreSQL."""
+    chats, _ = list_chats(user_id)
+    return chats
+
+
+CHAT_PAYLOADS = ("history", "processed_data", "pdf_b64")
+
+
+def load_chat(chat_id, include=CHAT_PAYLOADS):
+    """
+    Loads a specific chat session from PostgreSQL. Only the payloads named
+    in `include` are fetched and decoded. `pdf_b64` is only set for chats
+    saved before the document store; newer ones are served from
+    /api/chats/{id}/pdf and /pages via `doc_sha256`.
+    """
     session = get_db_session()
     try:
-        chat = session.query(Chat).filter_by(id=chat_id).first()
+        options = _undefer_payloads(Chat, [n for n in include if n in _PAYLOADS[Chat]])
+        if "pdf_b64" in include:
+            options.append(undefer(Chat.pdf_b64))
+        chat = session.query(Chat).options(*options).filter_by(id=chat_id).first()
         if chat:
-            return {
+            result = {
                 "chat_id": chat.id,
                 "user_id": chat.user_id,
                 "title": chat.title,
                 "file_name": chat.file_name,
-                "history": chat.history,
-                "processed_data": chat.processed_data,
-                "pdf_b64": chat.pdf_b64,
+                "doc_sha256": chat.doc_sha256,
             }
+            for name in include:
+                result[name] = getattr(chat, name)
+            return result
         return None
     finally:
         session.close()
@@ -1,14 +1,22 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, status
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
-import uuid
+import json
+import asyncio
 import jwt
 from datetime import datetime, timedelta
 from fastapi.staticfiles import StaticFiles
-from . import logic
+from . import coordination, logic, maintenance, metrics, render, uploads, warmup
+
+warmup.record_import(time.perf_counter() - _IMPORT_STARTED)
 
 # --- Configuration ---
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-production")
@@ -24,13 +32,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Collect per-stage spans for this request and expose them via Server-Timing
+    start = time.perf_counter()
+    with metrics.trace() as spans:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    spans.append(("total", elapsed))
+    response.headers["Server-Timing"] = metrics.server_timing(spans)
+    return response
+
 # Serve Frontend
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    # 503 until the warm-up thread has finished; point readiness probes here.
+    if not warmup.is_ready():
+        return Response(
+            content=json.dumps({"status": "warming_up", **warmup.report()}),
+            media_type="application/json",
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return {"status": "ready", **warmup.report()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # --- Auth Helpers ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
@@ -46,6 +88,48 @@ class QueryRequest(BaseModel):
     chat_id: str
     query: str
     model: Optional[str] = None
+    # Use recent chat history for follow-ups; set False for lowest latency.
+    conversational: bool = True
+    # Override RERANK_ENABLED for this request.
+    rerank: Optional[bool] = None
+    # Optional retrieval scope: content types (section/table/media), a page
+    # range, and/or a section title.
+    types: Optional[List[str]] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    section: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    chat_id: str
+    # Either plain questions, or a structured extraction schema mapping
+    # field names to questions (like ExtractedInfo in the prototype).
+    queries: List[str] = []
+    fields: Dict[str, str] = {}
+    model: Optional[str] = None
+    max_concurrency: Optional[int] = None
+    save_history: bool = True
+    rerank: Optional[bool] = None
+    types: Optional[List[str]] = None
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    section: Optional[str] = None
+
+def _retrieval_filter(request):
+    """Builds the request's retrieval scope; the section lookup needs the parsed sections."""
+    sections = None
+    if request.section:
+        chat_data = logic.load_chat(request.chat_id, include=("processed_data",))
+        sections = ((chat_data or {}).get('processed_data') or {}).get('sections')
+    try:
+        return logic.build_filter(
+            types=request.types,
+            page_start=request.page_start,
+            page_end=request.page_end,
+            section=request.section,
+            sections=sections,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -68,7 +152,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except jwt.PyJWTError:
         raise credentials_exception
     
-    user = logic.verify_user_by_username(username) # Need to implement this in logic.py
+    # Tokens carry the user id, so the common path needs no DB lookup at all.
+    user_id = payload.get("uid")
+    if user_id is not None:
+        return logic.AuthUser(id=user_id, username=username)
+    
+    # Older tokens only have "sub": resolve through the short-TTL user cache.
+    user = logic.get_user_cached(username)
     if user is None:
         raise credentials_exception
     return user
@@ -77,25 +167,39 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 
 @app.on_event("startup")
 async def startup_event():
-    logic.init_db()
+    warmup.start()
+    maintenance.start_sweeper()
+    coordination.start_cache_sync()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    maintenance.stop_sweeper()
+    coordination.stop_cache_sync()
+    render.shutdown()
 
 @app.post("/api/register")
 async def register(user: UserCreate):
-    success, msg = logic.register_user(user.username, user.password)
+    loop = asyncio.get_running_loop()
+    success, msg = await loop.run_in_executor(
+        logic.BCRYPT_POOL, logic.register_user, user.username, user.password
+    )
     if not success:
         raise HTTPException(status_code=400, detail=msg)
     return {"message": "User registered successfully"}
 
 @app.post("/api/token", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = logic.verify_user(form_data.username, form_data.password)
+    loop = asyncio.get_running_loop()
+    user = await loop.run_in_executor(
+        logic.BCRYPT_POOL, logic.verify_user, form_data.username, form_data.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": user.username, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/me")
@@ -107,65 +211,85 @@ async def upload_pdf(file: UploadFile = File(...), api_key: str = None, model: s
     if not api_key:
         raise HTTPException(status_code=400, detail="API Key is required")
     
-    # Save file temporarily
-    file_id = str(uuid.uuid4())
-    file_path = f"tmp_{file_id}.pdf"
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
+    # Stream the upload to disk in chunks (hashing as we go) instead of
+    # buffering the whole file in memory.
+    try:
+        upload = await uploads.spool_upload(file)
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
     try:
-        # We need a file-like object for the logic functions
-        class FileWrapper:
-            def __init__(self, path, name):
-                self.path = path
-                self.name = name
-            def getvalue(self):
-                with open(self.path, "rb") as f:
-                    return f.read()
-            @property
-            def name(self):
-                return self._name
-            @name.setter
-            def name(self, val):
-                self._name = val
-
-        file_obj = FileWrapper(file_path, file.filename)
-        
-        parsed_data = logic.intelligent_pdf_parse(file_obj, api_key, model_name=model)
+        # Blocking work runs in the threadpool: LLM calls may wait there for
+        # a scheduler slot without stalling the event loop.
+        def ingest():
+            # One ingest per document, and one writer per collection (named
+            # after the file), across workers. Parsed objects are stored as
+            # they stream in, so the locks cover both, and they are held until
+            # the chat is saved so a concurrent delete never sees the new
+            # collection as unreferenced. Both fail fast when busy.
+            with coordination.ingest_lock(upload.sha256), coordination.collection_lock(
+                logic.clean_filename(file.filename)
+            ):
+                parsed_data, _ = logic.ingest_pdf(
+                    upload, file.filename, api_key, model_name=model, user_id=current_user.id
+                )
+                if "error" in parsed_data:
+                    return parsed_data, None
+                # Keep the PDF (once per content hash) for the viewer and page renders.
+                doc_sha256 = render.store_document(upload)
+                chat_id = logic.save_chat(
+                    [], file.filename, current_user.id, processed_data=parsed_data, doc_sha256=doc_sha256
+                )
+                return parsed_data, chat_id
+
+        try:
+            parsed_data, chat_id = await run_in_threadpool(ingest)
+        except coordination.LockTimeout:
+            raise HTTPException(
+                status_code=409,
+                detail="This document, or another file with the same name, is being processed. Please retry.",
+            )
         if "error" in parsed_data:
             raise HTTPException(status_code=500, detail=parsed_data["error"])
         
-        vectorstore, _ = logic.store_parsed_data(parsed_data, file.filename, api_key, current_user.id)
-        
-        # Save initial chat with PDF binary for persistence
-        with open(file_path, "rb") as f:
-            pdf_bytes = f.read()
-            
-        chat_id = logic.save_chat([], file.filename, current_user.id, processed_data=parsed_data, pdf_bytes=pdf_bytes)
-        
         return {
             "chat_id": chat_id,
             "file_name": file.filename,
             "processed_data": parsed_data
         }
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        upload.cleanup()
 
 @app.post("/api/query")
 async def query_pdf(request: QueryRequest, api_key: str = None, current_user = Depends(get_current_user)):
     if not api_key:
         raise HTTPException(status_code=400, detail="API Key is required")
     
-    chat_data = logic.load_chat(request.chat_id)
+    chat_data = logic.load_chat(request.chat_id, include=("history",))
     if not chat_data or chat_data['user_id'] != current_user.id:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
-    vectorstore = logic.load_vectorstore(chat_data['file_name'], api_key)
-    result = logic.query_pdf(vectorstore, request.query, api_key, model_name=request.model)
+    history = chat_data.get('history') or []
+    where = _retrieval_filter(request)
+    
+    def run_query():
+        vectorstore = logic.load_vectorstore(chat_data['file_name'], api_key, user_id=current_user.id)
+        return logic.query_pdf(
+            vectorstore,
+            request.query,
+            api_key,
+            model_name=request.model,
+            user_id=current_user.id,
+            history=history,
+            chat_id=request.chat_id,
+            conversational=request.conversational,
+            use_rerank=request.rerank,
+            where=where,
+        )
+    
+    result = await run_in_threadpool(run_query)
     
     # Update history
-    history = chat_data.get('history', [])
     history.append({"role": "user", "content": request.query})
     history.append({
         "role": "assistant", 
@@ -180,28 +304,186 @@ async def query_pdf(request: QueryRequest, api_key: str = None, current_user = D
         "answer": result.answer,
         "reasoning": result.reasoning,
         "context": result.context_used,
+        "usage": result.usage,
         "history": history
     }
 
+@app.post("/api/query/batch")
+async def query_batch(request: BatchQueryRequest, api_key: str = None, current_user = Depends(get_current_user)):
+    """Answers many questions about one document, streaming NDJSON lines as they finish."""
+    if not api_key:
+        raise HTTPException(status_code=400, detail="API Key is required")
+    
+    questions = [(str(i), q) for i, q in enumerate(request.queries)]
+    questions += list(request.fields.items())
+    if not questions:
+        raise HTTPException(status_code=400, detail="Provide 'queries' or 'fields'")
+    limit = logic.batch_question_limit()
+    if len(questions) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} questions per batch")
+    
+    chat_data = logic.load_chat(request.chat_id, include=("history",))
+    if not chat_data or chat_data['user_id'] != current_user.id:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    where = _retrieval_filter(request)
+    
+    vectorstore = await run_in_threadpool(
+        logic.load_vectorstore, chat_data['file_name'], api_key, user_id=current_user.id
+    )
+    concurrency = min(request.max_concurrency or logic.BATCH_MAX_CONCURRENCY, logic.BATCH_MAX_CONCURRENCY)
+    
+    # Embedding and retrieval run before the response starts, so their
+    # failures still get a proper status code.
+    try:
+        answers = await run_in_threadpool(
+            logic.query_batch,
+            vectorstore,
+            questions,
+            api_key,
+            model_name=request.model,
+            user_id=current_user.id,
+            max_concurrency=concurrency,
+            use_rerank=request.rerank,
+            where=where,
+        )
+    except logic.google_exceptions.ResourceExhausted:
+        raise HTTPException(status_code=429, detail="API Quota Exceeded (429).")
+    except logic.LLMQueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch retrieval failed: {e}")
+    
+    def stream():
+        results = []
+        failure = None
+        try:
+            for item in answers:
+                results.append(item)
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            # Headers are already sent: report it in-band, then finish normally.
+            failure = f"Batch failed: {e}"
+            yield json.dumps({"error": failure}) + "\n"
+        
+        errors = sum(1 for item in results if "error" in item)
+        if request.save_history:
+            # One history write for the whole batch, in question order.
+            history = chat_data.get('history') or []
+            for item in sorted(results, key=lambda r: r["index"]):
+                history.append({"role": "user", "content": item["query"]})
+                history.append({
+                    "role": "assistant",
+                    "content": item.get("answer") or item.get("error", ""),
+                    "reasoning": item.get("reasoning", ""),
+                    "context": item.get("context", "")
+                })
+            logic.save_chat(history, chat_data['file_name'], current_user.id, chat_id=request.chat_id)
+        summary = {"done": True, "count": len(results), "errors": errors}
+        if failure:
+            summary["error"] = failure
+        yield json.dumps(summary) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/api/chats")
-async def get_chats(current_user = Depends(get_current_user)):
-    return logic.get_all_chats(current_user.id)
+async def get_chats(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=logic.CHATS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    current_user = Depends(get_current_user),
+):
+    # The body stays a plain list; the next page's cursor goes in a header.
+    try:
+        chats, next_cursor = await run_in_threadpool(
+            logic.list_chats, current_user.id, limit, cursor, q
+        )
+    except logic.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return chats
 
 @app.get("/api/chats/{chat_id}")
-async def get_chat(chat_id: str, current_user = Depends(get_current_user)):
-    chat = logic.load_chat(chat_id)
+async def get_chat(chat_id: str, include_pdf: bool = False, current_user = Depends(get_current_user)):
+    # The viewer renders pages via /pages; only chats saved before the
+    # document store still need their base64 PDF (include_pdf=true).
+    include = logic.CHAT_PAYLOADS if include_pdf else ("history", "processed_data")
+    chat = await run_in_threadpool(logic.load_chat, chat_id, include)
     if not chat or chat['user_id'] != current_user.id:
         raise HTTPException(status_code=404, detail="Chat not found")
     return chat
 
+def _chat_document(chat_id, current_user):
+    chat = logic.load_chat(chat_id, include=())
+    if not chat or chat['user_id'] != current_user.id:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if not chat['doc_sha256']:
+        raise HTTPException(status_code=404, detail="No stored document for this chat")
+    return chat['doc_sha256']
+
+# Documents are content-addressed, so a given URL always returns the same bytes.
+_IMMUTABLE = "private, max-age=31536000, immutable"
+
+@app.get("/api/chats/{chat_id}/pdf")
+async def get_chat_pdf(chat_id: str, request: Request, current_user = Depends(get_current_user)):
+    doc_sha256 = _chat_document(chat_id, current_user)
+    etag = f'"{doc_sha256}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": _IMMUTABLE})
+    path = render.document_path(doc_sha256)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Stored document is missing")
+    return FileResponse(
+        path, media_type="application/pdf", headers={"ETag": etag, "Cache-Control": _IMMUTABLE}
+    )
+
+@app.get("/api/chats/{chat_id}/pages")
+async def get_chat_pages(chat_id: str, current_user = Depends(get_current_user)):
+    doc_sha256 = _chat_document(chat_id, current_user)
+    try:
+        pages = await run_in_threadpool(render.page_count, doc_sha256)
+    except render.DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Stored document is missing")
+    return {
+        "pages": pages,
+        "default_dpi": render.RENDER_DEFAULT_DPI,
+        "max_dpi": render.RENDER_MAX_DPI,
+        "thumbnail_dpi": render.THUMBNAIL_DPI,
+    }
+
+async def _page_response(chat_id, page, dpi, request, current_user):
+    doc_sha256 = _chat_document(chat_id, current_user)
+    dpi = render.clamp_dpi(dpi)
+    etag = render.etag(doc_sha256, page, dpi)
+    headers = {"ETag": etag, "Cache-Control": _IMMUTABLE}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    try:
+        path = await run_in_threadpool(render.page_image, doc_sha256, page, dpi)
+    except render.DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Stored document is missing")
+    except render.PageOutOfRange as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return FileResponse(path, media_type=render.MEDIA_TYPES[render.RENDER_FORMAT], headers=headers)
+
+@app.get("/api/chats/{chat_id}/pages/{page}")
+async def get_chat_page(chat_id: str, page: int, request: Request, dpi: Optional[int] = None, current_user = Depends(get_current_user)):
+    return await _page_response(chat_id, page, dpi, request, current_user)
+
+@app.get("/api/chats/{chat_id}/pages/{page}/thumbnail")
+async def get_chat_page_thumbnail(chat_id: str, page: int, request: Request, current_user = Depends(get_current_user)):
+    return await _page_response(chat_id, page, render.THUMBNAIL_DPI, request, current_user)
+
 @app.delete("/api/chats/{chat_id}")
 async def delete_chat(chat_id: str, current_user = Depends(get_current_user)):
-    chat = logic.load_chat(chat_id)
+    chat = logic.load_chat(chat_id, include=())
     if not chat or chat['user_id'] != current_user.id:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    success = logic.delete_chat(chat_id)
-    return {"success": success}
+    # Also drops the file's tables/vector collection once nothing uses them.
+    report = await run_in_threadpool(maintenance.delete_chat_cascade, chat_id)
+    return {"success": report is not None}
 
 # Serve Frontend - Mount at the end to avoid route conflicts
 # Check if dist exists, otherwise serve a placeholder or error
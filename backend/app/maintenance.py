@@ -0,0 +1,366 @@
+"""
+Retention, compaction and garbage collection.
+
+- `delete_chat_cascade` deletes a chat and whatever only it was keeping
+  alive: the user's extracted tables for that file and, when no chat of any
+  user references them any more, its vector collection and stored PDF
+  (with its rendered pages). Anything written within ORPHAN_GRACE_SECONDS,
+  or locked by an ingest, is left for the sweep.
+- `run_maintenance` applies the retention policies, sweeps orphaned tables,
+  collections and documents, trims the render cache, compacts the database
+  and reports reclaimed bytes.
+- `start_sweeper` runs it every MAINTENANCE_INTERVAL_SECONDS in a daemon
+  thread (0 disables it).
+
+Run once from the command line with `python -m app.maintenance`.
+"""
+
+import os
+import json
+import time
+import argparse
+import datetime
+import threading
+from pathlib import Path
+
+from sqlalchemy import func, text, and_, or_, exists
+
+from . import coordination, logic, metrics, render, vectorstores
+from .logic import Chat, TableData
+
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "0"))
+# Delete chats not touched for this many days (0 keeps them forever).
+CHAT_RETENTION_DAYS = float(os.getenv("CHAT_RETENTION_DAYS", "0"))
+# Drop the stored PDF copy of chats idle for this many days (0 never does).
+PDF_RETENTION_DAYS = float(os.getenv("PDF_RETENTION_DAYS", "0"))
+# Collections younger than this are never swept: their chat may not be saved yet.
+ORPHAN_GRACE_SECONDS = float(os.getenv("ORPHAN_GRACE_SECONDS", "3600"))
+MAINTENANCE_VACUUM = os.getenv("MAINTENANCE_VACUUM", "true").lower() in ("1", "true", "yes")
+
+DELETED = metrics.Counter(
+    "pdfretriever_maintenance_deleted_total",
+    "Objects removed by maintenance.",
+    ["kind"],
+)
+RECLAIMED_BYTES = metrics.Counter(
+    "pdfretriever_maintenance_reclaimed_bytes_total",
+    "Bytes reclaimed by maintenance.",
+    ["kind"],
+)
+LAST_RUN = metrics.Gauge(
+    "pdfretriever_maintenance_last_run_timestamp_seconds",
+    "When maintenance last completed.",
+    [],
+)
+
+
+def _dir_size(path):
+    path = Path(path)
+    if not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def vector_bytes(db_root="db"):
+    root = Path(db_root)
+    return _dir_size(root / "vectorstore") + _dir_size(root / "vectors")
+
+
+def document_bytes():
+    return _dir_size(render.DOCUMENT_DIR) + _dir_size(render.RENDER_CACHE_DIR)
+
+
+def database_bytes(engine=None):
+    """On-disk size of the app's tables (SQLite file or Postgres relations)."""
+    engine = engine or logic.get_db_engine()
+    if engine.dialect.name == "sqlite":
+        database = engine.url.database
+        return os.path.getsize(database) if database and os.path.exists(database) else 0
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            return sum(
+                conn.execute(
+                    text("SELECT pg_total_relation_size(CAST(:t AS regclass))"), {"t": t}
+                ).scalar()
+                or 0
+                for t in logic.Base.metadata.tables
+            )
+    return 0
+
+
+def _referenced_collections(session):
+    names = session.query(Chat.file_name).filter(Chat.file_name.isnot(None)).distinct()
+    return {logic.clean_filename(name) for (name,) in names}
+
+
+def _is_young(collection, db_root="db", grace_seconds=ORPHAN_GRACE_SECONDS):
+    written = vectorstores.list_collections(db_root).get(collection)
+    return written is not None and written > time.time() - grace_seconds
+
+
+def _release_document(session, user_id, file_name, db_root="db"):
+    """
+    Drops tables/collection for `file_name` once no chat references them.
+    Young collections and ones being ingested are left to sweep_orphans:
+    an upload of the same file may not have saved its chat yet.
+    """
+    report = {"tables": 0, "collections": 0}
+    if file_name is None:
+        return report
+    collection = logic.clean_filename(file_name)
+    if _is_young(collection, db_root):
+        return report
+    try:
+        # Uploads hold this lock until their chat is saved, so the checks
+        # below cannot miss a chat that is about to appear.
+        with coordination.collection_lock(collection, timeout=0):
+            user_has_chat = session.query(
+                exists().where(and_(Chat.user_id == user_id, Chat.file_name == file_name))
+            ).scalar()
+            if not user_has_chat:
+                report["tables"] = (
+                    session.query(TableData)
+                    .filter(TableData.user_id == user_id, TableData.file_name == file_name)
+                    .delete(synchronize_session=False)
+                )
+                session.commit()
+            if collection not in _referenced_collections(session):
+                report["collections"] = int(vectorstores.drop_collection(collection, db_root))
+    except coordination.LockTimeout:
+        pass
+    return report
+
+
+def _release_pdf(session, doc_sha256):
+    """Drops a stored PDF and its renders once no chat references it."""
+    if doc_sha256 is None:
+        return 0
+    if session.query(exists().where(Chat.doc_sha256 == doc_sha256)).scalar():
+        return 0
+    path = render.document_path(doc_sha256)
+    if path.exists() and path.stat().st_mtime > time.time() - ORPHAN_GRACE_SECONDS:
+        return 0  # may be re-uploaded right now; sweep_documents gets it later
+    render.drop_document(doc_sha256)
+    return 1
+
+
+def _drop_unless_ingesting(collection, db_root):
+    try:
+        with coordination.collection_lock(collection, timeout=0):
+            return vectorstores.drop_collection(collection, db_root)
+    except coordination.LockTimeout:
+        return False
+
+
+def delete_chat_cascade(chat_id, db_root="db"):
+    """
+    Deletes a chat plus its now-unreferenced tables and collection.
+    Returns None if the chat does not exist, else a report dict.
+    """
+    session = logic.get_db_session()
+    try:
+        chat = (
+            session.query(Chat.user_id, Chat.file_name, Chat.doc_sha256)
+            .filter(Chat.id == chat_id)
+            .first()
+        )
+        if chat is None:
+            return None
+        session.query(Chat).filter(Chat.id == chat_id).delete(synchronize_session=False)
+        session.commit()
+        report = _release_document(session, chat.user_id, chat.file_name, db_root)
+        report["documents"] = _release_pdf(session, chat.doc_sha256)
+    finally:
+        session.close()
+    DELETED.inc(kind="chats")
+    for kind in ("tables", "collections", "documents"):
+        if report[kind]:
+            DELETED.inc(report[kind], kind=kind)
+    return report
+
+
+def apply_retention(session, now, chat_days=CHAT_RETENTION_DAYS, pdf_days=PDF_RETENTION_DAYS):
+    report = {"chats_expired": 0, "pdfs_compacted": 0, "pdf_bytes": 0}
+    if chat_days > 0:
+        cutoff = now - datetime.timedelta(days=chat_days)
+        report["chats_expired"] = (
+            session.query(Chat).filter(Chat.timestamp < cutoff).delete(synchronize_session=False)
+        )
+    if pdf_days > 0:
+        cutoff = now - datetime.timedelta(days=pdf_days)
+        stale = session.query(Chat).filter(
+            Chat.timestamp < cutoff, or_(Chat.pdf_b64.isnot(None), Chat.doc_sha256.isnot(None))
+        )
+        report["pdf_bytes"] = int(
+            stale.with_entities(func.coalesce(func.sum(func.length(Chat.pdf_b64)), 0)).scalar()
+        )
+        # Stored documents are deleted by sweep_documents once unreferenced.
+        report["pdfs_compacted"] = stale.update(
+            {Chat.pdf_b64: None, Chat.doc_sha256: None}, synchronize_session=False
+        )
+    session.commit()
+    return report
+
+
+def sweep_orphans(session, db_root="db", grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Removes tables and collections no chat refers to any more."""
+    referenced = _referenced_collections(session)
+    cutoff = time.time() - grace_seconds
+    collections = vectorstores.list_collections(db_root)
+    young = {name for name, written in collections.items() if written > cutoff}
+
+    dropped = 0
+    for name, written in collections.items():
+        if name not in referenced and name not in young:
+            dropped += _drop_unless_ingesting(name, db_root)
+
+    orphaned = session.query(TableData.id).filter(
+        ~exists().where(
+            and_(Chat.user_id == TableData.user_id, Chat.file_name == TableData.file_name)
+        )
+    )
+    ids = [
+        table_id
+        for table_id, file_name in orphaned.add_columns(TableData.file_name)
+        if logic.clean_filename(file_name or "") not in young
+    ]
+    tables = 0
+    for start in range(0, len(ids), 500):
+        tables += (
+            session.query(TableData)
+            .filter(TableData.id.in_(ids[start : start + 500]))
+            .delete(synchronize_session=False)
+        )
+    session.commit()
+    return {"tables": tables, "collections": dropped}
+
+
+def sweep_documents(session, grace_seconds=ORPHAN_GRACE_SECONDS):
+    """Removes stored PDFs (and their renders) no chat refers to any more."""
+    referenced = {
+        sha for (sha,) in session.query(Chat.doc_sha256).filter(Chat.doc_sha256.isnot(None)).distinct()
+    }
+    cutoff = time.time() - grace_seconds
+    dropped = 0
+    for sha, stored in render.list_documents().items():
+        # Young documents may belong to an upload whose chat is not saved yet.
+        if sha not in referenced and stored <= cutoff:
+            render.drop_document(sha)
+            dropped += 1
+    return dropped
+
+
+def compact_database(engine=None):
+    """VACUUMs the database so freed pages are returned to the filesystem."""
+    engine = engine or logic.get_db_engine()
+    if engine.dialect.name not in ("sqlite", "postgresql"):
+        return
+    # VACUUM cannot run inside a transaction.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("VACUUM"))
+        else:
+            for table in logic.Base.metadata.tables:
+                conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+
+
+def run_maintenance(db_root="db", now=None, vacuum=MAINTENANCE_VACUUM):
+    """Runs one full maintenance pass and returns a report dict."""
+    started = time.perf_counter()
+    now = now or datetime.datetime.utcnow()
+    vectors_before = vector_bytes(db_root)
+    db_before = database_bytes()
+    documents_before = document_bytes()
+
+    session = logic.get_db_session()
+    try:
+        retention = apply_retention(session, now, CHAT_RETENTION_DAYS, PDF_RETENTION_DAYS)
+        orphans = sweep_orphans(session, db_root, ORPHAN_GRACE_SECONDS)
+        documents = sweep_documents(session, ORPHAN_GRACE_SECONDS)
+    finally:
+        session.close()
+    render.trim_cache()
+    if vacuum:
+        try:
+            compact_database()
+        except Exception as e:
+            print(f"Database compaction failed: {e}")
+        try:
+            vectorstores.compact(db_root)
+        except Exception as e:
+            print(f"Vector store compaction failed: {e}")
+
+    reclaimed = {
+        "vectors": max(vectors_before - vector_bytes(db_root), 0),
+        "database": max(db_before - database_bytes(), 0),
+        "documents": max(documents_before - document_bytes(), 0),
+    }
+    report = {
+        "chats_expired": retention["chats_expired"],
+        "pdfs_compacted": retention["pdfs_compacted"],
+        "tables_deleted": orphans["tables"],
+        "collections_deleted": orphans["collections"],
+        "documents_deleted": documents,
+        "pdf_b64_bytes_dropped": retention["pdf_bytes"],
+        "bytes_reclaimed": reclaimed,
+        "bytes_reclaimed_total": sum(reclaimed.values()),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    for kind, key in (
+        ("chats", "chats_expired"),
+        ("pdfs", "pdfs_compacted"),
+        ("tables", "tables_deleted"),
+        ("collections", "collections_deleted"),
+        ("documents", "documents_deleted"),
+    ):
+        if report[key]:
+            DELETED.inc(report[key], kind=kind)
+    for kind, value in reclaimed.items():
+        if value:
+            RECLAIMED_BYTES.inc(value, kind=kind)
+    LAST_RUN.set(time.time())
+    return report
+
+
+_stop = threading.Event()
+_sweeper = None
+
+
+def start_sweeper(interval=MAINTENANCE_INTERVAL_SECONDS, db_root="db"):
+    """Starts the periodic maintenance thread (no-op if interval <= 0)."""
+    global _sweeper
+    if interval <= 0 or (_sweeper is not None and _sweeper.is_alive()):
+        return _sweeper
+
+    def loop():
+        while not _stop.wait(interval):
+            try:
+                # Only one worker sweeps at a time; the others skip this round.
+                with coordination.lock("maintenance", timeout=0):
+                    print(f"Maintenance: {json.dumps(run_maintenance(db_root))}")
+            except coordination.LockTimeout:
+                pass
+            except Exception as e:
+                print(f"Maintenance run failed: {e}")
+
+    _stop.clear()
+    _sweeper = threading.Thread(target=loop, name="maintenance", daemon=True)
+    _sweeper.start()
+    return _sweeper
+
+
+def stop_sweeper():
+    _stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one maintenance pass.")
+    parser.add_argument("--db-root", default="db", help="Directory holding the vector stores")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip database compaction")
+    args = parser.parse_args(argv)
+    logic.init_db()
+    print(json.dumps(run_maintenance(args.db_root, vacuum=not args.no_vacuum), indent=2))
+
+
+if __name__ == "__main__":
+    main()
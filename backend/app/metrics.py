@@ -0,0 +1,251 @@
+"""
+Lightweight in-process metrics with a Prometheus text exposition endpoint,
+plus per-request stage spans.
+
+We intentionally avoid a hard dependency on prometheus_client: the metric
+types here cover what the API needs (counters, gauges, histograms with
+labels) and `render()` emits the standard text format on `/metrics`.
+"""
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_REGISTRY = []
+_COLLECTORS = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+            for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                labels = _format_labels(self.labelnames, key, le)
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def register_collector(fn):
+    """Registers a callable run before each scrape (e.g. to refresh gauges)."""
+    _COLLECTORS.append(fn)
+    return fn
+
+
+def render():
+    for fn in list(_COLLECTORS):
+        try:
+            fn()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return "\n".join(m.render() for m in _REGISTRY) + "\n"
+
+
+# --- Application metrics ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "pdfretriever_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ["method", "route", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "pdfretriever_stage_duration_seconds",
+    "Time spent in each ingest/query pipeline stage.",
+    ["stage"],
+)
+STAGE_ERRORS = Counter(
+    "pdfretriever_stage_errors_total",
+    "Pipeline stages that raised an exception.",
+    ["stage"],
+)
+LLM_REQUESTS = Counter(
+    "pdfretriever_llm_requests_total",
+    "Calls made to the LLM / embedding APIs.",
+    ["model", "operation", "outcome"],
+)
+LLM_SECONDS = Histogram(
+    "pdfretriever_llm_request_duration_seconds",
+    "Latency of LLM / embedding API calls.",
+    ["model", "operation"],
+)
+LLM_TOKENS = Counter(
+    "pdfretriever_llm_tokens_total",
+    "Tokens reported by the LLM API.",
+    ["model", "operation", "kind"],
+)
+CACHE_REQUESTS = Counter(
+    "pdfretriever_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss).",
+    ["cache", "result"],
+)
+DB_POOL = Gauge(
+    "pdfretriever_db_pool_connections",
+    "Database connection pool state.",
+    ["state"],
+)
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_llm_call(model, operation, seconds, outcome="ok", usage=None):
+    """Records latency, outcome and (if reported) token usage for one LLM call."""
+    LLM_REQUESTS.inc(model=model, operation=operation, outcome=outcome)
+    LLM_SECONDS.observe(seconds, model=model, operation=operation)
+    for kind, count in (usage or {}).items():
+        if count:
+            LLM_TOKENS.inc(count, model=model, operation=operation, kind=kind)
+
+
+# --- Per-request tracing ---
+_current_trace = contextvars.ContextVar("pdfretriever_trace", default=None)
+
+
+@contextmanager
+def trace():
+    """
+    Collects the spans recorded while handling one request. Yields the list
+    of (stage, seconds) tuples; it is shared with worker threads that inherit
+    the context (e.g. via run_in_threadpool).
+    """
+    spans = []
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+def current_spans():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage):
+    """Times a pipeline stage into STAGE_SECONDS and the current request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        spans = _current_trace.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def server_timing(spans):
+    """Formats spans as a Server-Timing header value (durations in ms)."""
+    parts = []
+    for stage, seconds in spans:
+        name = "".join(c if c.isalnum() or c in "-_" else "_" for c in stage)
+        parts.append(f'{name};dur={seconds * 1000:.1f};desc="{stage}"')
+    return ", ".join(parts)
@@ -0,0 +1,112 @@
+"""
+LangChain VectorStore over a NumpyIndex directory (VECTOR_BACKEND=numpy).
+
+Kept apart from vectorstores.py so the LangChain base class is only
+imported once a NumPy store is opened.
+"""
+
+import uuid
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from .vectorstores import VECTOR_QUANTIZATION, _write_lock, append_index, evict_index, load_index
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    LangChain VectorStore over a NumpyIndex directory. A `buffered` store
+    holds added texts in memory until `flush()`, which appends them to the
+    index in one write; searches only see flushed rows.
+    """
+
+    def __init__(self, path, embedding_function, quantization=VECTOR_QUANTIZATION, buffered=False):
+        self.path = Path(path)
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self._pending = [] if buffered else None
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    def add_texts(self, texts, metadatas=None, *, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        new_vectors = np.asarray(self.embedding_function.embed_documents(texts), dtype=np.float32)
+        new_records = [
+            {"id": i, "page_content": t, "metadata": m or {}}
+            for i, t, m in zip(ids, texts, metadatas)
+        ]
+        if self._pending is not None:
+            self._pending.append((new_vectors, new_records))
+        else:
+            self._append(new_vectors, new_records)
+        return ids
+
+    def flush(self):
+        """Appends the texts buffered since the last flush to the index."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._append(
+            np.vstack([vectors for vectors, _ in pending]),
+            [record for _, records in pending for record in records],
+        )
+
+    def _append(self, vectors, records):
+        with _write_lock(str(self.path.resolve())):
+            append_index(self.path, vectors, records, self.quantization)
+            evict_index(self.path)
+
+    def _to_docs(self, index, hits):
+        out = []
+        for i, similarity in hits:
+            record = index.records[i]
+            doc = Document(
+                page_content=record["page_content"],
+                metadata=record["metadata"],
+                id=record.get("id"),
+            )
+            out.append((doc, 1.0 - similarity))
+        return out
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        """(doc, cosine distance) pairs, closest first (same contract as Chroma)."""
+        index = load_index(self.path)
+        if index is None:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self._to_docs(index, index.top_k(query, k, filter))
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_relevance_scores(
+                embedding, k, filter
+            )
+        ]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, path, ids=None, **kwargs):
+        store = cls(path, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
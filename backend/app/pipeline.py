@@ -0,0 +1,182 @@
+"""
+A small staged pipeline: worker threads connected by bounded queues.
+
+    with Pipeline("ingest") as p:
+        p.add_stage("embed", embed_batch, batch_size=16)
+        p.add_stage("tables", store_tables)
+        for item in source:
+            p.put("embed", item)
+
+Each stage drains its own queue with `workers` threads, so independent
+stages overlap. A stage whose `fn` returns a list feeds those items to its
+`downstream` stage. Queues are bounded: a producer blocks when a stage falls
+behind (backpressure), and the time it spends blocked is reported.
+
+Batching stages take whatever is queued, up to `batch_size`, and never wait
+for a batch to fill, so items are processed as they arrive.
+
+Leaving the `with` block closes the stages in the order they were added,
+waits for them, and re-raises the first error. Each stage's busy time goes
+to STAGE_SECONDS and the request's Server-Timing under "<pipeline>.<stage>".
+"""
+
+import os
+import time
+import queue
+import threading
+import contextvars
+
+from . import metrics
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+
+_CLOSE = object()
+
+STAGE_BLOCKED_SECONDS = metrics.Histogram(
+    "pdfretriever_pipeline_blocked_seconds",
+    "Time producers spent blocked on a full stage queue (backpressure).",
+    ["stage"],
+)
+
+
+class _Stage:
+    def __init__(self, pipeline, name, fn, workers, batch_size, maxsize, downstream):
+        self.pipeline = pipeline
+        self.name = name
+        self.fn = fn
+        self.batch_size = batch_size
+        self.downstream = downstream
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.threads = [
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._work,),
+                name=f"{pipeline.name}-{name}-{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+
+    def put(self, item):
+        start = time.perf_counter()
+        self.queue.put(item)
+        waited = time.perf_counter() - start
+        if waited > 0.001:
+            with self.lock:
+                self.blocked += waited
+
+    def _next(self):
+        """Returns (work, closed): one item or a batch, and whether _CLOSE was seen."""
+        item = self.queue.get()
+        if item is _CLOSE:
+            return None, True
+        if self.batch_size <= 1:
+            return item, False
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self):
+        closed = False
+        while not closed:
+            work, closed = self._next()
+            if work is None:
+                continue
+            if self.pipeline.error is not None:
+                continue  # drain without processing so producers never block forever
+            start = time.perf_counter()
+            try:
+                outputs = self.fn(work)
+            except BaseException as e:
+                metrics.STAGE_ERRORS.inc(stage=f"{self.pipeline.name}.{self.name}")
+                self.pipeline.fail(e)
+                continue
+            finally:
+                with self.lock:
+                    self.busy += time.perf_counter() - start
+                    self.items += len(work) if self.batch_size > 1 else 1
+            if outputs and self.downstream is not None:
+                for out in outputs:
+                    self.pipeline.put(self.downstream, out)
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(_CLOSE)
+        for thread in self.threads:
+            thread.join()
+
+
+class Pipeline:
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.error = None
+        self._error_lock = threading.Lock()
+        self._spans = metrics.current_spans()
+        self._started = time.perf_counter()
+
+    def add_stage(
+        self, name, fn, workers=1, batch_size=1, maxsize=PIPELINE_QUEUE_SIZE, downstream=None
+    ):
+        stage = _Stage(self, name, fn, workers, batch_size, maxsize, downstream)
+        self.stages[name] = stage
+        for thread in stage.threads:
+            thread.start()
+        return self
+
+    def put(self, stage, item):
+        """Queues `item` for `stage`, blocking while that stage's queue is full."""
+        self.stages[stage].put(item)
+
+    def fail(self, error):
+        with self._error_lock:
+            if self.error is None:
+                self.error = error
+
+    def close(self):
+        for stage in self.stages.values():
+            stage.close()
+        for stage in self.stages.values():
+            label = f"{self.name}.{stage.name}"
+            metrics.STAGE_SECONDS.observe(stage.busy, stage=label)
+            STAGE_BLOCKED_SECONDS.observe(stage.blocked, stage=label)
+            if self._spans is not None:
+                self._spans.append((label, stage.busy))
+        if self.error is not None:
+            raise self.error
+
+    def timings(self):
+        """Per-stage items processed, busy seconds and producer-blocked seconds."""
+        return {
+            name: {
+                "items": s.items,
+                "busy_s": round(s.busy, 4),
+                "blocked_s": round(s.blocked, 4),
+            }
+            for name, s in self.stages.items()
+        } | {"wall_s": round(time.perf_counter() - self._started, 4)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.fail(exc)
+            try:
+                self.close()
+            except BaseException:
+                pass
+            return False
+        self.close()
+        return False
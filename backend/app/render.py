@@ -0,0 +1,301 @@
+"""
+Stored documents and server-side page rendering for the PDF viewer.
+
+- Uploaded PDFs are stored once per content hash under DOCUMENT_DIR as
+  `<sha256>.pdf`; chats refer to them by `doc_sha256`.
+- Page images are rendered on demand, at the requested DPI, in a process
+  pool (RENDER_WORKERS). pdf2image is used when poppler is installed,
+  pypdfium2 otherwise (RENDER_ENGINE).
+- Rendered pages are cached on disk under RENDER_CACHE_DIR by (document,
+  page, dpi). When the cache exceeds RENDER_CACHE_MAX_MB, the least
+  recently used images are deleted. Concurrent requests for the same page
+  share one render.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from io import BytesIO
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from . import metrics
+
+DOCUMENT_DIR = os.getenv("DOCUMENT_DIR", os.path.join("db", "documents"))
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join("db", "render_cache"))
+RENDER_CACHE_MAX_MB = float(os.getenv("RENDER_CACHE_MAX_MB", "512"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", "auto").lower()  # auto | pdf2image | pdfium
+RENDER_FORMAT = os.getenv("RENDER_FORMAT", "png").lower()  # png | jpeg | webp
+RENDER_DEFAULT_DPI = int(os.getenv("RENDER_DEFAULT_DPI", "110"))
+RENDER_MIN_DPI = 12
+RENDER_MAX_DPI = int(os.getenv("RENDER_MAX_DPI", "300"))
+THUMBNAIL_DPI = int(os.getenv("THUMBNAIL_DPI", "20"))
+# Evict down to this fraction of the limit, so eviction does not run on every write.
+_EVICT_TO = 0.9
+
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class DocumentNotFound(Exception):
+    """Raised when a stored document is missing."""
+
+
+class PageOutOfRange(ValueError):
+    """Raised for a page number the document does not have."""
+
+
+# --- Document store ---
+def document_path(sha256, root=None):
+    if not _SHA256.match(sha256 or ""):
+        raise DocumentNotFound(f"Invalid document id {sha256!r}")
+    return Path(root or DOCUMENT_DIR) / f"{sha256}.pdf"
+
+
+def store_document(upload, root=None):
+    """
+    Copies a spooled upload (see uploads.StoredUpload) into the document
+    store unless that content is already there. Returns its sha256.
+    """
+    path = document_path(upload.sha256, root)
+    if path.exists():
+        os.utime(path)  # keep it clear of the orphan sweep's grace period
+        return upload.sha256
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(upload.path, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return upload.sha256
+
+
+def list_documents(root=None):
+    """{sha256: mtime} of every stored document."""
+    base = Path(root or DOCUMENT_DIR)
+    if not base.exists():
+        return {}
+    return {
+        p.stem: p.stat().st_mtime for p in base.glob("*.pdf") if _SHA256.match(p.stem)
+    }
+
+
+def drop_document(sha256, root=None, cache_root=None):
+    """Deletes a stored document and its rendered pages. Returns bytes freed."""
+    freed = 0
+    path = document_path(sha256, root)
+    if path.exists():
+        freed += path.stat().st_size
+        path.unlink()
+    cache_dir = _cache_dir(sha256, cache_root)
+    if cache_dir.exists():
+        rendered = sum(f.stat().st_size for f in cache_dir.glob("*") if f.is_file())
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        _cache.adjust(-rendered)
+        freed += rendered
+    page_count.cache_clear()
+    return freed
+
+
+@lru_cache(maxsize=1024)
+def page_count(sha256, root=None):
+    import pypdfium2 as pdfium
+
+    path = document_path(sha256, root)
+    if not path.exists():
+        raise DocumentNotFound(sha256)
+    pdf = pdfium.PdfDocument(str(path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+# --- Rendering (runs in the process pool) ---
+def _engine():
+    if RENDER_ENGINE != "auto":
+        return RENDER_ENGINE
+    return "pdf2image" if shutil.which("pdftoppm") else "pdfium"
+
+
+def _render(path, page, dpi, fmt, engine):
+    """Renders one page to encoded image bytes."""
+    if engine == "pdf2image":
+        from pdf2image import convert_from_path
+
+        image = convert_from_path(path, dpi=dpi, first_page=page, last_page=page)[0]
+    else:
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(path)
+        try:
+            image = pdf[page - 1].render(scale=dpi / 72).to_pil()
+        finally:
+            pdf.close()
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    out = BytesIO()
+    image.save(out, format=fmt.upper(), optimize=fmt == "png")
+    return out.getvalue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: never fork a process that already runs server threads.
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(RENDER_WORKERS, 1),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# --- Disk cache ---
+def _cache_dir(sha256, root=None):
+    return Path(root or RENDER_CACHE_DIR) / sha256[:2] / sha256
+
+
+def _cache_path(sha256, page, dpi, fmt, root=None):
+    return _cache_dir(sha256, root) / f"{page}_{dpi}.{fmt}"
+
+
+class _CacheSize:
+    """Approximate bytes under RENDER_CACHE_DIR, recounted on every eviction."""
+
+    def __init__(self):
+        self.bytes = None
+        self.lock = threading.Lock()
+
+    def adjust(self, delta):
+        with self.lock:
+            if self.bytes is not None:
+                self.bytes = max(self.bytes + delta, 0)
+
+    def add(self, size, root=None):
+        limit = RENDER_CACHE_MAX_MB * 1024 * 1024
+        with self.lock:
+            if self.bytes is None:
+                self.bytes = _scan(root)[1]
+            self.bytes += size
+            over = limit > 0 and self.bytes > limit
+        if over:
+            trim_cache(limit * _EVICT_TO, root)
+
+
+_cache = _CacheSize()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _scan(root=None):
+    base = Path(root or RENDER_CACHE_DIR)
+    entries = []
+    if base.exists():
+        for f in base.glob("*/*/*"):
+            if f.suffix != ".tmp":
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, f))
+    return entries, sum(size for _, size, _ in entries)
+
+
+def trim_cache(target_bytes=None, root=None):
+    """Deletes least recently used images until the cache fits. Returns bytes freed."""
+    if target_bytes is None:
+        target_bytes = RENDER_CACHE_MAX_MB * 1024 * 1024 * _EVICT_TO
+    entries, total = _scan(root)
+    freed = 0
+    for _, size, f in sorted(entries, key=lambda e: e[0]):
+        if total - freed <= target_bytes:
+            break
+        try:
+            f.unlink()
+            freed += size
+        except FileNotFoundError:
+            pass
+    with _cache.lock:
+        _cache.bytes = total - freed
+    return freed
+
+
+def cache_bytes(root=None):
+    return _scan(root)[1]
+
+
+def clamp_dpi(dpi):
+    return min(max(int(dpi or RENDER_DEFAULT_DPI), RENDER_MIN_DPI), RENDER_MAX_DPI)
+
+
+def etag(sha256, page, dpi, fmt=None):
+    return f'"{sha256[:16]}-{page}-{dpi}.{fmt or RENDER_FORMAT}"'
+
+
+def page_image(sha256, page, dpi=None, fmt=None, root=None, cache_root=None):
+    """
+    Path of the rendered image for `page` (1-based) at `dpi`, rendering it
+    in the process pool on a cache miss.
+    """
+    fmt = fmt or RENDER_FORMAT
+    dpi = clamp_dpi(dpi)
+    source = document_path(sha256, root)
+    cached = _cache_path(sha256, page, dpi, fmt, cache_root)
+    if cached.exists():
+        metrics.cache_lookup("render", True)
+        os.utime(cached)  # LRU: mtime is the last use
+        return cached
+    metrics.cache_lookup("render", False)
+    if not source.exists():
+        raise DocumentNotFound(sha256)
+    if not 1 <= page <= page_count(sha256, root):
+        raise PageOutOfRange(f"Page {page} is out of range")
+
+    key = (sha256, page, dpi, fmt)
+    with _inflight_lock:
+        done = _inflight.get(key)
+        owner = done is None
+        if owner:
+            done = _inflight[key] = Future()
+    if not owner:
+        return done.result()  # another request is rendering this page
+
+    try:
+        with metrics.span("render.page"):
+            data = _get_pool().submit(_render, str(source), page, dpi, fmt, _engine()).result()
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cached.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, cached)
+        _cache.add(len(data), cache_root)
+        done.set_result(cached)
+    except BaseException as e:
+        done.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return cached
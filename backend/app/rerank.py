@@ -0,0 +1,143 @@
+"""
+Second-stage re-ranking of retrieved chunks on the local CPU.
+
+Retrieval fetches RERANK_CANDIDATES chunks by vector similarity; a reranker
+rescores them against the query and only the best QUERY_TOP_K go on to the
+prompt. Two scorers are available:
+
+- "lexical" (default): BM25 over the candidate set blended with the vector
+  relevance, plus a small bonus for section titles matching the query.
+- "onnx": a cross-encoder exported to ONNX, used when RERANK_ONNX_MODEL points
+  to a directory containing `model.onnx` and `tokenizer.json`. It is loaded
+  once per process; if loading fails we fall back to the lexical scorer.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import Counter
+
+from .context import query_terms, tokenize
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_ONNX_MODEL = os.getenv("RERANK_ONNX_MODEL")
+# Weight of the lexical score vs. the original vector relevance (0..1).
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.6"))
+RERANK_MAX_LENGTH = 512
+
+
+def _normalize(scores):
+    lo, hi = min(scores), max(scores)
+    if hi - lo < 1e-12:
+        return [0.5 for _ in scores]
+    return [(s - lo) / (hi - lo) for s in scores]
+
+
+class LexicalReranker:
+    name = "lexical"
+
+    def __init__(self, k1=1.2, b=0.75, weight=RERANK_LEXICAL_WEIGHT):
+        self.k1 = k1
+        self.b = b
+        self.weight = weight
+
+    def score(self, query, scored_docs):
+        terms = query_terms(query)
+        tokenized = [tokenize(doc.page_content) for doc, _ in scored_docs]
+        n = len(tokenized)
+        avg_len = sum(len(t) for t in tokenized) / n or 1.0
+        doc_freq = Counter(w for tokens in tokenized for w in set(tokens) if w in terms)
+
+        bm25 = []
+        for (doc, _), tokens in zip(scored_docs, tokenized):
+            tf = Counter(w for w in tokens if w in terms)
+            length_norm = self.k1 * (1 - self.b + self.b * len(tokens) / avg_len)
+            total = 0.0
+            for term, freq in tf.items():
+                idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                total += idf * freq * (self.k1 + 1) / (freq + length_norm)
+            title_terms = query_terms(str(doc.metadata.get("title", "")))
+            if terms and title_terms:
+                total += len(terms & title_terms) / len(terms)
+            bm25.append(total)
+
+        lexical = _normalize(bm25)
+        vector = _normalize([score for _, score in scored_docs])
+        return [self.weight * l + (1 - self.weight) * v for l, v in zip(lexical, vector)]
+
+
+class OnnxCrossEncoder:
+    name = "onnx"
+
+    def __init__(self, model_dir):
+        import numpy as np
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self._np = np
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=RERANK_MAX_LENGTH)
+        self.tokenizer.enable_padding()
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def score(self, query, scored_docs):
+        np = self._np
+        encodings = self.tokenizer.encode_batch(
+            [(query, doc.page_content) for doc, _ in scored_docs]
+        )
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        return [float(row[-1]) if np.ndim(row) else float(row) for row in logits]
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                if RERANK_ONNX_MODEL:
+                    try:
+                        _reranker = OnnxCrossEncoder(RERANK_ONNX_MODEL)
+                    except Exception as e:
+                        print(f"Could not load ONNX reranker, using lexical: {e}")
+                if _reranker is None:
+                    _reranker = LexicalReranker()
+    return _reranker
+
+
+def rerank(query, scored_docs, k):
+    """
+    Rescores (doc, relevance) pairs and returns the best `k` as
+    (doc, rerank_score) pairs, plus stats for usage reporting.
+    """
+    start = time.perf_counter()
+    reranker = get_reranker()
+    if len(scored_docs) <= 1:
+        ranked = list(scored_docs)
+    else:
+        scores = reranker.score(query, scored_docs)
+        ranked = sorted(
+            ((doc, score) for (doc, _), score in zip(scored_docs, scores)),
+            key=lambda pair: pair[1],
+            reverse=True,
+        )
+    stats = {
+        "reranker": reranker.name,
+        "candidates": len(scored_docs),
+        "kept": min(k, len(ranked)),
+        "rerank_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    return ranked[:k], stats
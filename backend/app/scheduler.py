@@ -0,0 +1,277 @@
+"""
+Central admission control for calls to the Gemini APIs.
+
+Every LLM/embedding call goes through `llm_slot(...)`, which enforces:
+- a token bucket per API key (requests/minute with a burst allowance),
+- a global cap on in-flight calls, of which background calls may only use
+  LLM_BACKGROUND_MAX_CONCURRENCY so interactive calls always find a slot,
+- strict priority of interactive traffic over background ingestion,
+- round-robin fairness between users within the same priority.
+
+Callers block in their worker thread until admitted, so this must only be
+used from threads (FastAPI's threadpool), never directly on the event loop.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from google.api_core import exceptions as google_exceptions
+
+from . import metrics
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "60"))
+LLM_BURST = float(os.getenv("LLM_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Slots background calls (ingestion, batch) may hold at once; the rest are
+# kept free for interactive queries. Defaults to three quarters of the cap.
+LLM_BACKGROUND_MAX_CONCURRENCY = int(
+    os.getenv("LLM_BACKGROUND_MAX_CONCURRENCY", str(max(1, LLM_MAX_CONCURRENCY * 3 // 4)))
+)
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "120"))
+# Background work (ingestion, batch queries) queues behind interactive calls
+# and can be many calls long, so it may wait longer for admission.
+LLM_BACKGROUND_QUEUE_TIMEOUT_SECONDS = float(
+    os.getenv("LLM_BACKGROUND_QUEUE_TIMEOUT_SECONDS", "600")
+)
+# How long a key is paused after the upstream API answers 429.
+LLM_QUOTA_BACKOFF_SECONDS = float(os.getenv("LLM_QUOTA_BACKOFF_SECONDS", "20"))
+
+QUEUE_DEPTH = metrics.Gauge(
+    "pdfretriever_llm_queue_depth",
+    "LLM calls waiting for admission.",
+    ["priority"],
+)
+IN_FLIGHT = metrics.Gauge(
+    "pdfretriever_llm_in_flight",
+    "LLM calls currently admitted.",
+    [],
+)
+QUEUE_WAIT_SECONDS = metrics.Histogram(
+    "pdfretriever_llm_queue_wait_seconds",
+    "Time LLM calls spent waiting for admission.",
+    ["priority"],
+)
+QUEUE_TIMEOUTS = metrics.Counter(
+    "pdfretriever_llm_queue_timeouts_total",
+    "LLM calls rejected after waiting too long for admission.",
+    ["priority"],
+)
+
+
+class LLMQueueTimeout(Exception):
+    """Raised when a call could not be admitted within the queue timeout."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, burst):
+        self.rate = rate_per_second
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until one token is available (0 if available now)."""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class _Ticket:
+    __slots__ = ("key", "user", "priority", "enqueued")
+
+    def __init__(self, key, user, priority):
+        self.key = key
+        self.user = user
+        self.priority = priority
+        self.enqueued = time.monotonic()
+
+
+def _key_id(api_key):
+    # Never keep raw API keys around as dict keys.
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        rate_per_minute=LLM_RATE_PER_MINUTE,
+        burst=LLM_BURST,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        background_max_concurrency=LLM_BACKGROUND_MAX_CONCURRENCY,
+        queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+        background_queue_timeout=LLM_BACKGROUND_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        # Always leave at least one slot to interactive calls.
+        self.limits = {
+            INTERACTIVE: max_concurrency,
+            BACKGROUND: max(1, min(background_max_concurrency, max_concurrency - 1)),
+        }
+        self.timeouts = {INTERACTIVE: queue_timeout, BACKGROUND: background_queue_timeout}
+        self._cond = threading.Condition()
+        self._buckets = {}
+        # priority -> OrderedDict(user -> deque[_Ticket]); order is the RR turn.
+        self._queues = {p: OrderedDict() for p in PRIORITIES}
+        self._in_flight = 0
+        self._in_flight_by = {p: 0 for p in PRIORITIES}
+
+    def admissible(self, priority):
+        """
+        Calls one API key can get admitted at `priority` within that
+        priority's queue timeout, starting from a full bucket.
+        """
+        timeout = self.timeouts[priority]
+        if not timeout:
+            return None
+        return int(self.burst + self.rate * timeout)
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _select(self, now):
+        """
+        Picks the next ticket to admit: highest priority first, users in
+        round-robin order, skipping users whose key is out of tokens and
+        priorities at their concurrency limit.
+        Returns (ticket, seconds until something may become admissible).
+        """
+        soonest = None
+        if self._in_flight >= self.max_concurrency:
+            return None, None
+        for priority in PRIORITIES:
+            if self._in_flight_by[priority] >= self.limits[priority]:
+                continue
+            for queue in self._queues[priority].values():
+                ticket = queue[0]
+                wait = self._bucket(ticket.key).wait_time(now)
+                if wait == 0:
+                    return ticket, None
+                soonest = wait if soonest is None else min(soonest, wait)
+        return None, soonest
+
+    def _dequeue(self, ticket):
+        users = self._queues[ticket.priority]
+        queue = users[ticket.user]
+        queue.remove(ticket)
+        if queue:
+            users.move_to_end(ticket.user)  # this user's turn is over
+        else:
+            del users[ticket.user]
+        QUEUE_DEPTH.dec(priority=ticket.priority)
+
+    def acquire(self, api_key, user=None, priority=INTERACTIVE, timeout=None):
+        """
+        Blocks until admitted. `timeout` defaults to the priority's queue
+        timeout; 0 waits indefinitely.
+        """
+        if timeout is None:
+            timeout = self.timeouts[priority]
+        ticket = _Ticket(_key_id(api_key), user, priority)
+        deadline = ticket.enqueued + timeout if timeout else None
+        with self._cond:
+            self._queues[priority].setdefault(user, deque()).append(ticket)
+            QUEUE_DEPTH.inc(priority=priority)
+            while True:
+                now = time.monotonic()
+                chosen, retry_in = self._select(now)
+                if chosen is ticket:
+                    self._bucket(ticket.key).take()
+                    self._dequeue(ticket)
+                    self._in_flight += 1
+                    self._in_flight_by[priority] += 1
+                    IN_FLIGHT.set(self._in_flight)
+                    QUEUE_WAIT_SECONDS.observe(now - ticket.enqueued, priority=priority)
+                    # Another waiter may now be at the head of its queue.
+                    self._cond.notify_all()
+                    return ticket
+                if deadline is not None and now >= deadline:
+                    self._dequeue(ticket)
+                    QUEUE_TIMEOUTS.inc(priority=priority)
+                    self._cond.notify_all()
+                    raise LLMQueueTimeout(
+                        f"LLM call not admitted within {timeout:.0f}s (rate limited)"
+                    )
+                if chosen is not None:
+                    # Someone else is admissible; let them go first.
+                    self._cond.notify_all()
+                wait = retry_in if retry_in is not None else 1.0
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+                self._cond.wait(max(wait, 0.001))
+
+    def release(self, ticket):
+        with self._cond:
+            self._in_flight -= 1
+            self._in_flight_by[ticket.priority] -= 1
+            IN_FLIGHT.set(self._in_flight)
+            self._prune(time.monotonic())
+            self._cond.notify_all()
+
+    def penalize(self, api_key, seconds=LLM_QUOTA_BACKOFF_SECONDS):
+        """Pauses a key after the upstream API reported quota exhaustion."""
+        with self._cond:
+            self._bucket(_key_id(api_key)).pause(seconds)
+
+    def _prune(self, now):
+        # Drop full, idle buckets that have no waiters so the dict stays small.
+        if len(self._buckets) < 256:
+            return
+        waiting = {
+            t.key for users in self._queues.values() for q in users.values() for t in q
+        }
+        for key in [k for k, b in self._buckets.items() if k not in waiting and b.idle(now)]:
+            del self._buckets[key]
+
+
+_scheduler = LLMScheduler()
+
+
+def get_scheduler():
+    return _scheduler
+
+
+@contextmanager
+def llm_slot(api_key, user=None, priority=INTERACTIVE):
+    """Blocks until the call may proceed; holds a concurrency slot while inside."""
+    scheduler = get_scheduler()
+    ticket = scheduler.acquire(api_key, user, priority)
+    try:
+        yield
+    except google_exceptions.ResourceExhausted:
+        scheduler.penalize(api_key)
+        raise
+    finally:
+        scheduler.release(ticket)
@@ -0,0 +1,67 @@
+import os
+import hashlib
+import tempfile
+
+# --- Upload Configuration ---
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # 1 MiB
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, limit):
+        super().__init__(f"Upload exceeds the {limit / (1024 * 1024):g} MB limit")
+        self.limit = limit
+
+
+class StoredUpload:
+    """
+    A file-backed upload spooled to disk.
+
+    Downstream stages read from `path` instead of passing `bytes` copies of
+    the whole document around.
+    """
+
+    def __init__(self, path, name, size, sha256):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.sha256 = sha256
+
+    def getvalue(self):
+        # Kept for callers that still expect an in-memory upload object.
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def spool_upload(file, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Streams an async upload (e.g. FastAPI's UploadFile) to a temp file in
+    fixed-size chunks, hashing on the fly and enforcing `max_bytes`.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=".pdf", dir=UPLOAD_TMP_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    return StoredUpload(path, file.filename, size, digest.hexdigest())
@@ -0,0 +1,429 @@
+"""
+Vector store backends behind `load_vectorstore` / `store_parsed_data`.
+
+VECTOR_BACKEND selects the engine:
+
+- "chroma" (default): langchain_chroma collections under <db_root>/vectorstore.
+- "numpy": an in-process engine with one directory per document under
+  <db_root>/vectors. Vectors are a float32 matrix (optionally int8 quantised)
+  memory-mapped from disk and searched with a vectorised cosine top-k.
+  Opened indexes are cached per process, so a query does not pay Chroma's
+  per-open overhead for small per-document collections.
+
+Both return LangChain VectorStore objects, so retrieval code is shared.
+The NumPy one lives in numpystore.py and is imported on first use, because
+LangChain's VectorStore base class is slow to import.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+import numpy as np
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+# "int8" stores quantised vectors (4x smaller) at a small recall cost.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+NUMPY_INDEX_CACHE_SIZE = int(os.getenv("NUMPY_INDEX_CACHE_SIZE", "64"))
+# Rows scored per block when dequantising int8 vectors.
+_SCORE_BLOCK_ROWS = 8192
+# A shared Chroma server (`chroma run`) instead of a local directory; needed
+# for the chroma backend when several workers or nodes serve the API.
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_SSL = os.getenv("CHROMA_SSL", "false").lower() in ("1", "true", "yes")
+_FORMAT_VERSION = 1
+
+
+# --- Chroma ---
+_CHROMA_CLIENTS = {}
+_CHROMA_LOCK = threading.Lock()
+
+
+def get_chroma_client(persist_directory):
+    """
+    One client per directory (or server) and process. Creating clients
+    concurrently from worker threads is not safe in chromadb. With
+    CHROMA_HOST set, `persist_directory` is ignored.
+    """
+    import chromadb
+
+    if CHROMA_HOST:
+        key = f"{'https' if CHROMA_SSL else 'http'}://{CHROMA_HOST}:{CHROMA_PORT}"
+    else:
+        key = str(Path(persist_directory).resolve())
+    with _CHROMA_LOCK:
+        client = _CHROMA_CLIENTS.get(key)
+        if client is None:
+            if CHROMA_HOST:
+                client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT, ssl=CHROMA_SSL)
+            else:
+                client = chromadb.PersistentClient(path=key)
+            _CHROMA_CLIENTS[key] = client
+    return client
+
+
+def _open_chroma(collection_name, embedding_function, db_root, collection_metadata=None):
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        client=get_chroma_client(Path(db_root) / "vectorstore"),
+        embedding_function=embedding_function,
+        collection_name=collection_name,
+        collection_metadata=collection_metadata,
+    )
+
+
+# --- Metadata filters (Chroma "where" syntax subset) ---
+_COMPARATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_filter(metadata, where):
+    """Evaluates a Chroma-style `where` filter against one metadata dict."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = metadata.get(key)
+            for op, operand in cond.items():
+                try:
+                    if not _COMPARATORS[op](value, operand):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != cond:
+            return False
+    return True
+
+
+# --- NumPy engine ---
+class NumpyIndex:
+    """
+    Immutable, memory-mapped view of one document's vectors and chunks.
+
+    Files in `path`: meta.json, docs.jsonl, and either vectors.f32.npy or
+    vectors.i8.npy + scales.npy. Rows are L2-normalised at write time, so a
+    dot product is the cosine similarity.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        meta_path = self.path / "meta.json"
+        self.mtime = meta_path.stat().st_mtime_ns
+        self.meta = json.loads(meta_path.read_text())
+        self.count = self.meta["count"]
+        self.dim = self.meta["dim"]
+        self.quantization = self.meta.get("quantization", "none")
+        if self.quantization == "int8":
+            self.vectors = np.load(self.path / "vectors.i8.npy", mmap_mode="r")
+            self.scales = np.load(self.path / "scales.npy")
+        else:
+            self.vectors = np.load(self.path / "vectors.f32.npy", mmap_mode="r")
+            self.scales = None
+        with open(self.path / "docs.jsonl", encoding="utf-8") as f:
+            self.records = [json.loads(line) for line in f]
+
+    @staticmethod
+    def exists(path):
+        return (Path(path) / "meta.json").exists()
+
+    def scores(self, query):
+        """Cosine similarity of the (normalised) query against every row."""
+        if self.scales is None:
+            return np.asarray(self.vectors @ query)
+        out = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, _SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start : start + _SCORE_BLOCK_ROWS], dtype=np.float32)
+            out[start : start + len(block)] = block @ query
+        return out * self.scales
+
+    def top_k(self, query, k, where=None):
+        if self.count == 0:
+            return []
+        scores = self.scores(query)
+        if where:
+            mask = np.fromiter(
+                (matches_filter(r["metadata"], where) for r in self.records),
+                dtype=bool,
+                count=self.count,
+            )
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+        k = min(k, self.count)
+        if k <= 0:
+            return []
+        if k < self.count:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(self.count)
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [(int(i), float(scores[i])) for i in idx]
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_int8(matrix):
+    """Symmetric per-row int8 quantisation; returns (int8 matrix, float32 scales)."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+def _encode_vectors(vectors, quantization):
+    """Normalises raw vectors into the arrays stored on disk, by file name."""
+    vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    if quantization == "int8":
+        q, scales = quantize_int8(vectors)
+        return {"vectors.i8.npy": q, "scales.npy": scales}
+    return {"vectors.f32.npy": vectors}
+
+
+def _write_files(path, arrays, records, quantization):
+    """
+    Atomically (re)writes an index directory: data files first, meta.json
+    last, so readers never see a half-written index.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    token = uuid.uuid4().hex[:8]
+
+    def replace(name, writer):
+        tmp = path / f".{name}.{token}.tmp"
+        with open(tmp, "wb") as f:
+            writer(f)
+        os.replace(tmp, path / name)
+
+    for name, array in arrays.items():
+        replace(name, lambda f: np.save(f, array))
+    vectors = next(iter(arrays.values()))
+    replace(
+        "docs.jsonl",
+        lambda f: f.write(
+            "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        ),
+    )
+    meta = {
+        "version": _FORMAT_VERSION,
+        "count": len(records),
+        "dim": int(vectors.shape[1]) if len(records) else 0,
+        "quantization": quantization,
+    }
+    replace("meta.json", lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+
+def write_index(path, vectors, records, quantization=VECTOR_QUANTIZATION):
+    """Writes `vectors` and their `records` as a new index, replacing any old one."""
+    _write_files(path, _encode_vectors(vectors, quantization), records, quantization)
+
+
+def append_index(path, vectors, records, quantization=VECTOR_QUANTIZATION):
+    """
+    Adds rows to the index at `path`, creating it if needed. Existing rows
+    are copied as stored, so int8 vectors are not re-quantised, and new
+    rows use the existing index's quantization. Callers hold the path's
+    write lock.
+    """
+    existing = load_index(path)
+    if existing is None or not existing.count:
+        write_index(path, vectors, records, quantization)
+        return
+    new = _encode_vectors(vectors, existing.quantization)
+    old = {"vectors.i8.npy": existing.vectors, "scales.npy": existing.scales}
+    if existing.scales is None:
+        old = {"vectors.f32.npy": existing.vectors}
+    arrays = {name: np.concatenate([np.asarray(old[name]), new[name]]) for name in new}
+    _write_files(path, arrays, existing.records + list(records), existing.quantization)
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+_write_locks = {}
+
+
+def load_index(path):
+    """Returns the cached NumpyIndex for `path`, reloading it if it changed on disk."""
+    key = str(Path(path).resolve())
+    if not NumpyIndex.exists(key):
+        return None
+    mtime = (Path(key) / "meta.json").stat().st_mtime_ns
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None and index.mtime == mtime:
+            _index_cache.move_to_end(key)
+            return index
+    index = NumpyIndex(key)
+    with _index_lock:
+        _index_cache[key] = index
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > NUMPY_INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def evict_index(path):
+    with _index_lock:
+        _index_cache.pop(str(Path(path).resolve()), None)
+
+
+def _write_lock(key):
+    with _index_lock:
+        return _write_locks.setdefault(key, threading.Lock())
+
+
+def numpy_index_path(collection_name, db_root="db"):
+    return Path(db_root) / "vectors" / collection_name
+
+
+def __getattr__(name):
+    if name == "NumpyVectorStore":
+        from .numpystore import NumpyVectorStore
+
+        return NumpyVectorStore
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --- Backend dispatch ---
+def open_store(
+    collection_name,
+    embedding_function,
+    db_root="db",
+    backend=None,
+    collection_metadata=None,
+    buffered=False,
+):
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        from .numpystore import NumpyVectorStore
+
+        return NumpyVectorStore(
+            numpy_index_path(collection_name, db_root), embedding_function, buffered=buffered
+        )
+    return _open_chroma(collection_name, embedding_function, db_root, collection_metadata)
+
+
+def create_store(collection_name, embedding_function, db_root="db", backend=None, buffered=False):
+    """
+    Opens a collection for writing, creating it if needed. With `buffered`,
+    a NumPy store keeps added texts in memory until `flush_store`, so an
+    ingest writes its index once instead of once per batch; Chroma stores
+    write as usual.
+    """
+    # The creation time lets the maintenance sweeper skip in-flight ingests.
+    return open_store(
+        collection_name,
+        embedding_function,
+        db_root,
+        backend,
+        collection_metadata={"created_at": time.time()},
+        buffered=buffered,
+    )
+
+
+def flush_store(store):
+    """Writes out what a buffered store holds back; a no-op for Chroma."""
+    flush = getattr(store, "flush", None)
+    if flush is not None:
+        flush()
+
+
+def build_store(documents, collection_name, embedding_function, db_root="db", backend=None):
+    """Embeds and adds `documents` to the collection, creating it if needed."""
+    store = create_store(collection_name, embedding_function, db_root, backend)
+    store.add_documents(documents)
+    return store
+
+
+def list_collections(db_root="db", backend=None):
+    """Maps collection name -> last write time (epoch seconds; 0 if unknown)."""
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        root = Path(db_root) / "vectors"
+        if not root.exists():
+            return {}
+        return {
+            path.name: (path / "meta.json").stat().st_mtime
+            for path in root.iterdir()
+            if NumpyIndex.exists(path)
+        }
+    if not CHROMA_HOST and not (Path(db_root) / "vectorstore").exists():
+        return {}
+    client = get_chroma_client(Path(db_root) / "vectorstore")
+    return {
+        c.name: float((c.metadata or {}).get("created_at", 0)) for c in client.list_collections()
+    }
+
+
+def drop_collection(collection_name, db_root="db", backend=None):
+    """Deletes a collection and its files. Returns False if it did not exist."""
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        path = numpy_index_path(collection_name, db_root)
+        if not path.exists():
+            return False
+        key = str(path.resolve())
+        with _write_lock(key):
+            evict_index(path)
+            shutil.rmtree(path, ignore_errors=True)
+        return True
+    client = get_chroma_client(Path(db_root) / "vectorstore")
+    try:
+        client.delete_collection(collection_name)
+        return True
+    except Exception:
+        return False
+
+
+def preload(collection_name, db_root="db", backend=None):
+    """Opens a collection ahead of time so the first query doesn't pay for it."""
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        return load_index(numpy_index_path(collection_name, db_root)) is not None
+    client = get_chroma_client(Path(db_root) / "vectorstore")
+    try:
+        client.get_collection(collection_name)
+        return True
+    except Exception:
+        return False
+
+
+def compact(db_root="db", backend=None):
+    """
+    Returns space freed by dropped collections to the filesystem. The NumPy
+    engine deletes files directly; Chroma keeps embeddings in SQLite, which
+    only shrinks on VACUUM (what `chroma utils vacuum` does).
+    """
+    backend = backend or VECTOR_BACKEND
+    path = Path(db_root) / "vectorstore" / "chroma.sqlite3"
+    if backend == "numpy" or CHROMA_HOST or not path.exists():
+        return
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
@@ -0,0 +1,159 @@
+"""
+Startup timing and warm-up.
+
+Module import time is checked against IMPORT_BUDGET_SECONDS. Heavy
+third-party modules (Google SDKs, Chroma, pdfplumber, pandas) are imported
+lazily by `logic`, so they should not appear in `sys.modules` by then.
+
+After the schema is created, a background thread warms the process before
+it reports ready on /ready:
+
+- opens WARMUP_DB_CONNECTIONS pooled DB connections,
+- re-encodes chat/table rows still stored as plain JSON (see codec.py),
+- opens the WARMUP_COLLECTIONS most recently used vector collections,
+- imports the heavy modules (WARMUP_IMPORTS) off the request path.
+
+Phase timings are exported as `pdfretriever_startup_seconds{phase=...}`.
+"""
+
+import os
+import sys
+import time
+import threading
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, text
+
+from . import logic, metrics, vectorstores
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "2"))
+WARMUP_COLLECTIONS = int(os.getenv("WARMUP_COLLECTIONS", "10"))
+WARMUP_IMPORTS = os.getenv("WARMUP_IMPORTS", "true").lower() in ("1", "true", "yes")
+
+HEAVY_MODULES = (
+    "google.generativeai",
+    "langchain_google_genai",
+    "langchain_chroma",
+    "chromadb",
+    "langchain_core.prompts",
+    "langchain_core.vectorstores",
+    "pdfplumber",
+    "pandas",
+)
+
+STARTUP_SECONDS = metrics.Gauge(
+    "pdfretriever_startup_seconds",
+    "Time spent in each startup phase.",
+    ["phase"],
+)
+
+_ready = threading.Event()
+_report = {"import_seconds": None, "eager_modules": [], "phases": {}, "errors": {}}
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def report():
+    return dict(_report, ready=is_ready())
+
+
+def record_import(seconds):
+    """Records how long importing the app took and flags eager heavy imports."""
+    eager = [m for m in HEAVY_MODULES if m in sys.modules]
+    _report["import_seconds"] = round(seconds, 4)
+    _report["eager_modules"] = eager
+    STARTUP_SECONDS.set(seconds, phase="import")
+    if seconds > IMPORT_BUDGET_SECONDS:
+        print(
+            f"App import took {seconds:.2f}s (budget {IMPORT_BUDGET_SECONDS:.2f}s); "
+            f"eagerly imported: {', '.join(eager) or 'none'}"
+        )
+
+
+def warm_database(connections=WARMUP_DB_CONNECTIONS):
+    """Opens `connections` pooled connections at once so they are reusable."""
+    engine = logic.get_db_engine()
+
+    def ping(_):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    with ThreadPoolExecutor(max_workers=max(connections, 1)) as pool:
+        list(pool.map(ping, range(max(connections, 1))))
+
+
+def hot_collections(limit=WARMUP_COLLECTIONS):
+    """File names of the most recently used chats, newest first."""
+    session = logic.get_db_session()
+    try:
+        last_used = func.max(logic.Chat.timestamp)
+        rows = (
+            session.query(logic.Chat.file_name, last_used)
+            .filter(logic.Chat.file_name.isnot(None))
+            .group_by(logic.Chat.file_name)
+            .order_by(last_used.desc())
+            .limit(limit)
+            .all()
+        )
+        return [file_name for file_name, _ in rows]
+    finally:
+        session.close()
+
+
+def warm_collections(limit=WARMUP_COLLECTIONS, db_root="db"):
+    opened = 0
+    for file_name in hot_collections(limit):
+        if vectorstores.preload(logic.clean_filename(file_name), db_root):
+            opened += 1
+    return opened
+
+
+def warm_imports():
+    skip = () if vectorstores.VECTOR_BACKEND == "chroma" else ("langchain_chroma", "chromadb")
+    for name in HEAVY_MODULES:
+        if name not in skip:
+            importlib.import_module(name)
+
+
+def _phase(name, fn, *args):
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+    except Exception as e:
+        _report["errors"][name] = str(e)
+        print(f"Warm-up phase {name} failed: {e}")
+        result = None
+    elapsed = time.perf_counter() - start
+    _report["phases"][name] = round(elapsed, 4)
+    STARTUP_SECONDS.set(elapsed, phase=name)
+    return result
+
+
+def run_warmup():
+    started = time.perf_counter()
+    if WARMUP_DB_CONNECTIONS > 0:
+        _phase("db_pool", warm_database, WARMUP_DB_CONNECTIONS)
+    # Rows written before payloads were compact-encoded; new rows never need it.
+    _report["payloads_migrated"] = _phase("migrate_payloads", logic.migrate_payloads)
+    if WARMUP_COLLECTIONS > 0:
+        _report["collections"] = _phase("collections", warm_collections, WARMUP_COLLECTIONS)
+    if WARMUP_IMPORTS:
+        _phase("imports", warm_imports)
+    STARTUP_SECONDS.set(time.perf_counter() - started, phase="warmup")
+    _ready.set()
+
+
+def start():
+    """Creates the schema, then warms up in the background (or not at all)."""
+    _phase("init_db", logic.init_db)
+    if not WARMUP_ENABLED:
+        _ready.set()
+        return None
+    thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
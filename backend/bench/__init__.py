@@ -0,0 +1,11 @@
+"""
+Offline benchmark harness for the PDFRetriever backend.
+
+Runs the real FastAPI app and `app.logic` against deterministic local
+stand-ins for Gemini and the embedding API (see `bench.fakes`), so
+performance changes can be measured without an API key:
+
+    cd backend
+    python -m bench.run --output results.json
+    python -m bench.run --baseline results.json   # fails on regressions
+"""
@@ -0,0 +1,255 @@
+"""
+Payload codec benchmark: plain JSON columns vs. compact-encoded payloads.
+
+    python -m bench.codec_bench [--chats 20] [--pages 40] [--turns 20]
+                                [--loads 200] [--output FILE]
+
+Builds chats shaped like real ones (processed_data with section texts,
+tables and media; a history with answers and their context) and reports:
+
+- codecs: stored bytes and encode/decode time per payload for the legacy
+  JSON column and each available codec,
+- chat_load: GET /api/chats/{id} latency and database size with rows in
+  the legacy JSON columns ("before") and after migrate_payloads() ("after").
+
+The synthetic text uses a small vocabulary, so it compresses better than
+real documents; compare codecs with each other rather than trusting the
+absolute ratios.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from .corpus import VOCABULARY, page_lines
+from .run import percentile
+
+
+def synthetic_chat(rng, pages, turns):
+    from .fakes import structure_for_pages
+
+    structure = structure_for_pages(pages)
+    page_text = {p: "\n".join(page_lines(rng, p)) for p in range(1, pages + 1)}
+    sections = [
+        {
+            "title": s["title"],
+            "content": "\n".join(
+                page_text[p] for p in range(s["page_start"], s["page_end"] + 1)
+            ),
+            "page_range": f"{s['page_start']}-{s['page_end']}",
+        }
+        for s in structure["section_definitions"]
+    ]
+    processed_data = {
+        "toc": structure["toc"],
+        "sections": sections,
+        "tables": structure["tables"],
+        "media": structure["media"],
+    }
+    history = []
+    for _ in range(turns):
+        words = lambda n: " ".join(rng.choice(VOCABULARY) for _ in range(n))
+        history.append({"role": "user", "content": words(12)})
+        history.append(
+            {
+                "role": "assistant",
+                "content": words(120),
+                "reasoning": words(40),
+                "context": [words(150) for _ in range(3)],
+            }
+        )
+    return history, processed_data
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _timed(fn, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - started)
+    return percentile(samples, 50)
+
+
+def bench_codecs(payloads, repeat):
+    from app import codec
+
+    variants = {"legacy-json": (lambda v: json.dumps(v).encode("utf-8"), json.loads)}
+    for name in codec.available_codecs():
+        variants[name] = (lambda v, name=name: codec.encode(v, name), codec.decode)
+
+    results = {}
+    for variant, (encode, decode) in variants.items():
+        stored, encode_s, decode_s = 0, 0.0, 0.0
+        for value in payloads:
+            blob = encode(value)
+            stored += len(blob)
+            encode_s += _timed(encode, value, repeat)
+            decode_s += _timed(decode, blob, repeat)
+        results[variant] = {
+            "bytes_per_payload": stored // len(payloads),
+            "encode_ms_per_payload": _ms(encode_s / len(payloads)),
+            "decode_ms_per_payload": _ms(decode_s / len(payloads)),
+        }
+    base = results["legacy-json"]["bytes_per_payload"]
+    for row in results.values():
+        row["size_ratio"] = round(row["bytes_per_payload"] / base, 4)
+    return results
+
+
+async def _load_latencies(client, chat_ids, loads, rng):
+    samples = []
+    for _ in range(loads):
+        chat_id = rng.choice(chat_ids)
+        started = time.perf_counter()
+        await client.load_chat(chat_id)
+        samples.append(time.perf_counter() - started)
+    return {
+        "load_ms_p50": _ms(percentile(samples, 50)),
+        "load_ms_p99": _ms(percentile(samples, 99)),
+    }
+
+
+def _db_bytes():
+    from app import logic, maintenance
+
+    maintenance.compact_database()
+    return maintenance.database_bytes(logic.get_db_engine())
+
+
+async def bench_chat_load(chats, args):
+    from sqlalchemy import null
+
+    from app import logic, main
+    from app.logic import Chat, TableData
+    from .run import Client
+
+    logic.init_db()
+    client = Client(main.app)
+    await client.login()
+    user_id = logic.verify_user_by_username("bench").id
+    rng = random.Random(args.seed)
+    try:
+        chat_ids = []
+        for i, (history, processed_data) in enumerate(chats):
+            chat_ids.append(
+                logic.save_chat(history, f"doc_{i}.pdf", user_id, processed_data=processed_data)
+            )
+            session = logic.get_db_session()
+            session.add_all(
+                TableData(
+                    id=f"t{i}_{n}",
+                    file_name=f"doc_{i}.pdf",
+                    user_id=user_id,
+                    page=table["page"],
+                    caption=table["caption"],
+                    data_json=table["cells"],
+                )
+                for n, table in enumerate(processed_data["tables"])
+            )
+            session.commit()
+            session.close()
+
+        # "Before": the same rows stored the way they were before packing.
+        session = logic.get_db_session()
+        for chat_id, (history, processed_data) in zip(chat_ids, chats):
+            session.query(Chat).filter(Chat.id == chat_id).update(
+                {
+                    Chat.history_legacy: history,
+                    Chat.processed_data_legacy: processed_data,
+                    Chat.history_packed: null(),
+                    Chat.processed_data_packed: null(),
+                },
+                synchronize_session=False,
+            )
+        for table in session.query(TableData).options(*logic._undefer_payloads(TableData, ["data_json"])):
+            cells = table.data_json
+            table.data_packed = None
+            table.data_json_legacy = cells
+        session.commit()
+        session.close()
+
+        before = await _load_latencies(client, chat_ids, args.loads, rng)
+        before["db_bytes"] = _db_bytes()
+
+        started = time.perf_counter()
+        migrated = logic.migrate_payloads()
+        migrate_s = time.perf_counter() - started
+
+        after = await _load_latencies(client, chat_ids, args.loads, rng)
+        after["db_bytes"] = _db_bytes()
+    finally:
+        await client.close()
+    return {
+        "before": before,
+        "after": after,
+        "rows_migrated": migrated,
+        "migrate_s": round(migrate_s, 3),
+    }
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    chats = [synthetic_chat(rng, args.pages, args.turns) for _ in range(args.chats)]
+    payloads = [p for history, processed_data in chats for p in (history, processed_data)]
+    return {
+        "codecs": bench_codecs(payloads, args.repeat),
+        "chat_load": asyncio.run(bench_chat_load(chats, args)),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=40, help="Pages per document")
+    parser.add_argument("--turns", type=int, default=20, help="Question/answer turns per chat")
+    parser.add_argument("--loads", type=int, default=200, help="Chat loads per phase")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repeats per payload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Directory for the throwaway database")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    args = parser.parse_args(argv)
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="pdfretriever_codec_")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.output = args.output and os.path.abspath(args.output)
+    os.makedirs(args.workdir, exist_ok=True)
+    os.environ.setdefault(
+        "DATABASE_URL", f"sqlite:///{os.path.join(args.workdir, 'codec.db')}"
+    )
+    os.chdir(args.workdir)
+
+    from app import codec
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "default_codec": codec.default_codec(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "results": run(args),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Synthetic PDF corpus generator (no third-party PDF writer required)."""
+
+import random
+
+# Small fixed vocabulary so generated text is searchable and repeatable.
+VOCABULARY = (
+    "contract liability payment invoice termination clause warranty party "
+    "supplier customer delivery schedule penalty audit revenue forecast "
+    "quarter growth margin risk compliance policy employee benefit insurance "
+    "premium coverage claim asset depreciation inventory logistics freight "
+    "regulation privacy security incident report table figure chart summary"
+).split()
+
+
+def _escape_pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(rng, page_number, lines_per_page=40, words_per_line=12):
+    lines = [f"Page {page_number} heading {rng.choice(VOCABULARY)}"]
+    for _ in range(lines_per_page - 1):
+        lines.append(" ".join(rng.choice(VOCABULARY) for _ in range(words_per_line)))
+    return lines
+
+
+def build_pdf(pages):
+    """
+    Builds a minimal, valid PDF where `pages` is a list of pages, each a list
+    of text lines. pdfplumber can extract the text back out.
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(None)  # filled in once the page tree exists
+    pages_id = add(None)
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+        for line in lines:
+            ops.append(f"({_escape_pdf_text(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        content_id = add(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        page_ids.append(
+            add(
+                (
+                    f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 {font_id} 0 R >> >> "
+                    f"/Contents {content_id} 0 R >>"
+                ).encode()
+            )
+        )
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[pages_id - 1] = (
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    )
+    objects[catalog_id - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += (
+        b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, catalog_id, xref_offset)
+    )
+    return bytes(out)
+
+
+def generate_pdf(num_pages, seed=0, lines_per_page=40):
+    rng = random.Random(seed)
+    return build_pdf(
+        [page_lines(rng, n, lines_per_page) for n in range(1, num_pages + 1)]
+    )
+
+
+def generate_corpus(count, min_pages=5, max_pages=40, seed=0):
+    """Yields (file_name, pdf_bytes) pairs with a deterministic size spread."""
+    rng = random.Random(seed)
+    for i in range(count):
+        pages = rng.randint(min_pages, max_pages)
+        yield f"synthetic_{i:03d}_{pages}p.pdf", generate_pdf(pages, seed=seed + i)
+
+
+def generate_queries(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"What does the document say about {rng.choice(VOCABULARY)} and {rng.choice(VOCABULARY)}?"
+        for _ in range(count)
+    ]
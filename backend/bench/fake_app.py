@@ -0,0 +1,22 @@
+"""
+The real ASGI app with the fakes installed, for multi-process load tests:
+
+    BENCH_LATENCY_SCALE=1 uvicorn bench.fake_app:app --workers 4
+
+Each uvicorn worker imports this module, so every process gets the fakes.
+"""
+
+import os
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.environ.setdefault("LLM_RATE_PER_MINUTE", "1000000")
+os.environ.setdefault("LLM_BURST", "1000")
+
+from . import fakes
+
+fakes.FakeLatency.scale(float(os.getenv("BENCH_LATENCY_SCALE", "0")))
+fakes.install()
+
+from app.main import app  # noqa: E402
+
+__all__ = ["app"]
@@ -0,0 +1,228 @@
+"""
+Deterministic local stand-ins for the Gemini APIs used by `app.logic`.
+
+- FakeGenerativeModel   -> google.generativeai.GenerativeModel
+- FakeChatModel         -> langchain_google_genai.ChatGoogleGenerativeAI
+- FakeEmbeddings        -> langchain_google_genai.GoogleGenerativeAIEmbeddings
+
+Latencies are configurable so benchmarks model remote round trips without
+touching the network. Outputs depend only on their inputs.
+"""
+
+import re
+import json
+import math
+import time
+import hashlib
+import typing
+from types import SimpleNamespace
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+
+class FakeLatency:
+    """Seconds of simulated latency per call (plus a per-item cost for embeddings)."""
+
+    structure = 0.5
+    answer = 0.2
+    embed_call = 0.02
+    embed_item = 0.001
+
+    @classmethod
+    def scale(cls, factor):
+        for name in ("structure", "answer", "embed_call", "embed_item"):
+            setattr(cls, name, getattr(cls, name) * factor)
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _pdf_page_count(data):
+    return len(re.findall(rb"/Type\s*/Page\b", bytes(data))) or 1
+
+
+def structure_for_pages(num_pages, pages_per_section=3):
+    """The JSON document FakeGenerativeModel returns for a PDF of `num_pages`."""
+    sections, toc = [], []
+    for i, start in enumerate(range(1, num_pages + 1, pages_per_section), start=1):
+        end = min(num_pages, start + pages_per_section - 1)
+        title = f"Section {i}"
+        toc.append({"title": title, "page_number": start})
+        sections.append({"title": title, "page_start": start, "page_end": end})
+    tables = [
+        {
+            "caption": f"Table {n}",
+            "page": page,
+            "cells": [["metric", "value"], ["revenue", str(page * 100)], ["risk", "low"]],
+        }
+        for n, page in enumerate(range(2, num_pages + 1, 5), start=1)
+    ]
+    media = [
+        {"description": f"Chart on page {page} showing quarterly revenue growth", "page": page}
+        for page in range(4, num_pages + 1, 4)
+    ]
+    return {
+        "toc": toc,
+        "section_definitions": sections,
+        "tables": tables,
+        "media": media,
+    }
+
+
+class FakeStream:
+    """A streamed response: `chunks` pieces of `text`, spreading `latency` over them."""
+
+    def __init__(self, text, usage_metadata, chunks, latency):
+        self.text = text
+        self.chunks = max(chunks, 1)
+        self.latency = latency
+        self._usage_metadata = usage_metadata
+        self.usage_metadata = None  # like the SDK, only known once the stream ends
+
+    def __iter__(self):
+        size = max(1, -(-len(self.text) // self.chunks))
+        for start in range(0, len(self.text), size):
+            time.sleep(self.latency / self.chunks)
+            yield SimpleNamespace(text=self.text[start : start + size])
+        self.usage_metadata = self._usage_metadata
+
+
+class FakeGenerativeModel:
+    # Streamed responses arrive in this many chunks.
+    stream_chunks = 20
+    # Cut responses off after this many characters (None sends everything).
+    truncate_after = None
+
+    def __init__(self, model_name=None, generation_config=None, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        prompt, pdf = "", b""
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, dict) and "data" in part:
+                pdf = part["data"]
+            else:
+                prompt += str(part)
+        text = json.dumps(structure_for_pages(_pdf_page_count(pdf)))
+        if self.truncate_after is not None:
+            text = text[: self.truncate_after]
+        usage = SimpleNamespace(
+            prompt_token_count=_estimate_tokens(prompt) + 258 * _pdf_page_count(pdf),
+            candidates_token_count=_estimate_tokens(text),
+        )
+        if stream:
+            return FakeStream(text, usage, self.stream_chunks, FakeLatency.structure)
+        time.sleep(FakeLatency.structure)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def _fill(schema, seed_text):
+    """Builds a schema instance, filling str fields from `seed_text`."""
+    values = {}
+    for name, field in schema.model_fields.items():
+        annotation = field.annotation
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            values[name] = _fill(annotation, seed_text)
+        elif annotation is str or typing.get_origin(annotation) is typing.Union:
+            values[name] = f"{name}: {seed_text[:120]}"
+        else:
+            values[name] = field.default
+    return schema(**values)
+
+
+class FakeChatModel:
+    def __init__(self, model=None, google_api_key=None, **kwargs):
+        self.model = model
+
+    def _respond(self, prompt_value):
+        prompt = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        time.sleep(FakeLatency.answer)
+        # Deterministic "answer": a digest plus the tail of the prompt.
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+        return prompt, f"[{digest}] " + " ".join(prompt.split()[-20:])
+
+    def invoke(self, prompt_value, config=None, **kwargs):
+        prompt, text = self._respond(prompt_value)
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": _estimate_tokens(prompt),
+                "output_tokens": _estimate_tokens(text),
+                "total_tokens": _estimate_tokens(prompt) + _estimate_tokens(text),
+            },
+        )
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        def run(prompt_value):
+            prompt, text = self._respond(prompt_value)
+            parsed = _fill(schema, text)
+            if not include_raw:
+                return parsed
+            raw = AIMessage(
+                content="",
+                usage_metadata={
+                    "input_tokens": _estimate_tokens(prompt),
+                    "output_tokens": _estimate_tokens(parsed.model_dump_json()),
+                    "total_tokens": _estimate_tokens(prompt)
+                    + _estimate_tokens(parsed.model_dump_json()),
+                },
+            )
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        return RunnableLambda(run)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: similar texts get similar embeddings."""
+
+    dimensions = 256
+
+    def __init__(self, model=None, google_api_key=None, **kwargs):
+        self.model = model
+
+    def _vector(self, text):
+        vec = [0.0] * self.dimensions
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            h = int.from_bytes(hashlib.md5(token.encode()).digest()[:4], "little")
+            vec[h % self.dimensions] += 1.0 if h & 1 << 31 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts, **kwargs):
+        time.sleep(FakeLatency.embed_call + FakeLatency.embed_item * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        time.sleep(FakeLatency.embed_call)
+        return self._vector(text)
+
+
+def install():
+    """
+    Points `app.logic` at the fakes. Returns a callable that restores the
+    real clients.
+    """
+    from app import logic
+
+    patches = [
+        (
+            logic,
+            "get_generative_model",
+            lambda model_name, api_key, **kwargs: FakeGenerativeModel(model_name, **kwargs),
+        ),
+        (logic, "get_chat_model", lambda model_name, api_key: FakeChatModel(model=model_name)),
+        (logic, "get_embedding_model", lambda api_key: FakeEmbeddings(logic.EMBEDDING_MODEL_NAME)),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fake in patches:
+        setattr(obj, name, fake)
+
+    def restore():
+        for obj, name, original in originals:
+            setattr(obj, name, original)
+
+    return restore
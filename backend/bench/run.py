@@ -0,0 +1,364 @@
+"""
+Benchmark scenarios against the real API with fake LLM/embedding backends.
+
+    python -m bench.run [--scenarios upload,query,memory,db] [--output FILE]
+                        [--baseline FILE --tolerance 0.2] [--latency-scale 1.0]
+
+Results are written as JSON. With --baseline, lower-is-better metrics that
+regress by more than --tolerance are reported and the exit code is 1.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from contextlib import contextmanager
+
+# Keep everything local: no Chroma telemetry, throwaway SQLite + vector dirs.
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+# All bench traffic shares one fake API key; don't let the per-key LLM rate
+# limit dominate the numbers unless explicitly configured.
+os.environ.setdefault("LLM_RATE_PER_MINUTE", "1000000")
+os.environ.setdefault("LLM_BURST", "1000")
+
+SCENARIOS = ("upload", "query", "memory", "db")
+BENCH_USER = {"username": "bench", "password": "bench-password"}
+API_KEY = "fake-key"
+
+# (scenario, metric) pairs where a bigger number is worse.
+LOWER_IS_BETTER = {
+    ("upload", "latency_p50_s"),
+    ("upload", "latency_p99_s"),
+    ("query", "latency_p50_s"),
+    ("query", "latency_p99_s"),
+    ("memory", "tracemalloc_peak_mb"),
+    ("db", "statements_per_upload"),
+    ("db", "statements_per_query"),
+    ("db", "statements_per_chat_list"),
+    ("db", "statements_per_chat_load"),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lo, hi = int(rank), min(int(rank) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
+
+
+def summarize(latencies, wall_seconds):
+    return {
+        "count": len(latencies),
+        "throughput_per_s": len(latencies) / wall_seconds if wall_seconds else None,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "latency_max_s": max(latencies) if latencies else None,
+    }
+
+
+class Client:
+    """
+    Thin async wrapper around the ASGI app with an authenticated user.
+    With `base_url` instead of `app` it talks to a running server over HTTP.
+    """
+
+    def __init__(self, app=None, base_url="http://bench"):
+        import httpx
+
+        self.http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app) if app is not None else None,
+            base_url=base_url,
+            timeout=None,
+        )
+        self.headers = {}
+
+    async def login(self):
+        await self.http.post("/api/register", json=BENCH_USER)
+        r = await self.http.post("/api/token", data=BENCH_USER)
+        r.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    async def upload(self, name, data):
+        r = await self.http.post(
+            "/api/upload",
+            params={"api_key": API_KEY},
+            files={"file": (name, data, "application/pdf")},
+            headers=self.headers,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    async def query(self, chat_id, query):
+        r = await self.http.post(
+            "/api/query",
+            params={"api_key": API_KEY},
+            json={"chat_id": chat_id, "query": query},
+            headers=self.headers,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    async def list_chats(self):
+        r = await self.http.get("/api/chats", headers=self.headers)
+        r.raise_for_status()
+        return r.json()
+
+    async def load_chat(self, chat_id):
+        r = await self.http.get(f"/api/chats/{chat_id}", headers=self.headers)
+        r.raise_for_status()
+        return r.json()
+
+    async def close(self):
+        await self.http.aclose()
+
+
+async def _timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
+
+
+async def _bounded(concurrency, factories):
+    """Runs coroutine factories with at most `concurrency` in flight."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run(factory):
+        async with sem:
+            return await _timed(factory())
+
+    return await asyncio.gather(*(run(f) for f in factories))
+
+
+async def scenario_upload(client, args):
+    from .corpus import generate_corpus
+
+    corpus = list(generate_corpus(args.documents, args.min_pages, args.max_pages, args.seed))
+    start = time.perf_counter()
+    results = await _bounded(
+        args.concurrency,
+        [lambda n=name, d=data: client.upload(n, d) for name, data in corpus],
+    )
+    wall = time.perf_counter() - start
+    summary = summarize([t for t, _ in results], wall)
+    total_bytes = sum(len(d) for _, d in corpus)
+    summary.update(
+        {
+            "concurrency": args.concurrency,
+            "total_mb": total_bytes / 1e6,
+            "mb_per_s": total_bytes / 1e6 / wall if wall else None,
+        }
+    )
+    return summary, [r["chat_id"] for _, r in results]
+
+
+async def scenario_query(client, args, chat_ids):
+    from .corpus import generate_queries
+
+    queries = generate_queries(args.queries, args.seed)
+    start = time.perf_counter()
+    results = await _bounded(
+        args.concurrency,
+        [
+            lambda q=q, c=chat_ids[i % len(chat_ids)]: client.query(c, q)
+            for i, q in enumerate(queries)
+        ],
+    )
+    wall = time.perf_counter() - start
+    summary = summarize([t for t, _ in results], wall)
+    summary["concurrency"] = args.concurrency
+    return summary
+
+
+async def scenario_memory(client, args):
+    from .corpus import generate_pdf
+
+    data = generate_pdf(args.memory_pages, seed=args.seed)
+    tracemalloc.start()
+    try:
+        await client.upload(f"memory_{args.memory_pages}p.pdf", data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "pdf_mb": len(data) / 1e6,
+        "tracemalloc_peak_mb": peak / 1e6,
+        "peak_to_pdf_ratio": peak / len(data),
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1e3
+
+
+@contextmanager
+def count_statements(engine):
+    from sqlalchemy import event
+
+    counter = {"n": 0}
+
+    def before_execute(*args, **kwargs):
+        counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+
+async def scenario_db(client, args):
+    from app import logic
+    from .corpus import generate_pdf
+
+    engine = logic.get_db_engine()
+    results = {}
+    with count_statements(engine) as c:
+        chat = await client.upload("db_roundtrips.pdf", generate_pdf(6, seed=args.seed))
+    results["statements_per_upload"] = c["n"]
+    with count_statements(engine) as c:
+        await client.query(chat["chat_id"], "What is the revenue forecast?")
+    results["statements_per_query"] = c["n"]
+    with count_statements(engine) as c:
+        await client.list_chats()
+    results["statements_per_chat_list"] = c["n"]
+    with count_statements(engine) as c:
+        await client.load_chat(chat["chat_id"])
+    results["statements_per_chat_load"] = c["n"]
+    return results
+
+
+async def run_scenarios(args):
+    from app import logic, main
+    from . import fakes
+
+    fakes.FakeLatency.scale(args.latency_scale)
+    restore = fakes.install()
+    logic.init_db()
+    client = Client(main.app)
+    results = {}
+    try:
+        await client.login()
+        chat_ids = []
+        if "upload" in args.scenarios or "query" in args.scenarios:
+            results["upload"], chat_ids = await scenario_upload(client, args)
+        if "query" in args.scenarios:
+            results["query"] = await scenario_query(client, args, chat_ids)
+        if "memory" in args.scenarios:
+            results["memory"] = await scenario_memory(client, args)
+        if "db" in args.scenarios:
+            results["db"] = await scenario_db(client, args)
+    finally:
+        await client.close()
+        restore()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for (scenario, metric) in sorted(LOWER_IS_BETTER):
+        old = baseline.get("results", {}).get(scenario, {}).get(metric)
+        new = results.get(scenario, {}).get(metric)
+        if old is None or new is None or old <= 0:
+            continue
+        if new > old * (1 + tolerance):
+            regressions.append(
+                f"{scenario}.{metric}: {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--min-pages", type=int, default=5)
+    parser.add_argument("--max-pages", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--memory-pages", type=int, default=300)
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Directory for the throwaway DB/vector store")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    parser.add_argument("--baseline", help="Previous JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Resolve user paths before switching into the work directory.
+    args.output = args.output and os.path.abspath(args.output)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pdfretriever_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    # logic.py keeps its SQLite file and vector store relative to the CWD.
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.chdir(workdir)
+
+    started = time.time()
+    results = asyncio.run(run_scenarios(args))
+    report = {
+        "meta": {
+            "started_at": started,
+            "duration_s": time.time() - started,
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Multi-worker load test: query throughput vs. number of uvicorn workers.
+
+    python -m bench.scaleout [--workers 1,2,4] [--queries 400] [--concurrency 32]
+                             [--backend numpy|chroma] [--output FILE]
+
+For each worker count a fresh `uvicorn bench.fake_app:app --workers N` is
+started on a throwaway SQLite DB. Workers share it and the vector store:
+with --backend chroma a local `chroma run` server stands in for the remote
+Chroma used in production (CHROMA_HOST), and with --backend numpy the
+workers share one index directory. Documents are uploaded, then queries are
+fired over HTTP at the given concurrency.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from .corpus import generate_corpus, generate_queries
+from .run import Client, _bounded, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, timeout=120, ok=(200,)):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code in ok:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_chroma(workdir):
+    """Starts a local Chroma server (stand-in for a remote one)."""
+    port = _free_port()
+    proc = subprocess.Popen(
+        ["chroma", "run", "--path", os.path.join(workdir, "chroma"), "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _wait_for(f"http://127.0.0.1:{port}/api/v2/heartbeat")
+    return proc, port
+
+
+def start_app(workers, workdir, env):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "bench.fake_app:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=workdir,
+        env=env,
+    )
+    _wait_for(f"http://127.0.0.1:{port}/ready")
+    return proc, port
+
+
+def _stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+async def _load(port, args):
+    client = Client(base_url=f"http://127.0.0.1:{port}")
+    try:
+        await client.login()
+        chat_ids = []
+        for name, data in generate_corpus(args.documents, 5, 20, args.seed):
+            chat_ids.append((await client.upload(name, data))["chat_id"])
+        queries = generate_queries(args.queries, args.seed)
+        start = time.perf_counter()
+        results = await _bounded(
+            args.concurrency,
+            [
+                lambda q=q, c=chat_ids[i % len(chat_ids)]: client.query(c, q)
+                for i, q in enumerate(queries)
+            ],
+        )
+        return summarize([t for t, _ in results], time.perf_counter() - start)
+    finally:
+        await client.close()
+
+
+def run(args):
+    results = {}
+    for workers in args.workers:
+        workdir = tempfile.mkdtemp(prefix=f"pdfretriever_scaleout_{workers}_")
+        env = dict(
+            os.environ,
+            PYTHONPATH=BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            VECTOR_BACKEND=args.backend,
+            BENCH_LATENCY_SCALE=str(args.latency_scale),
+            WARMUP_IMPORTS="false",
+        )
+        chroma = None
+        if args.backend == "chroma":
+            chroma, chroma_port = start_chroma(workdir)
+            env.update(CHROMA_HOST="127.0.0.1", CHROMA_PORT=str(chroma_port))
+        app, port = start_app(workers, workdir, env)
+        try:
+            results[str(workers)] = asyncio.run(_load(port, args))
+        finally:
+            _stop(app)
+            if chroma is not None:
+                _stop(chroma)
+    base = results.get(str(args.workers[0]), {}).get("throughput_per_s")
+    for summary in results.values():
+        summary["speedup"] = summary["throughput_per_s"] / base if base else None
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--backend", choices=("numpy", "chroma"), default="chroma")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-scale", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    args = parser.parse_args(argv)
+    args.workers = [int(w) for w in args.workers.split(",") if w]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.output = args.output and os.path.abspath(args.output)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "results": run(args),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Vector backend comparison: Chroma vs. the in-process NumPy engine.
+
+    python -m bench.vector_backends [--documents 20] [--chunks 200]
+                                    [--queries 200] [--k 5] [--output FILE]
+
+Each backend indexes the same synthetic per-document collections (fake
+hashed embeddings, no network). Reported per backend:
+
+- open_ms_*: opening a collection and running its first query,
+- query_ms_*: steady-state top-k search with a precomputed query vector,
+- recall_at_k: overlap with exact float64 brute-force top-k.
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .corpus import VOCABULARY, generate_queries
+from .run import percentile
+
+BACKENDS = ("chroma", "numpy", "numpy-int8")
+
+
+def synthetic_chunks(count, rng, words=120):
+    return [
+        " ".join(rng.choice(VOCABULARY) for _ in range(words)) for _ in range(count)
+    ]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _summary(prefix, samples):
+    return {
+        f"{prefix}_p50": _ms(percentile(samples, 50)),
+        f"{prefix}_p99": _ms(percentile(samples, 99)),
+    }
+
+
+def _open(backend, name, embeddings, db_root):
+    from app import vectorstores
+
+    if backend == "numpy-int8":
+        return vectorstores.NumpyVectorStore(
+            vectorstores.numpy_index_path(name, db_root), embeddings, quantization="int8"
+        )
+    return vectorstores.open_store(name, embeddings, db_root=db_root, backend=backend)
+
+
+def _cold(backend, name, db_root):
+    """Forgets anything cached in-process for this collection."""
+    from app import vectorstores
+
+    if backend.startswith("numpy"):
+        vectorstores.evict_index(vectorstores.numpy_index_path(name, db_root))
+
+
+def run(args):
+    from . import fakes
+
+    fakes.FakeLatency.scale(0)
+    embeddings = fakes.FakeEmbeddings()
+    rng = random.Random(args.seed)
+
+    collections = {}
+    for d in range(args.documents):
+        texts = synthetic_chunks(args.chunks, rng)
+        collections[f"doc_{d:03d}"] = (texts, np.asarray(embeddings.embed_documents(texts)))
+    queries = [
+        (rng.choice(list(collections)), np.asarray(embeddings.embed_query(q)))
+        for q in generate_queries(args.queries, args.seed)
+    ]
+
+    exact = []
+    for name, vector in queries:
+        matrix = collections[name][1]
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(vector) or 1.0)
+        sims = (matrix @ vector) / np.where(norms == 0, 1.0, norms)
+        exact.append(set(np.argsort(-sims, kind="stable")[: args.k].tolist()))
+
+    results = {}
+    for backend in args.backends:
+        db_root = os.path.join(args.workdir, backend)
+        build_started = time.perf_counter()
+        for name, (texts, _) in collections.items():
+            store = _open(backend, name, embeddings, db_root)
+            store.add_documents(
+                [Document(page_content=t, metadata={"chunk": i}) for i, t in enumerate(texts)]
+            )
+        build_seconds = time.perf_counter() - build_started
+
+        open_samples = []
+        for name in collections:
+            _cold(backend, name, db_root)
+            started = time.perf_counter()
+            store = _open(backend, name, embeddings, db_root)
+            store.similarity_search_by_vector_with_relevance_scores(queries[0][1].tolist(), k=args.k)
+            open_samples.append(time.perf_counter() - started)
+
+        stores = {name: _open(backend, name, embeddings, db_root) for name in collections}
+        query_samples, hits = [], 0
+        for (name, vector), truth in zip(queries, exact):
+            started = time.perf_counter()
+            found = stores[name].similarity_search_by_vector_with_relevance_scores(
+                vector.tolist(), k=args.k
+            )
+            query_samples.append(time.perf_counter() - started)
+            hits += len(truth & {doc.metadata["chunk"] for doc, _ in found})
+
+        results[backend] = {
+            "build_s": round(build_seconds, 3),
+            **_summary("open_ms", open_samples),
+            **_summary("query_ms", query_samples),
+            "recall_at_k": round(hits / (len(queries) * args.k), 4),
+        }
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Directory for the throwaway indexes")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    args = parser.parse_args(argv)
+    args.backends = [b for b in args.backends.split(",") if b]
+    unknown = set(args.backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="pdfretriever_vectors_")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "results": run(args),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
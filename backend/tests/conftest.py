@@ -0,0 +1,14 @@
+import pytest
+
+from app import logic
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database behind logic.get_db_session()."""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(logic, "_ENGINE", None)
+    monkeypatch.setattr(logic, "_SESSION_FACTORY", None)
+    logic.init_db()
+    yield
+    logic._ENGINE.dispose()
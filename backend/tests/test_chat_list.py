@@ -0,0 +1,77 @@
+import datetime
+
+import pytest
+
+from app import logic
+
+
+def add_chats(user_id, titles, timestamp):
+    session = logic.get_db_session()
+    try:
+        for i, title in enumerate(titles):
+            session.add(
+                logic.Chat(
+                    id=f"chat-{user_id}-{i:02d}",
+                    user_id=user_id,
+                    title=title,
+                    file_name=f"{title}.pdf",
+                    timestamp=timestamp(i),
+                )
+            )
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_cursor_round_trip():
+    timestamp = datetime.datetime(2024, 5, 1, 12, 30, 45, 123456)
+    cursor = logic._encode_cursor(timestamp, "chat/1+2")
+    assert "=" not in cursor
+    assert logic._decode_cursor(cursor) == (timestamp, "chat/1+2")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", "W10", "eyJhIjoxfQ"])
+def test_rejects_foreign_cursors(cursor):
+    with pytest.raises(logic.InvalidCursor):
+        logic._decode_cursor(cursor)
+
+
+def test_pages_cover_every_chat_once(db):
+    start = datetime.datetime(2024, 1, 1)
+    # Every other pair shares a timestamp, so pages must tie-break on id.
+    add_chats(1, [f"Report {i}" for i in range(7)], lambda i: start + datetime.timedelta(minutes=i // 2))
+    add_chats(2, ["Someone else's"], lambda i: start)
+
+    seen, cursor = [], None
+    while True:
+        chats, cursor = logic.list_chats(1, limit=3, cursor=cursor)
+        seen += [chat["chat_id"] for chat in chats]
+        if cursor is None:
+            break
+    assert seen == [f"chat-1-{i:02d}" for i in reversed(range(7))]
+
+
+def test_unpaginated_and_search(db):
+    start = datetime.datetime(2024, 1, 1)
+    add_chats(1, ["Budget 2024", "100% done", "Notes_v2"], lambda i: start + datetime.timedelta(hours=i))
+
+    chats, cursor = logic.list_chats(1)
+    assert cursor is None and len(chats) == 3
+    assert [c["title"] for c in logic.list_chats(1, search="budget")[0]] == ["Budget 2024"]
+    assert [c["title"] for c in logic.list_chats(1, search="%")[0]] == ["100% done"]
+    assert [c["title"] for c in logic.list_chats(1, search="_")[0]] == ["Notes_v2"]
+
+
+def test_load_chat_only_returns_stored_base64(db):
+    session = logic.get_db_session()
+    try:
+        session.add(logic.Chat(id="stored", user_id=1, title="New", doc_sha256="ab" * 32))
+        session.add(logic.Chat(id="legacy", user_id=1, title="Old", pdf_b64="JVBERi0="))
+        session.commit()
+    finally:
+        session.close()
+
+    stored = logic.load_chat("stored")
+    assert stored["doc_sha256"] == "ab" * 32 and stored["pdf_b64"] is None
+    assert logic.load_chat("legacy")["pdf_b64"] == "JVBERi0="
+    assert "pdf_b64" not in logic.load_chat("legacy", include=("history",))
@@ -0,0 +1,36 @@
+import pytest
+
+from app import codec
+
+PAYLOADS = [
+    [],
+    {},
+    {"role": "user", "content": "café ✓"},
+    [{"title": f"Section {i}", "content": "revenue forecast " * 50} for i in range(20)],
+]
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def json_backend(request, monkeypatch):
+    if request.param == "orjson":
+        if codec.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(codec, "orjson", None)
+    return request.param
+
+
+@pytest.mark.parametrize("name", codec.available_codecs())
+@pytest.mark.parametrize("value", PAYLOADS)
+def test_round_trip(json_backend, name, value):
+    assert codec.decode(codec.encode(value, name)) == value
+
+
+def test_small_payloads_are_stored_uncompressed(json_backend):
+    payload = codec.encode([], "json-zlib")
+    assert payload[:2] == bytes((codec.FORMAT_VERSION, codec.JSON))
+
+
+def test_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        codec.decode(b"\x09\x00[]")
@@ -0,0 +1,64 @@
+from langchain_core.documents import Document
+
+from app.context import assemble_context, estimate_tokens, trim_to_budget
+from app.logic import format_history
+
+FILLER = "The committee met on schedule and reviewed routine items. " * 20
+REVENUE = "Revenue grew twelve percent year over year in the fourth quarter."
+
+
+def doc(text):
+    return Document(page_content=text)
+
+
+def test_trim_keeps_query_sentences_within_budget():
+    text = FILLER + REVENUE + " " + FILLER
+    trimmed = trim_to_budget(text, {"revenue", "quarter"}, 40)
+    assert estimate_tokens(trimmed) <= 40
+    assert REVENUE in trimmed and " ... " in trimmed
+    # With room for one sentence, the one matching the query wins.
+    assert trim_to_budget(text, {"revenue", "quarter"}, estimate_tokens(REVENUE) + 1) == REVENUE
+    assert trim_to_budget(REVENUE, {"revenue"}, 40) == REVENUE
+
+
+def test_budget_truncates_and_stops_adding_chunks():
+    docs = [(doc(FILLER + REVENUE), 0.9), (doc("Costs fell. " * 200), 0.5), (doc("Tail."), 0.1)]
+    context, used, stats = assemble_context(docs, "revenue growth", token_budget=200)
+
+    assert stats["context_tokens"] <= 200
+    assert REVENUE in context
+    assert used[0] is docs[0][0]
+    assert stats["chunks_trimmed"] >= 1
+    assert stats["chunks_used"] < 3
+    assert stats["token_budget"] == 200
+
+
+def test_near_duplicates_are_dropped_in_favour_of_the_better_ranked_chunk():
+    original = doc(REVENUE + " Margins widened on lower input costs and steady pricing.")
+    copy = doc(REVENUE + " Margins widened on lower input costs and steady pricing!")
+    other = doc("Headcount was flat and attrition stayed below five percent.")
+
+    _, used, stats = assemble_context([(copy, 0.4), (other, 0.6), (original, 0.8)], "revenue")
+    assert used == [original, other]
+    assert stats["duplicates_dropped"] == 1
+
+    _, used, stats = assemble_context([(copy, 0.4), (original, 0.8)], "revenue", dedup_threshold=1.1)
+    assert used == [original, copy] and stats["duplicates_dropped"] == 0
+
+
+def test_history_keeps_the_latest_messages_that_fit():
+    history = [
+        {"role": "user", "content": "first question " * 30},
+        {"role": "assistant", "content": "first answer"},
+        {"role": "user", "content": "  "},
+        {"role": "user", "content": "second question"},
+        {"role": "assistant", "content": "second answer"},
+    ]
+    assert format_history(history, max_messages=6, token_budget=20) == (
+        "Assistant: first answer\nUser: second question\nAssistant: second answer"
+    )
+    assert format_history(history, max_messages=2, token_budget=800) == (
+        "User: second question\nAssistant: second answer"
+    )
+    assert format_history(history, max_messages=0) == ""
+    assert format_history(None) == ""
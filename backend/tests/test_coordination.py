@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from app import coordination
+
+
+@pytest.fixture
+def locks(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(coordination, "LOCK_DIR", str(tmp_path / "locks"))
+
+
+def hold(lock):
+    """Holds `lock` in another thread until the returned event is set."""
+    acquired, release = threading.Event(), threading.Event()
+
+    def run():
+        with lock:
+            acquired.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert acquired.wait(5)
+    return release, thread
+
+
+def test_ingest_lock_is_per_document(locks):
+    release, thread = hold(coordination.ingest_lock("a" * 64))
+    try:
+        with coordination.ingest_lock("b" * 64, timeout=0):
+            pass
+        started = time.monotonic()
+        with pytest.raises(coordination.LockTimeout):
+            with coordination.ingest_lock("a" * 64, timeout=0.2):
+                pass
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        thread.join()
+    with coordination.ingest_lock("a" * 64, timeout=0):
+        pass
+
+
+def test_collection_and_ingest_locks_are_independent(locks):
+    release, thread = hold(coordination.collection_lock("report"))
+    try:
+        with coordination.ingest_lock("report", timeout=0):
+            pass
+        with pytest.raises(coordination.LockTimeout):
+            with coordination.collection_lock("report", timeout=0):
+                pass
+    finally:
+        release.set()
+        thread.join()
@@ -0,0 +1,85 @@
+import pytest
+
+from app.logic import build_filter, page_span
+
+SECTIONS = [
+    {"title": "Introduction", "page_start": 1, "page_end": 2},
+    {"title": "Risk Factors", "page_range": "3-5"},
+    {"title": "Untitled page", "page": 6},
+]
+
+
+@pytest.mark.parametrize(
+    "item, span",
+    [
+        ({"page_start": 2, "page_end": 4}, (2, 4)),
+        ({"page_range": "3-5"}, (3, 5)),
+        ({"page_range": "7"}, (7, 7)),
+        ({"page": "8"}, (8, 8)),
+        ({"page_start": 5, "page_end": 2}, (5, 5)),
+        ({"page_start": 0, "page": 3}, (3, 3)),
+        ({"page_range": "n/a"}, (None, None)),
+        ({}, (None, None)),
+    ],
+)
+def test_page_span(item, span):
+    assert page_span(item) == span
+
+
+def test_no_filter():
+    assert build_filter() is None
+
+
+def test_types():
+    assert build_filter(types=["table"]) == {"type": "table"}
+    assert build_filter(types=["table", "media", "table"]) == {"type": {"$in": ["media", "table"]}}
+
+
+def test_page_range_overlap():
+    assert build_filter(page_start=2, page_end=4) == {
+        "$and": [{"page_start": {"$lte": 4}}, {"page_end": {"$gte": 2}}]
+    }
+    assert build_filter(page_start=3) == {"page_end": {"$gte": 3}}
+
+
+def test_section_scope():
+    assert build_filter(section="risk", sections=SECTIONS) == {
+        "$or": [
+            {"$and": [{"type": "section"}, {"title": {"$in": ["Risk Factors"]}}]},
+            {
+                "$and": [
+                    {"type": {"$ne": "section"}},
+                    {"page_start": {"$lte": 5}},
+                    {"page_end": {"$gte": 3}},
+                ]
+            },
+        ]
+    }
+
+
+def test_exact_section_title_wins_over_substring():
+    where = build_filter(section="introduction", sections=SECTIONS + [{"title": "Introduction (cont.)"}])
+    assert where["$or"][0]["$and"][1] == {"title": {"$in": ["Introduction"]}}
+
+
+def test_combined_conditions():
+    where = build_filter(types=["table"], page_start=1, page_end=1, section="Introduction", sections=SECTIONS)
+    assert where["$and"][:3] == [
+        {"type": "table"},
+        {"page_start": {"$lte": 1}},
+        {"page_end": {"$gte": 1}},
+    ]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"types": ["chart"]},
+        {"page_start": 0},
+        {"page_start": 4, "page_end": 2},
+        {"section": "Appendix", "sections": SECTIONS},
+    ],
+)
+def test_rejects_bad_input(kwargs):
+    with pytest.raises(ValueError):
+        build_filter(**kwargs)
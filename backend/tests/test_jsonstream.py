@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from app.jsonstream import ArrayStreamParser, iter_items
+
+DOCUMENT = {
+    "title": "Annual \"Report\" 2024",
+    "sections": [
+        {"title": "Intro", "content": "He said \"hi\" and left C:\\temp\\"},
+        {"title": "Risks", "content": "Backslash \\\" quote, brackets [ ] { } and , commas"},
+    ],
+    "pages": [1, 2.5, "three", None, True],
+    "empty": [],
+}
+TEXT = json.dumps(DOCUMENT)
+EXPECTED = [(key, item) for key, items in DOCUMENT.items() if isinstance(items, list) for item in items]
+
+
+def parse(chunks):
+    parser = ArrayStreamParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    return parser, events
+
+
+def test_whole_document():
+    parser, events = parse([TEXT])
+    assert events == EXPECTED
+    assert parser.complete
+    assert parser.values == {"title": DOCUMENT["title"]}
+    assert parser.counts == {"sections": 2, "pages": 5}
+    assert parser.errors == 0
+
+
+@pytest.mark.parametrize("split", range(1, len(TEXT)))
+def test_every_split_point(split):
+    parser, events = parse([TEXT[:split], TEXT[split:]])
+    assert events == EXPECTED
+    assert parser.complete
+
+
+def test_one_character_at_a_time():
+    assert list(iter_items(TEXT)) == EXPECTED
+
+
+@pytest.mark.parametrize("char", ['"', "\\"])
+def test_escape_split_across_chunks(char):
+    item = {"content": "a" + char + "]}b"}
+    text = json.dumps({"items": [item]})
+    cut = text.index("\\") + 1  # between the backslash and the escaped character
+    parser, events = parse([text[:cut], text[cut:]])
+    assert events == [("items", item)]
+    assert parser.complete
+
+
+def test_truncated_mid_item():
+    cut = TEXT.index('{"title": "Risks"') + 20
+    parser, events = parse([TEXT[:cut]])
+    assert events == EXPECTED[:1]
+    assert not parser.complete
+    assert parser.truncated
+
+
+def test_leading_code_fence():
+    parser, events = parse(["```json\n", TEXT, "\n```"])
+    assert events == EXPECTED
+    assert parser.complete
+
+
+def test_malformed_item_is_counted_and_skipped():
+    parser, events = parse(['{"pages": [1, tru, 3]}'])
+    assert events == [("pages", 1), ("pages", 3)]
+    assert parser.errors == 1
@@ -0,0 +1,124 @@
+import datetime
+import os
+import time
+
+import pytest
+
+from app import coordination, logic, maintenance, render, vectorstores
+
+OLD = time.time() - 2 * maintenance.ORPHAN_GRACE_SECONDS
+
+
+@pytest.fixture
+def root(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstores, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(render, "DOCUMENT_DIR", str(tmp_path / "documents"))
+    monkeypatch.setattr(render, "RENDER_CACHE_DIR", str(tmp_path / "render_cache"))
+    monkeypatch.setattr(coordination, "LOCK_DIR", str(tmp_path / "locks"))
+    return tmp_path / "db"
+
+
+def add_collection(root, file_name, written=OLD):
+    path = vectorstores.numpy_index_path(logic.clean_filename(file_name), root)
+    vectorstores.write_index(path, [[1.0, 0.0]], [{"id": "0", "page_content": "", "metadata": {}}])
+    os.utime(path / "meta.json", (written, written))
+
+
+def add_document(sha, written=OLD):
+    path = render.document_path(sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"%PDF-1.4")
+    os.utime(path, (written, written))
+
+
+def add_chat(chat_id, user_id, file_name, doc_sha256=None, days_old=0):
+    session = logic.get_db_session()
+    try:
+        session.add(
+            logic.Chat(
+                id=chat_id,
+                user_id=user_id,
+                file_name=file_name,
+                doc_sha256=doc_sha256,
+                timestamp=datetime.datetime.utcnow() - datetime.timedelta(days=days_old),
+            )
+        )
+        session.add(logic.TableData(id=f"table-{chat_id}", user_id=user_id, file_name=file_name))
+        session.commit()
+    finally:
+        session.close()
+
+
+def collections(root):
+    return set(vectorstores.list_collections(root))
+
+
+def count(model):
+    session = logic.get_db_session()
+    try:
+        return session.query(model).count()
+    finally:
+        session.close()
+
+
+def test_shared_collection_and_document_outlive_the_first_delete(root):
+    add_collection(root, "report.pdf")
+    add_document("a" * 64)
+    add_chat("one", 1, "report.pdf", "a" * 64)
+    add_chat("two", 2, "report.pdf", "a" * 64)
+
+    report = maintenance.delete_chat_cascade("one", root)
+    assert report == {"tables": 1, "collections": 0, "documents": 0}
+    assert collections(root) == {"report.pdf"}
+    assert render.document_path("a" * 64).exists()
+
+    report = maintenance.delete_chat_cascade("two", root)
+    assert report == {"tables": 1, "collections": 1, "documents": 1}
+    assert collections(root) == set()
+    assert not render.document_path("a" * 64).exists()
+    assert maintenance.delete_chat_cascade("two", root) is None
+
+
+def test_cascade_leaves_young_or_locked_collections_to_the_sweep(root):
+    add_collection(root, "fresh.pdf", written=time.time())
+    add_chat("fresh", 1, "fresh.pdf")
+    assert maintenance.delete_chat_cascade("fresh", root)["collections"] == 0
+    assert "fresh.pdf" in collections(root)
+
+    add_collection(root, "busy.pdf")
+    add_chat("busy", 1, "busy.pdf")
+    with coordination.collection_lock("busy.pdf", timeout=0):
+        assert maintenance.delete_chat_cascade("busy", root)["collections"] == 0
+    assert "busy.pdf" in collections(root)
+
+
+def test_sweep_keeps_orphans_inside_the_grace_period(root):
+    add_collection(root, "young.pdf", written=time.time())
+    add_collection(root, "stale.pdf")
+    add_document("b" * 64, written=time.time())
+    add_document("c" * 64)
+
+    session = logic.get_db_session()
+    try:
+        assert maintenance.sweep_orphans(session, root)["collections"] == 1
+        assert maintenance.sweep_documents(session) == 1
+    finally:
+        session.close()
+    assert collections(root) == {"young.pdf"}
+    assert render.document_path("b" * 64).exists()
+    assert not render.document_path("c" * 64).exists()
+
+
+def test_zero_retention_deletes_nothing(root):
+    add_chat("ancient", 1, "old.pdf", "d" * 64, days_old=3650)
+    session = logic.get_db_session()
+    try:
+        report = maintenance.apply_retention(session, datetime.datetime.utcnow(), 0, 0)
+        assert report == {"chats_expired": 0, "pdfs_compacted": 0, "pdf_bytes": 0}
+        assert count(logic.Chat) == 1
+        assert logic.load_chat("ancient", include=())["doc_sha256"] == "d" * 64
+
+        report = maintenance.apply_retention(session, datetime.datetime.utcnow(), 30, 0)
+        assert report["chats_expired"] == 1 and count(logic.Chat) == 0
+    finally:
+        session.close()
@@ -0,0 +1,73 @@
+from app import codec, logic
+
+
+def add_legacy_chat(chat_id, history, processed_data):
+    session = logic.get_db_session()
+    try:
+        session.add(
+            logic.Chat(
+                id=chat_id,
+                user_id=1,
+                title="Legacy",
+                file_name="doc.pdf",
+                history_legacy=history,
+                processed_data_legacy=processed_data,
+            )
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def columns(chat_id):
+    session = logic.get_db_session()
+    try:
+        chat = session.query(logic.Chat).filter_by(id=chat_id).one()
+        return {
+            "history": chat.history,
+            "processed_data": chat.processed_data,
+            "history_legacy": chat.history_legacy,
+            "processed_data_legacy": chat.processed_data_legacy,
+        }
+    finally:
+        session.close()
+
+
+def test_migrates_legacy_rows(db):
+    history = [{"role": "user", "content": "hi"}]
+    add_legacy_chat("a", history, {"sections": []})
+    add_legacy_chat("b", None, {"tables": []})
+
+    assert logic.migrate_payloads(batch_size=1) == 2
+    assert columns("a") == {
+        "history": history,
+        "processed_data": {"sections": []},
+        "history_legacy": None,
+        "processed_data_legacy": None,
+    }
+    assert columns("b")["processed_data"] == {"tables": []}
+    assert logic.migrate_payloads() == 0
+
+
+def test_save_between_select_and_update_wins(db, monkeypatch):
+    stale = [{"role": "user", "content": "old"}]
+    fresh = stale + [{"role": "assistant", "content": "new"}]
+    add_legacy_chat("a", stale, {"sections": []})
+
+    encode = codec.encode
+    saved = []
+
+    def save_then_encode(value, *args, **kwargs):
+        # The migration encodes after its SELECT and before its UPDATE.
+        if not saved:
+            saved.append(True)
+            logic.save_chat(fresh, "doc.pdf", 1, chat_id="a")
+        return encode(value, *args, **kwargs)
+
+    monkeypatch.setattr(codec, "encode", save_then_encode)
+    logic.migrate_payloads()
+
+    chat = columns("a")
+    assert chat["history"] == fresh
+    assert chat["processed_data"] == {"sections": []}
+    assert chat["history_legacy"] is None and chat["processed_data_legacy"] is None
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from app.pipeline import Pipeline
+
+
+def threads(pipeline):
+    return [t for stage in pipeline.stages.values() for t in stage.threads]
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_full_queue_blocks_the_producer():
+    release, done = threading.Event(), []
+
+    def slow(item):
+        release.wait(5)
+        done.append(item)
+
+    with Pipeline("test") as pipeline:
+        pipeline.add_stage("slow", slow, maxsize=2)
+        producer = threading.Thread(target=lambda: [pipeline.put("slow", i) for i in range(10)])
+        producer.start()
+        # One item in the worker, two queued: the producer is stuck on the fourth.
+        wait_until(lambda: pipeline.stages["slow"].queue.full())
+        time.sleep(0.05)
+        assert producer.is_alive() and done == []
+        release.set()
+        producer.join(5)
+
+    assert done == list(range(10))
+    assert pipeline.timings()["slow"]["blocked_s"] > 0
+
+
+def test_stage_error_propagates_and_stops_the_other_stages():
+    processed = []
+
+    def explode(item):
+        raise ValueError(f"bad item {item}")
+
+    with pytest.raises(ValueError, match="bad item 0"):
+        with Pipeline("test") as pipeline:
+            pipeline.add_stage("explode", explode)
+            pipeline.add_stage("other", processed.append)
+            pipeline.put("explode", 0)
+            wait_until(lambda: pipeline.error is not None)
+            for i in range(5):
+                pipeline.put("other", i)
+
+    assert processed == []
+    assert not any(t.is_alive() for t in threads(pipeline))
+
+
+def test_producer_error_shuts_the_stages_down():
+    processed = []
+
+    def items():
+        yield from range(3)
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError, match="source failed"):
+        with Pipeline("test") as pipeline:
+            pipeline.add_stage("collect", processed.append, batch_size=2)
+            for item in items():
+                pipeline.put("collect", item)
+
+    assert not any(t.is_alive() for t in threads(pipeline))
+
+
+def test_producer_stopping_early_flushes_what_was_queued():
+    totals = []
+
+    with Pipeline("test") as pipeline:
+        # Upstream first: stages close in the order they were added.
+        pipeline.add_stage(
+            "square", lambda batch: [x * x for x in batch], batch_size=4, downstream="sum"
+        )
+        pipeline.add_stage("sum", totals.append)
+        for i in range(100):
+            if i == 7:
+                break
+            pipeline.put("square", i)
+
+    assert sorted(totals) == [i * i for i in range(7)]
+    assert pipeline.timings()["square"]["items"] == 7
+    assert not any(t.is_alive() for t in threads(pipeline))
@@ -0,0 +1,71 @@
+import pytest
+from langchain_core.documents import Document
+
+from app import logic, rerank
+from app.rerank import LexicalReranker
+
+# Vector order puts the off-topic chunks first.
+CANDIDATES = [
+    (Document(page_content="Office relocation and parking arrangements for staff."), 0.92),
+    (Document(page_content="Holiday calendar and canteen opening hours."), 0.90),
+    (Document(page_content="Revenue rose and revenue guidance for next year was raised."), 0.70),
+    (Document(page_content="Quarterly results.", metadata={"title": "Revenue guidance"}), 0.60),
+]
+QUERY = "What is the revenue guidance?"
+
+
+def texts(scored_docs):
+    return [doc.page_content for doc, _ in scored_docs]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    """Resets the process-wide reranker so each test picks its own."""
+    monkeypatch.setattr(rerank, "_reranker", None)
+    monkeypatch.setattr(rerank, "RERANK_ONNX_MODEL", None)
+
+
+def test_lexical_blend_reorders_candidates(reranker):
+    ranked, stats = rerank.rerank(QUERY, CANDIDATES, 3)
+    assert texts(ranked)[0] == texts(CANDIDATES)[2]
+    assert texts(ranked) != texts(CANDIDATES[:3])
+    assert stats == {**stats, "reranker": "lexical", "candidates": 4, "kept": 3}
+
+
+def test_lexical_weight_zero_keeps_vector_order():
+    scores = LexicalReranker(weight=0).score(QUERY, CANDIDATES)
+    assert scores == sorted(scores, reverse=True)
+    lexical_only = LexicalReranker(weight=1).score(QUERY, CANDIDATES)
+    assert lexical_only.index(max(lexical_only)) in (2, 3)
+
+
+def test_missing_onnx_model_falls_back_to_lexical(reranker, monkeypatch, tmp_path):
+    monkeypatch.setattr(rerank, "RERANK_ONNX_MODEL", str(tmp_path / "missing"))
+    assert isinstance(rerank.get_reranker(), LexicalReranker)
+    ranked, stats = rerank.rerank(QUERY, CANDIDATES, 4)
+    assert stats["reranker"] == "lexical" and len(ranked) == 4
+
+
+class FakeStore:
+    def __init__(self, scored_docs):
+        self.scored_docs = scored_docs
+        self.fetched = []
+
+    def similarity_search_with_relevance_scores(self, query, k, filter=None):
+        self.fetched.append(k)
+        return self.scored_docs[:k]
+
+
+def test_disabled_rerank_keeps_vector_order(reranker, monkeypatch):
+    monkeypatch.setattr(logic, "RERANK_ENABLED", False)
+    monkeypatch.setattr(logic, "QUERY_TOP_K", 3)
+    store, usage = FakeStore(CANDIDATES), {}
+
+    assert texts(logic._retrieve(store, QUERY, usage)) == texts(CANDIDATES[:3])
+    assert store.fetched == [3] and "rerank" not in usage
+
+    # Enabled: more candidates are fetched and reordered.
+    reranked = logic._retrieve(store, QUERY, usage, use_rerank=True)
+    assert store.fetched[-1] >= len(CANDIDATES)
+    assert texts(reranked)[0] in texts(CANDIDATES[2:4])
+    assert usage["rerank"]["reranker"] == "lexical"
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from app.scheduler import BACKGROUND, INTERACTIVE, LLMQueueTimeout, LLMScheduler
+
+
+def make_scheduler(**kwargs):
+    return LLMScheduler(rate_per_minute=60000, burst=100, **kwargs)
+
+
+def test_background_calls_leave_interactive_headroom():
+    scheduler = make_scheduler(max_concurrency=4, background_max_concurrency=2)
+    held = [scheduler.acquire("key", user=u, priority=BACKGROUND) for u in ("a", "b")]
+    with pytest.raises(LLMQueueTimeout):
+        scheduler.acquire("key", user="c", priority=BACKGROUND, timeout=0.05)
+
+    interactive = [scheduler.acquire("key", user=u, priority=INTERACTIVE, timeout=0.05) for u in ("d", "e")]
+    with pytest.raises(LLMQueueTimeout):
+        scheduler.acquire("key", user="f", priority=INTERACTIVE, timeout=0.05)
+
+    scheduler.release(held.pop())
+    held.append(scheduler.acquire("key", user="c", priority=BACKGROUND, timeout=0.05))
+    for ticket in held + interactive:
+        scheduler.release(ticket)
+
+
+def test_background_limit_keeps_one_interactive_slot():
+    scheduler = make_scheduler(max_concurrency=2, background_max_concurrency=8)
+    assert scheduler.limits[BACKGROUND] == 1
+
+
+def test_background_waits_use_their_own_timeout():
+    scheduler = LLMScheduler(
+        rate_per_minute=60, burst=1, queue_timeout=0.05, background_queue_timeout=0.3
+    )
+    scheduler.release(scheduler.acquire("key", user="a"))
+    # The bucket is empty and refills in one second, longer than either timeout.
+    for priority, timeout in ((INTERACTIVE, 0.05), (BACKGROUND, 0.3)):
+        started = time.monotonic()
+        with pytest.raises(LLMQueueTimeout):
+            scheduler.acquire("key", user="a", priority=priority)
+        assert timeout <= time.monotonic() - started < timeout + 0.2
+    assert scheduler.admissible(INTERACTIVE) == 1
+    assert scheduler.admissible(BACKGROUND) == 1
+
+
+def test_batch_limit_follows_what_the_bucket_can_admit(monkeypatch):
+    from app import logic
+
+    slow = LLMScheduler(rate_per_minute=6, burst=10, background_queue_timeout=600)
+    monkeypatch.setattr(logic, "get_scheduler", lambda: slow)
+    assert slow.admissible(BACKGROUND) == 70
+    assert logic.batch_question_limit() == 69
+
+    fast = make_scheduler(background_queue_timeout=600)
+    monkeypatch.setattr(logic, "get_scheduler", lambda: fast)
+    assert logic.batch_question_limit() == logic.BATCH_MAX_QUESTIONS
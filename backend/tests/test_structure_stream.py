@@ -0,0 +1,71 @@
+import queue
+
+import pytest
+
+from app import logic, scheduler
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Streams `texts` as chunks, then raises `error` if given."""
+
+    def __init__(self, texts, error=None, on_chunk=None):
+        self.texts = texts
+        self.error = error
+        self.on_chunk = on_chunk
+
+    def generate_content(self, contents, stream=False):
+        def chunks():
+            for i, text in enumerate(self.texts):
+                if self.on_chunk:
+                    self.on_chunk(i)
+                yield Chunk(text)
+            if self.error:
+                raise self.error
+
+        return chunks()
+
+
+@pytest.fixture
+def llm_scheduler(monkeypatch):
+    fresh = scheduler.LLMScheduler(rate_per_minute=60000, burst=100, max_concurrency=2)
+    monkeypatch.setattr(scheduler, "_scheduler", fresh)
+    return fresh
+
+
+def run(model):
+    out, report = queue.Queue(), {"items": 0, "truncated": False}
+    logic._stream_structure(model, [], "test-model", "key", "user", out, report)
+    events = []
+    while True:
+        kind, item = out.get_nowait()
+        if kind is logic._STREAM_DONE:
+            return events, item, report
+        events.append((kind, item))
+
+
+TEXTS = ['{"toc": [{"title": "Intro", "page_number": 1}', ', {"title": "Risks", "page_', "number"]
+
+
+@pytest.mark.parametrize("error", [None, ConnectionError("stream reset")])
+def test_slot_is_released_after_the_first_chunk_of_a_truncated_stream(llm_scheduler, error):
+    in_flight = []
+    model = FakeModel(TEXTS, error, on_chunk=lambda i: in_flight.append(llm_scheduler._in_flight))
+
+    events, failure, report = run(model)
+
+    assert in_flight == [1, 0, 0]
+    assert llm_scheduler._in_flight == 0
+    assert failure is None and report["truncated"]
+    assert events == [("toc", {"title": "Intro", "page_number": 1})]
+
+
+def test_slot_is_released_when_the_first_chunk_fails(llm_scheduler):
+    events, failure, _ = run(FakeModel([], ConnectionError("refused")))
+
+    assert isinstance(failure, ConnectionError) and events == []
+    assert llm_scheduler._in_flight == 0
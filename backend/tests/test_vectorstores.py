@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from app import vectorstores
+from app.numpystore import NumpyVectorStore
+from app.vectorstores import NumpyIndex, append_index, load_index, write_index
+
+
+class FakeEmbeddings:
+    """Deterministic random vectors per text."""
+
+    dim = 32
+
+    def _vector(self, text):
+        seed = int.from_bytes(text.encode("utf-8")[:8].ljust(8, b"\0"), "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def records(n, **metadata):
+    return [
+        {"id": str(i), "page_content": f"chunk {i}", "metadata": {"i": i, **metadata}}
+        for i in range(n)
+    ]
+
+
+def test_top_k_is_ordered_by_cosine_similarity(tmp_path):
+    query = unit([1.0, 0.0, 0.0])
+    vectors = [[0.0, 1.0, 0.0], [1.0, 0.1, 0.0], [-1.0, 0.0, 0.0], [2.0, 2.0, 0.0], [5.0, 0.0, 0.0]]
+    write_index(tmp_path, vectors, records(5), "none")
+
+    hits = NumpyIndex(tmp_path).top_k(query, 3)
+    assert [i for i, _ in hits] == [4, 1, 3]
+    expected = [1.0, 1 / np.sqrt(1.01), 1 / np.sqrt(2)]
+    assert [s for _, s in hits] == pytest.approx(expected, abs=1e-5)
+    assert len(NumpyIndex(tmp_path).top_k(query, 10)) == 5
+
+
+def test_filter_is_applied_before_top_k(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 16))
+    metas = [
+        {"page_start": i, "page_end": i, "type": "table" if i % 10 == 0 else "section"}
+        for i in range(50)
+    ]
+    write_index(tmp_path, vectors, [{"id": str(i), "metadata": m} for i, m in enumerate(metas)], "none")
+    index = NumpyIndex(tmp_path)
+    query = unit(vectors[7])
+
+    tables = index.top_k(query, 10, {"type": "table"})
+    assert sorted(i for i, _ in tables) == [0, 10, 20, 30, 40]
+    pages_5_to_9 = {"$and": [{"page_start": {"$lte": 9}}, {"page_end": {"$gte": 5}}]}
+    pages = index.top_k(query, 3, pages_5_to_9)
+    assert pages[0][0] == 7 and all(5 <= i <= 9 for i, _ in pages)
+    assert index.top_k(query, 3, {"type": "media"}) == []
+
+
+def test_int8_recall(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+    write_index(tmp_path / "f32", vectors, records(2000), "none")
+    write_index(tmp_path / "i8", vectors, records(2000), "int8")
+    exact, quantized = NumpyIndex(tmp_path / "f32"), NumpyIndex(tmp_path / "i8")
+
+    found = 0
+    for query in rng.standard_normal((50, 64)):
+        query = unit(query)
+        truth = {i for i, _ in exact.top_k(query, 10)}
+        found += len(truth & {i for i, _ in quantized.top_k(query, 10)})
+    assert found / 500 >= 0.9
+
+
+def test_append_keeps_existing_int8_rows(tmp_path):
+    rng = np.random.default_rng(2)
+    write_index(tmp_path, rng.standard_normal((10, 8)), records(10), "int8")
+    before = load_index(tmp_path)
+    stored, scales = np.array(before.vectors), before.scales.copy()
+
+    append_index(tmp_path, rng.standard_normal((5, 8)), records(5, batch=2), "int8")
+    after = NumpyIndex(tmp_path)
+    assert after.count == 15
+    assert np.array_equal(np.asarray(after.vectors[:10]), stored)
+    assert np.array_equal(after.scales[:10], scales)
+    assert after.records[10]["metadata"]["batch"] == 2
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_buffered_store_writes_once_on_flush(tmp_path, monkeypatch, quantization):
+    writes = []
+    real_write = vectorstores._write_files
+    monkeypatch.setattr(vectorstores, "_write_files", lambda *a: writes.append(1) or real_write(*a))
+
+    store = NumpyVectorStore(tmp_path, FakeEmbeddings(), quantization=quantization, buffered=True)
+    for batch in range(3):
+        store.add_texts([f"text {batch}-{i}" for i in range(4)], [{"batch": batch}] * 4)
+    assert writes == [] and not NumpyIndex.exists(tmp_path)
+
+    store.flush()
+    assert writes == [1]
+    docs = store.similarity_search("text 1-2", k=1)
+    assert docs[0].page_content == "text 1-2"
+    assert NumpyIndex(tmp_path).count == 12
@@ -1,15 +1,20 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import AuthPortal from './components/AuthPortal';
 import Sidebar from './components/Sidebar';
 import MainArea from './components/MainArea';
 import { ToastProvider } from './components/Toast';
 
+const CHATS_PAGE_SIZE = 50;
+
 const AppContent = () => {
   const [token, setToken] = useState(localStorage.getItem('token'));
   const [user, setUser] = useState(null);
   const [apiKey, setApiKey] = useState(localStorage.getItem('apiKey') || '');
   const [selectedModel, setSelectedModel] = useState('gemini-2.0-flash');
   const [chats, setChats] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingChats, setLoadingChats] = useState(false);
+  const chatsRequest = useRef(null);
   const [currentChatId, setCurrentChatId] = useState(null);
   const [processedData, setProcessedData] = useState(null);
   const [sidebarCollapsed, setSidebarCollapsed] = useState(false);
@@ -19,10 +24,45 @@ const AppContent = () => {
     setToken(null);
     setUser(null);
     setChats([]);
+    setNextCursor(null);
     setCurrentChatId(null);
     setProcessedData(null);
   };
 
+  // Loads one page of chats: the first page (replacing the list) or the
+  // page after `cursor` (appended). A new fetch aborts the one in flight so
+  // a stale response never overwrites a newer list.
+  const fetchChats = useCallback(async (cursor = null) => {
+    if (!token) return;
+    chatsRequest.current?.abort();
+    const controller = new AbortController();
+    chatsRequest.current = controller;
+    setLoadingChats(true);
+    try {
+      const params = new URLSearchParams({ limit: String(CHATS_PAGE_SIZE) });
+      if (cursor) params.set('cursor', cursor);
+      const res = await fetch(`/api/chats?${params}`, {
+        headers: { 'Authorization': `Bearer ${token}` },
+        signal: controller.signal
+      });
+      if (!res.ok) return;
+      const page = await res.json();
+      setChats(prev => (cursor ? prev.concat(page) : page));
+      setNextCursor(res.headers.get('X-Next-Cursor'));
+    } catch (err) {
+      if (err.name !== 'AbortError') console.error(err);
+    } finally {
+      if (chatsRequest.current === controller) {
+        chatsRequest.current = null;
+        setLoadingChats(false);
+      }
+    }
+  }, [token]);
+
+  const loadMoreChats = useCallback(() => {
+    if (nextCursor && !loadingChats) fetchChats(nextCursor);
+  }, [nextCursor, loadingChats, fetchChats]);
+
   useEffect(() => {
     if (!token) return;
 
@@ -42,23 +82,10 @@ const AppContent = () => {
       }
     };
 
-    const fetchChats = async () => {
-      try {
-        const res = await fetch('/api/chats', {
-          headers: { 'Authorization': `Bearer ${token}` }
-        });
-        if (res.ok) {
-          const data = await res.json();
-          setChats(data);
-        }
-      } catch (err) {
-        console.error(err);
-      }
-    };
-
     fetchUser();
     fetchChats();
-  }, [token]);
+    return () => chatsRequest.current?.abort();
+  }, [token, fetchChats]);
 
   const handleLogin = (newToken) => {
     localStorage.setItem('token', newToken);
@@ -74,6 +101,16 @@ const AppContent = () => {
       <Sidebar
         user={user}
         chats={chats}
+        hasMoreChats={Boolean(nextCursor)}
+        loadingChats={loadingChats}
+        onLoadMoreChats={loadMoreChats}
+        onChatDeleted={(id) => {
+          setChats(prev => prev.filter(chat => chat.chat_id !== id));
+          if (id === currentChatId) {
+            setCurrentChatId(null);
+            setProcessedData(null);
+          }
+        }}
         currentChatId={currentChatId}
         setCurrentChatId={setCurrentChatId}
         apiKey={apiKey}
@@ -96,9 +133,7 @@ const AppContent = () => {
         setCurrentChatId={setCurrentChatId}
         processedData={processedData}
         setProcessedData={setProcessedData}
-        onChatCreated={() => {
-          setToken(localStorage.getItem('token'));
-        }}
+        onChatCreated={() => fetchChats()}
       />
     </div>
   );
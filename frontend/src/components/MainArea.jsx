@@ -28,14 +28,18 @@ const MainArea = ({
 
     const loadChatSession = async () => {
         try {
-            const res = await fetch(`/api/chats/${currentChatId}`, {
+            // Pages of stored documents are rendered by the server on demand;
+            // pdf_b64 is only returned for chats saved before that.
+            const res = await fetch(`/api/chats/${currentChatId}?include_pdf=true`, {
                 headers: { 'Authorization': `Bearer ${token}` }
             });
             if (res.ok) {
                 const data = await res.json();
                 setProcessedData(data.processed_data);
-                if (data.pdf_b64) {
+                if (!data.doc_sha256 && data.pdf_b64) {
                     setPdfUrl(`data:application/pdf;base64,${data.pdf_b64}`);
+                } else {
+                    setPdfUrl(null);
                 }
             }
         } catch (err) {
@@ -220,7 +224,7 @@ const MainArea = ({
                         </div>
                         <div style={{ flex: 1, overflow: 'auto', padding: '1rem' }}>
                             <div className="pdf-container" style={{ height: '100%', position: 'relative' }}>
-                                <PDFViewer url={pdfUrl} toc={processedData.toc} />
+                                <PDFViewer url={pdfUrl} toc={processedData.toc} chatId={currentChatId} token={token} />
                             </div>
                         </div>
                     </div>
@@ -1,16 +1,118 @@
-import React from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { List } from 'lucide-react';
 
-const PDFViewer = ({ url, toc }) => {
+// Fetches a server-rendered page image once it scrolls into view, so page 300
+// can be shown without downloading pages 1-299.
+const PageImage = ({ chatId, token, page, dpi, registerRef }) => {
+    const [src, setSrc] = useState(null);
+    const [visible, setVisible] = useState(false);
+    const ref = useRef(null);
+
+    useEffect(() => {
+        registerRef(page, ref.current);
+        const observer = new IntersectionObserver(
+            ([entry]) => entry.isIntersecting && setVisible(true),
+            { rootMargin: '600px 0px' }
+        );
+        observer.observe(ref.current);
+        return () => observer.disconnect();
+    }, [page]);
+
+    useEffect(() => {
+        if (!visible) return;
+        let objectUrl = null;
+        const controller = new AbortController();
+        fetch(`/api/chats/${chatId}/pages/${page}?dpi=${dpi}`, {
+            headers: { 'Authorization': `Bearer ${token}` },
+            signal: controller.signal
+        })
+            .then(res => (res.ok ? res.blob() : null))
+            .then(blob => {
+                if (blob) {
+                    objectUrl = URL.createObjectURL(blob);
+                    setSrc(objectUrl);
+                }
+            })
+            .catch(err => err.name !== 'AbortError' && console.error(err));
+        return () => {
+            controller.abort();
+            if (objectUrl) URL.revokeObjectURL(objectUrl);
+        };
+    }, [visible, chatId, page, dpi]);
+
+    return (
+        <div
+            ref={ref}
+            style={{
+                width: '100%',
+                aspectRatio: src ? 'auto' : '8.5 / 11',
+                background: 'rgba(255,255,255,0.03)',
+                borderRadius: '8px',
+                overflow: 'hidden',
+                display: 'flex',
+                alignItems: 'center',
+                justifyContent: 'center'
+            }}
+        >
+            {src ? (
+                <img src={src} alt={`Page ${page}`} style={{ width: '100%', display: 'block' }} />
+            ) : (
+                <span style={{ fontSize: '0.75rem', opacity: 0.4 }}>Page {page}</span>
+            )}
+        </div>
+    );
+};
+
+const PDFViewer = ({ url, toc, chatId, token }) => {
+    const [pages, setPages] = useState(null);
+    const pageRefs = useRef({});
+
+    useEffect(() => {
+        setPages(null);
+        if (url || !chatId) return;
+        fetch(`/api/chats/${chatId}/pages`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        })
+            .then(res => (res.ok ? res.json() : null))
+            .then(data => data && setPages(data))
+            .catch(err => console.error(err));
+    }, [url, chatId]);
+
+    const registerRef = (page, el) => {
+        pageRefs.current[page] = el;
+    };
+
+    const goToPage = (page) => {
+        pageRefs.current[page]?.scrollIntoView({ behavior: 'smooth', block: 'start' });
+    };
+
+    // Render at the screen's pixel density, within what the server allows.
+    const dpi = pages
+        ? Math.min(Math.round(pages.default_dpi * (window.devicePixelRatio || 1)), pages.max_dpi)
+        : null;
+
     return (
         <div style={{ display: 'flex', flexDirection: 'column', height: '100%', gap: '1rem' }}>
-            <div style={{ flex: 1, position: 'relative' }}>
+            <div style={{ flex: 1, position: 'relative', overflowY: pages ? 'auto' : 'visible' }}>
                 {url ? (
                     <iframe
                         src={url}
                         style={{ width: '100%', height: '100%', border: 'none', borderRadius: '12px' }}
                         title="PDF Viewer"
                     />
+                ) : pages ? (
+                    <div style={{ display: 'flex', flexDirection: 'column', gap: '12px' }}>
+                        {Array.from({ length: pages.pages }, (_, i) => (
+                            <PageImage
+                                key={i + 1}
+                                chatId={chatId}
+                                token={token}
+                                page={i + 1}
+                                dpi={dpi}
+                                registerRef={registerRef}
+                            />
+                        ))}
+                    </div>
                 ) : (
                     <div style={{
                         width: '100%',
@@ -36,13 +138,14 @@ const PDFViewer = ({ url, toc }) => {
                         {toc.map((item, i) => (
                             <div
                                 key={i}
+                                onClick={() => pages && goToPage(item.page_number)}
                                 style={{
                                     padding: '4px 10px',
                                     background: 'rgba(255,255,255,0.05)',
                                     borderRadius: '4px',
                                     fontSize: '0.75rem',
                                     border: '1px solid var(--border-color)',
-                                    cursor: 'default'
+                                    cursor: pages ? 'pointer' : 'default'
                                 }}
                             >
                                 <span style={{ fontWeight: 600 }}>{item.page_number}</span> {item.title}
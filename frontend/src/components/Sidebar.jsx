@@ -1,9 +1,13 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Plus, MessageSquare, LogOut, Cpu, Settings, Trash2, Calendar, Menu, X, ChevronLeft, ChevronRight } from 'lucide-react';
 
 const Sidebar = ({
     user,
     chats,
+    hasMoreChats,
+    loadingChats,
+    onLoadMoreChats,
+    onChatDeleted,
     currentChatId,
     setCurrentChatId,
     apiKey,
@@ -16,6 +20,18 @@ const Sidebar = ({
     setCollapsed
 }) => {
     const [showUserMenu, setShowUserMenu] = useState(false);
+    const moreRef = useRef(null);
+
+    // Infinite scroll: fetch the next page once the end of the list is visible.
+    useEffect(() => {
+        if (!hasMoreChats || !moreRef.current) return;
+        const observer = new IntersectionObserver(
+            ([entry]) => entry.isIntersecting && onLoadMoreChats(),
+            { rootMargin: '200px 0px' }
+        );
+        observer.observe(moreRef.current);
+        return () => observer.disconnect();
+    }, [hasMoreChats, onLoadMoreChats]);
 
     const handleDeleteChat = async (e, id) => {
         e.stopPropagation();
@@ -27,7 +43,7 @@ const Sidebar = ({
                 headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
             });
             if (res.ok) {
-                // The parent usually refreshes on its own
+                onChatDeleted(id);
             }
         } catch (err) {
             console.error(err);
@@ -171,6 +187,18 @@ const Sidebar = ({
                                 ))}
                             </>
                         )}
+
+                        {hasMoreChats && (
+                            <button
+                                ref={moreRef}
+                                className="btn-secondary"
+                                onClick={onLoadMoreChats}
+                                disabled={loadingChats}
+                                style={{ margin: '0.5rem 0.75rem', padding: '0.4rem', fontSize: '0.75rem', justifyContent: 'center' }}
+                            >
+                                {collapsed ? '…' : loadingChats ? 'Loading…' : 'Load more'}
+                            </button>
+                        )}
                     </div>
                 </div>
             </div>